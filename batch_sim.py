@@ -0,0 +1,243 @@
+import numpy as np
+
+from board_topology import STANDARD_TOPOLOGY
+from dice_stream import DiceStream
+from hex_board import DEFAULT_CATAN_FREQUENCIES, DEFAULT_CATAN_LAYOUT
+from resources import BUILD_COSTS, HEX_RESOURCE, NUM_RESOURCES, Build
+
+# Plays many games at once, each one a row of NumPy arrays, for statistics
+# over a lot of games (seat advantage, layout balance) where playing them one
+# at a time through rules.Rules would take far too long.
+#
+# Every game runs the same scripted policy in lockstep: the same seat is on
+# turn in every game, dice for all turns are drawn up front, a roll pays out
+# in every game with one lookup, and legal moves come from matrix products
+# against the board's incidence matrices. The rules are those of rules.Rules
+# (settlements, roads and cities; the robber stays on the cactus), with the
+# usual piece limits on what the policy builds.
+#
+# The policy, per seat:
+#   setup: settle the open node with the most pips, then a random legal road
+#   turn:  build one thing, the first that is affordable and legal of: a city
+#          on the settlement with the most pips, a settlement on the reachable
+#          node with the most pips, a random road. then end the turn
+# bench_batch_sim.py plays the same policy through Rules to compare.
+
+WINNING_POINTS = 10
+MAX_SETTLEMENTS = 5
+MAX_CITIES = 4
+MAX_ROADS = 15
+
+# pips: how many of the 36 rolls of two dice make each roll number
+ROLL_PIPS = [0, 0, 0, 1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1]
+ROLL_PIPS_ARRAY = np.array(ROLL_PIPS, np.float32)
+
+# index 0 is the CACTUS tile's resource, so hexes are numbered resource + 1
+HEX_CODES = [0 if HEX_RESOURCE[hex_type] is None else int(HEX_RESOURCE[hex_type]) + 1
+             for hex_type in DEFAULT_CATAN_LAYOUT]
+
+
+# 0 / 1 incidence matrices for the board's nodes, roads and hexes
+def incidence(topology):
+    node_hexes = np.zeros((topology.num_nodes, topology.num_hexes), np.float32)
+    for hex_index, nodes in enumerate(topology.hex_nodes):
+        node_hexes[list(nodes), hex_index] = 1
+    road_nodes = np.zeros((topology.num_roads, topology.num_nodes), np.float32)
+    for road_index, nodes in enumerate(topology.road_nodes):
+        road_nodes[road_index, list(nodes)] = 1
+    # a node and its neighbors, where a settlement rules out another
+    settle_nodes = np.eye(topology.num_nodes, dtype=np.float32)
+    for node, neighbors in enumerate(topology.node_neighbors):
+        settle_nodes[node, list(neighbors)] = 1
+    return node_hexes, road_nodes, settle_nodes
+
+
+class BatchResults:
+    """Who won each game (-1 if nobody reached WINNING_POINTS) and on which turn"""
+    def __init__(self, num_players, winners, turns, points):
+        self.num_players = num_players
+        self.winners = winners
+        self.turns = turns
+        self.points = points  # (games, seats) victory points at the end
+
+    # several batches' results as one
+    @classmethod
+    def combine(cls, results):
+        return cls(results[0].num_players, np.concatenate([result.winners for result in results]),
+                   np.concatenate([result.turns for result in results]),
+                   np.concatenate([result.points for result in results]))
+
+    # the fraction of games each seat won
+    def seat_win_rates(self):
+        return np.bincount(self.winners[self.winners >= 0], minlength=self.num_players) / len(self.winners)
+
+
+class BatchSimulator:
+    """num_games random boards, all played with the scripted policy at once"""
+    def __init__(self, num_games, num_players, seed=0, max_turns=400, topology=STANDARD_TOPOLOGY):
+        self.num_games = num_games
+        self.num_players = num_players
+        self.max_turns = max_turns
+        self.topology = topology
+        self.rng = np.random.default_rng(seed)
+        self.node_hexes, self.road_nodes, self.settle_nodes = incidence(topology)
+        self.games = np.arange(num_games)
+
+        self.deal_layouts()
+        # a node's pips: how likely a roll is to pay out there, what the policy ranks nodes by
+        self.node_pips = (ROLL_PIPS_ARRAY[self.roll_nums] @ self.node_hexes.T).astype(np.float32)
+        # tiny per game noise so ties between equally good nodes are broken at random
+        self.node_pips += self.rng.random(self.node_pips.shape, np.float32) * 0.01
+
+        self.node_owner = np.full((num_games, topology.num_nodes), -1, np.int8)
+        self.node_city = np.zeros((num_games, topology.num_nodes), bool)
+        self.road_owner = np.full((num_games, topology.num_roads), -1, np.int8)
+        # player_yields[game, roll, seat, resource]: what the seat gets on that roll, kept up
+        # to date as settlements and cities are built so a roll is a single lookup
+        self.player_yields = np.zeros((num_games, len(ROLL_PIPS), num_players, NUM_RESOURCES), np.int16)
+        self.resources = np.zeros((num_games, num_players, NUM_RESOURCES), np.int16)
+        self.settlements = np.zeros((num_games, num_players), np.int16)
+        self.cities = np.zeros((num_games, num_players), np.int16)
+        self.roads = np.zeros((num_games, num_players), np.int16)
+
+        # every die of every turn, drawn up front from a stream of the batch's own.
+        # faces are 0 - 5 like the game's
+        self.dice = DiceStream(int(self.rng.integers(1 << 63))).rolls(num_games * max_turns).astype(
+            np.int8).reshape(num_games, max_turns, 2)
+
+    # a shuffled DEFAULT_CATAN_LAYOUT per game, numbered like hex_board.layout_roll_nums does
+    def deal_layouts(self):
+        num_hexes = self.topology.num_hexes
+        order = self.rng.random((self.num_games, num_hexes)).argsort(axis=1)
+        self.hex_codes = np.array(HEX_CODES, np.int8)[order]
+        roll_nums = np.tile(np.array(DEFAULT_CATAN_FREQUENCIES, np.int8), (self.num_games, 1))
+        # the number under the cactus moves to the hex that has none
+        cactus = (self.hex_codes == 0).argmax(axis=1)
+        blank = DEFAULT_CATAN_FREQUENCIES.index(0)
+        roll_nums[:, blank] = roll_nums[self.games, cactus]
+        roll_nums[self.games, cactus] = 0
+        self.roll_nums = roll_nums
+
+        # yields[game, roll, node, resource]: what a settlement on node gets on that roll
+        hex_resources = np.zeros((self.num_games, num_hexes, NUM_RESOURCES + 1), np.float32)
+        hex_resources[self.games[:, None], np.arange(num_hexes), self.hex_codes] = 1
+        hex_rolls = np.zeros((self.num_games, num_hexes, len(ROLL_PIPS)), np.float32)
+        hex_rolls[self.games[:, None], np.arange(num_hexes), self.roll_nums] = 1
+        hex_rolls[:, :, 0] = 0
+        self.yields = np.einsum('ghr,ghk,nh->grnk', hex_rolls, hex_resources[:, :, 1:],
+                                self.node_hexes).astype(np.int8)
+
+    # open nodes: unsettled and not next to a settlement
+    def open_nodes(self):
+        return (self.node_owner >= 0).astype(np.float32) @ self.settle_nodes == 0
+
+    # nodes the seat's roads touch
+    def road_reach(self, seat):
+        return (self.road_owner == seat).astype(np.float32) @ self.road_nodes > 0
+
+    # free roads touching the seat's settlements, or its roads through nodes nobody has settled
+    def legal_roads(self, seat, reach):
+        through = (self.node_owner == seat) | (reach & (self.node_owner < 0))
+        return (self.road_owner < 0) & (through.astype(np.float32) @ self.road_nodes.T > 0)
+
+    # for each game in games, the index of the best scoring choice allowed by mask
+    def best(self, games, scores, mask):
+        return np.where(mask[games], scores[games], -np.inf).argmax(axis=1)
+
+    def random_choice(self, games, mask):
+        return self.best(games, self.rng.random(mask.shape, np.float32), mask)
+
+    def settle(self, games, nodes, seat):
+        self.node_owner[games, nodes] = seat
+        self.player_yields[games, :, seat] += self.yields[games, :, nodes]
+        self.settlements[games, seat] += 1
+
+    def build_road(self, games, roads, seat):
+        self.road_owner[games, roads] = seat
+        self.roads[games, seat] += 1
+
+    def upgrade_city(self, games, nodes, seat):
+        self.node_city[games, nodes] = True
+        # a city produces twice what the settlement did
+        self.player_yields[games, :, seat] += self.yields[games, :, nodes]
+        self.settlements[games, seat] -= 1
+        self.cities[games, seat] += 1
+
+    def pay(self, games, seat, build):
+        self.resources[games, seat] -= np.array(BUILD_COSTS[build], np.int16)
+
+    # two rounds of settlement + road, in seat order each time (as rules.Rules does)
+    def setup(self):
+        games = self.games
+        for setup_round in range(2):
+            for seat in range(self.num_players):
+                nodes = self.best(games, self.node_pips, self.open_nodes())
+                self.settle(games, nodes, seat)
+                # one of each resource the settlement borders
+                self.resources[games, seat] += self.yields[games, :, nodes].sum(axis=1)
+                roads = self.random_choice(games, self.legal_roads(seat, self.road_reach(seat)))
+                self.build_road(games, roads, seat)
+
+    # roll for every game still going and pay everyone out
+    def roll(self, turn, playing):
+        roll_nums = self.dice[:, turn].sum(axis=1, dtype=np.int64) + 2
+        self.resources += self.player_yields[self.games, roll_nums] * playing[:, None, None]
+
+    # the seat builds one thing in each game still going
+    def build(self, seat, playing):
+        resources = self.resources[:, seat]
+
+        def affords(build):
+            return playing & (resources >= np.array(BUILD_COSTS[build])).all(axis=1)
+
+        mine = self.node_owner == seat
+        city_spots = mine & ~self.node_city
+        cities = affords(Build.CITY) & (self.cities[:, seat] < MAX_CITIES) & city_spots.any(axis=1)
+
+        reach = self.road_reach(seat)
+        settlement_spots = self.open_nodes() & reach
+        settlements = (~cities & affords(Build.SETTLEMENT) & settlement_spots.any(axis=1) &
+                       (self.settlements[:, seat] < MAX_SETTLEMENTS))
+
+        road_spots = self.legal_roads(seat, reach)
+        roads = (~cities & ~settlements & affords(Build.ROAD) & road_spots.any(axis=1) &
+                 (self.roads[:, seat] < MAX_ROADS))
+
+        games = np.flatnonzero(cities)
+        self.upgrade_city(games, self.best(games, self.node_pips, city_spots), seat)
+        self.pay(games, seat, Build.CITY)
+        games = np.flatnonzero(settlements)
+        self.settle(games, self.best(games, self.node_pips, settlement_spots), seat)
+        self.pay(games, seat, Build.SETTLEMENT)
+        games = np.flatnonzero(roads)
+        self.build_road(games, self.random_choice(games, road_spots), seat)
+        self.pay(games, seat, Build.ROAD)
+
+    def points(self):
+        return self.settlements + 2 * self.cities
+
+    def run(self):
+        self.setup()
+        winners = np.full(self.num_games, -1, np.int8)
+        turns = np.full(self.num_games, self.max_turns, np.int32)
+        playing = np.ones(self.num_games, bool)
+        for turn in range(self.max_turns):
+            seat = turn % self.num_players
+            self.roll(turn, playing)
+            self.build(seat, playing)
+            won = playing & (self.points()[:, seat] >= WINNING_POINTS)
+            winners[won] = seat
+            turns[won] = turn
+            playing &= ~won
+            if not playing.any():
+                break
+        return BatchResults(self.num_players, winners, turns, self.points())
+
+
+
+# play num_games in batches of batch_size (a batch takes a few KB per game), each seeded from seed
+def simulate(num_games, num_players, seed=0, max_turns=400, batch_size=10000):
+    seeds = np.random.SeedSequence(seed).spawn((num_games + batch_size - 1) // batch_size)
+    return BatchResults.combine([BatchSimulator(min(batch_size, num_games - i * batch_size), num_players,
+                                                batch_seed, max_turns).run()
+                                 for i, batch_seed in enumerate(seeds)])
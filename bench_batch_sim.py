@@ -0,0 +1,102 @@
+"""Plays the batch simulator's scripted policy (see batch_sim.py) on many
+games at once, and the same policy one game at a time through rules.Rules,
+and compares games per second. Seat win rates of the two should agree up to
+noise.
+
+usage: python bench_batch_sim.py [batch_games] [baseline_games] [num_players] [max_turns]"""
+import random
+import sys
+
+from time import perf_counter
+
+from batch_sim import MAX_CITIES, MAX_ROADS, MAX_SETTLEMENTS, ROLL_PIPS, WINNING_POINTS, simulate
+from rules import BUILD_CITY, BUILD_ROAD, BUILD_SETTLEMENT, END_TURN, ROLL, SETTLE, GameState, Rules
+
+
+# one game of the scripted policy through Rules. returns (winning seat or -1, turn)
+def baseline_game(num_players, max_turns, rng):
+    rules = Rules(num_players, True)
+    for seat in range(num_players):
+        rules.add_player()
+    rules.start()
+    board = rules.hex_board
+    node_pips = [sum(ROLL_PIPS[board.roll_nums[hex_index] or 0] for hex_index in hexes) + rng.random() * 0.01
+                 for hexes in board.topology.node_hexes]
+    settlements = [0] * num_players
+    cities = [0] * num_players
+    roads = [0] * num_players
+
+    def play(move):
+        rules.apply(move)
+        rules.undo_stack.clear()
+
+    while rules.state is GameState.SETTLEMENT_SETUP:
+        seat = rules.cur_player.seat
+        moves = rules.legal_moves()
+        if moves[0][0] == SETTLE:
+            play(max(moves, key=lambda move: node_pips[move[1]]))
+            settlements[seat] += 1
+        else:
+            play(rng.choice(moves))
+            roads[seat] += 1
+
+    for turn in range(max_turns):
+        seat = rules.cur_player.seat
+        play((ROLL, rng.randrange(6), rng.randrange(6)))
+        moves = rules.legal_moves()
+        by_kind = {}
+        for move in moves:
+            by_kind.setdefault(move[0], []).append(move)
+        if BUILD_CITY in by_kind and cities[seat] < MAX_CITIES:
+            play(max(by_kind[BUILD_CITY], key=lambda move: node_pips[move[1]]))
+            settlements[seat] -= 1
+            cities[seat] += 1
+        elif BUILD_SETTLEMENT in by_kind and settlements[seat] < MAX_SETTLEMENTS:
+            play(max(by_kind[BUILD_SETTLEMENT], key=lambda move: node_pips[move[1]]))
+            settlements[seat] += 1
+        elif BUILD_ROAD in by_kind and roads[seat] < MAX_ROADS:
+            play(rng.choice(by_kind[BUILD_ROAD]))
+            roads[seat] += 1
+        if settlements[seat] + 2 * cities[seat] >= WINNING_POINTS:
+            return seat, turn
+        play((END_TURN,))
+    return -1, max_turns
+
+
+def report(name, num_games, elapsed, wins, unfinished):
+    print('  {:<10} {:>7} games  {:6.2f} s  {:8.0f} games/s   seat win rates {}   unfinished {:.2f}'.format(
+        name, num_games, elapsed, num_games / elapsed,
+        ' '.join('{:.3f}'.format(count / num_games) for count in wins), unfinished / num_games))
+
+
+def main():
+    batch_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    baseline_games = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    num_players = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    max_turns = int(sys.argv[4]) if len(sys.argv) > 4 else 400
+
+    print('{} players, at most {} turns'.format(num_players, max_turns))
+
+    # hex_board shuffles layouts with the random module
+    random.seed(1)
+    rng = random.Random(1)
+    wins = [0] * num_players
+    unfinished = 0
+    start = perf_counter()
+    for game in range(baseline_games):
+        winner, turn = baseline_game(num_players, max_turns, rng)
+        if winner < 0:
+            unfinished += 1
+        else:
+            wins[winner] += 1
+    report('baseline', baseline_games, perf_counter() - start, wins, unfinished)
+
+    start = perf_counter()
+    results = simulate(batch_games, num_players, seed=1, max_turns=max_turns)
+    elapsed = perf_counter() - start
+    report('batch', batch_games, elapsed, results.seat_win_rates() * batch_games,
+           (results.winners < 0).sum())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Rolls from a game's dice (dice_stream.py) against the global random module.
+
+usage: python bench_dice.py [rolls]"""
+import random
+import sys
+
+from time import perf_counter
+
+from dice_stream import DiceStream
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    # the same seed gives the same rolls, taken one at a time or in bulk
+    one_at_a_time = DiceStream(7)
+    in_bulk = DiceStream(7)
+    mixed = [one_at_a_time.next_roll() for i in range(5000)]
+    assert mixed == [list(roll) for roll in in_bulk.rolls(2000)] + \
+        [in_bulk.next_roll() for i in range(1000)] + [list(roll) for roll in in_bulk.rolls(2000)]
+    assert {face for roll in mixed for face in roll} == set(range(6))
+
+    start = perf_counter()
+    for i in range(count):
+        random.randrange(6), random.randrange(6)
+    elapsed = perf_counter() - start
+    print('{} rolls'.format(count))
+    print('  random.randrange:  {:.3f} us/roll'.format(elapsed / count * 1e6))
+
+    dice = DiceStream(0)
+    start = perf_counter()
+    for i in range(count):
+        dice.next_roll()
+    elapsed = perf_counter() - start
+    print('  next_roll:         {:.3f} us/roll'.format(elapsed / count * 1e6))
+
+    start = perf_counter()
+    dice.rolls(count)
+    elapsed = perf_counter() - start
+    print('  rolls (bulk):      {:.3f} us/roll'.format(elapsed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Journals a number of scripted games, then times rebuilding them all from
+the journal (journal.recover) as the server does on startup.
+
+usage: python bench_journal.py [num_games] [num_players] [dice_rolls]"""
+import os
+import sys
+import tempfile
+
+from time import perf_counter
+
+from bench_protocol import COLORS, RecordingChannel
+from game import Game
+from journal import Journal, recover
+from resources import RESOURCE_NAMES
+from rules import BANK_TRADE, BUILD_ROAD
+
+
+# play a game through settlement setup and some turns, journaling as the server would
+def journaled_game(journal, game_id, num_players, dice_rolls):
+    game = Game(num_players, True)
+    game.attach_journal(journal, game_id)
+    channels = [RecordingChannel([]) for i in range(num_players)]
+    for channel in channels:
+        game.add_player(channel)
+    # players are named as they pick, not in seat order: every other game the last seat goes first
+    naming_order = list(enumerate(channels))
+    if game_id % 2:
+        naming_order.reverse()
+    for i, channel in naming_order:
+        game.handle_network(channel, 'user_color_selection',
+                            {'username': 'player{}'.format(i), 'color': COLORS[i]})
+    for turn in range(2 * num_players):
+        channel = game.cur_player.channel
+        settlement = next(i for i in range(game.hex_board.topology.num_nodes)
+                          if game.hex_board.valid_settlement(i))
+        game.handle_network(channel, 'select_settlement', {'settlement': settlement})
+        # stray rolls out of turn are ignored, and mustn't use up the game's dice
+        game.handle_network(channel, 'stop_dice', {})
+        road = next(i for i in range(game.hex_board.topology.num_roads)
+                    if game.hex_board.valid_road(i, game.cur_player))
+        game.handle_network(channel, 'select_road', {'road': road})
+    play_turns(game, dice_rolls)
+    return game
+
+
+# roll, build or trade, and end the turn, dice_rolls times
+def play_turns(game, dice_rolls):
+    for roll in range(dice_rolls):
+        game.handle_network(game.cur_player.channel, 'stop_dice', {})
+        game.handle_network(game.cur_player.channel, 'stop_dice', {})
+        # build one thing if the roller can afford anything, or else make a bank
+        # trade if they can (legal_moves puts END_TURN first, then builds, then trades)
+        for move in game.legal_moves()[1:2]:
+            if move[0] == BANK_TRADE:
+                data = {'give': RESOURCE_NAMES[move[1]], 'get': RESOURCE_NAMES[move[2]]}
+            else:
+                data = {'road' if move[0] == BUILD_ROAD else 'settlement': move[1]}
+            game.handle_network(game.cur_player.channel, move[0], data)
+        game.handle_network(game.cur_player.channel, 'end_turn', {})
+
+
+# what a rebuilt game has to agree with the original on
+def summary(game):
+    board = game.hex_board
+    return (game.state, game.players.index(game.cur_player), board.layout(), board.roll_nums,
+            [(player.username, tuple(player.color), list(player.resources)) for player in game.players],
+            [owner and owner.username for owner in board.node_owner],
+            [owner and owner.username for owner in board.road_owner],
+            # the dice carry on with the same rolls
+            game.dice.seed, game.dice.rolled, game.roll_dice())
+
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    dice_rolls = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.journal')
+        journal = Journal(path)
+        start = perf_counter()
+        games = {game_id: journaled_game(journal, game_id, num_players, dice_rolls)
+                 for game_id in range(num_games)}
+        journal.close()
+        played = perf_counter() - start
+
+        start = perf_counter()
+        recovered = recover(path, Game)
+        recovery = perf_counter() - start
+
+        assert len(recovered) == num_games
+        for game_id, game in games.items():
+            assert summary(recovered[game_id]) == summary(game), game_id
+
+        # a rebuilt game goes on with only some of its players back: the rest
+        # aren't sent anything until they rejoin too
+        for game_id, game in games.items():
+            rebuilt = recovered[game_id]
+            rejoined = []
+            assert rebuilt.rejoin(RecordingChannel(rejoined), 'player0'), game_id
+            assert not rebuilt.rejoin(RecordingChannel([]), 'player0'), game_id
+            sent = len(rejoined)
+            # the journal is closed; the original plays on without it
+            game.journal = None
+            play_turns(game, dice_rolls)
+            play_turns(rebuilt, dice_rolls)
+            assert summary(rebuilt) == summary(game), game_id
+            assert dice_rolls == 0 or len(rejoined) > sent, game_id
+
+        print('{} games of {} players, {} dice rolls each'.format(num_games, num_players, dice_rolls))
+        print('  journal size:     {:.1f} KB ({:.0f} bytes/game)'.format(
+            os.path.getsize(path) / 1024, os.path.getsize(path) / num_games))
+        print('  play + journal:   {:.2f} s'.format(played))
+        print('  recover:          {:.2f} s ({:.0f} us/game)'.format(recovery, recovery / num_games * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Plays random settlements and roads for a few players and, after every
+move, compares the incremental longest road (longest_road.py) with a
+brute-force DFS over every road on the board.
+
+usage: python bench_longest_road.py [num_games] [num_players]"""
+import random
+import sys
+
+from time import perf_counter
+
+from hex_board import HexBoard
+from player import ServerPlayer
+
+# pieces each player has
+MAX_SETTLEMENTS = 5
+MAX_ROADS = 15
+
+
+# the reference: a depth first search over all of the player's roads from every node
+def brute_force_longest_road(board, player):
+    topology = board.topology
+    own_roads = [road for road, owner in enumerate(board.road_owner) if owner is player]
+
+    def search(node, used):
+        owner = board.node_owner[node]
+        if used and owner is not None and owner is not player:
+            # someone else's settlement ends the road here
+            return 0
+        best = 0
+        for road in topology.node_roads[node]:
+            if road in used or board.road_owner[road] is not player:
+                continue
+            first, second = topology.road_nodes[road]
+            best = max(best, 1 + search(second if first == node else first, used | {road}))
+        return best
+
+    best = 0
+    for road in own_roads:
+        for node in topology.road_nodes[road]:
+            best = max(best, search(node, frozenset()))
+    return best
+
+
+# a random sequence of (kind, index, seat): settlements within the distance
+# rule and roads each player may build, until everyone is out of roads
+def random_moves(rng, num_players):
+    board = HexBoard(False)
+    players = [ServerPlayer(None, seat) for seat in range(num_players)]
+    seats = list(range(num_players))
+    moves = []
+    settlements = [2] * num_players
+    roads_left = [MAX_ROADS] * num_players
+    for seat in seats + seats[::-1]:
+        node = rng.choice(board.legal_settlement_indices())
+        board.settle(node, players[seat])
+        moves.append(('settle', node, seat))
+    while True:
+        builders = [seat for seat in seats if roads_left[seat] and board.legal_roads(players[seat])]
+        if not builders:
+            return moves
+        seat = rng.choice(builders)
+        player = players[seat]
+        if (rng.random() < 0.15 and settlements[seat] < MAX_SETTLEMENTS and
+                board.legal_connected_settlements(player)):
+            node = rng.choice(board.legal_connected_settlements_indices(player))
+            board.settle(node, player)
+            settlements[seat] += 1
+            moves.append(('settle', node, seat))
+        road = rng.choice(board.legal_road_indices(player))
+        board.set_road(road, player)
+        roads_left[seat] -= 1
+        moves.append(('road', road, seat))
+
+
+def play(moves, num_players, longest):
+    board = HexBoard(False)
+    players = [ServerPlayer(None, seat) for seat in range(num_players)]
+    lengths = []
+    for kind, index, seat in moves:
+        if kind == 'settle':
+            board.settle(index, players[seat])
+        else:
+            board.set_road(index, players[seat])
+        lengths.append([longest(board, player) for player in players])
+    return lengths
+
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rng = random.Random(0)
+    games = [random_moves(rng, num_players) for i in range(num_games)]
+    num_moves = sum(len(moves) for moves in games)
+
+    timings = {}
+    results = {}
+    for name, longest in [('incremental', HexBoard.longest_road),
+                          ('brute force', brute_force_longest_road)]:
+        start = perf_counter()
+        results[name] = [play(moves, num_players, longest) for moves in games]
+        timings[name] = perf_counter() - start
+    assert results['incremental'] == results['brute force']
+
+    print('{} games, {} moves, longest road of every player checked after each move'.format(
+        num_games, num_moves))
+    longest_seen = max(max(max(lengths) for lengths in game) for game in results['incremental'])
+    print('  longest road seen: {}'.format(longest_seen))
+    for name, seconds in timings.items():
+        print('  {:<12} {:8.1f} us/move'.format(name, seconds / num_moves * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Times matchmaking (matchmaking.py / game_registry.py) with many open games:
+hosting, joining and players leaving lobbies.
+
+Checks that a player joining after someone left a lobby is never matched
+into that game, which was aborted and can't start any more, and that the
+aborted games are ended in the journal so a restart doesn't bring them back.
+
+usage: python bench_matchmaking.py [num_games] [num_players]"""
+import os
+import sys
+import tempfile
+
+from time import perf_counter
+
+from bench_protocol import RecordingChannel
+from game import Game
+from game_registry import GameRegistry, GameStatus
+from journal import Journal, live_records
+
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    registry = GameRegistry()
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, 'games.journal')
+    journal = Journal(path)
+
+    start = perf_counter()
+    hosts = []
+    for i in range(num_games):
+        game = Game(num_players, False)
+        game_id = registry.add_game(game)
+        game.attach_journal(journal, game_id)
+        host = RecordingChannel([])
+        registry.join(game_id, host)
+        hosts.append(host)
+    hosted = perf_counter() - start
+
+    # the host of every other game leaves before anyone else joins
+    leaving = hosts[::2]
+    start = perf_counter()
+    for host in leaving:
+        registry.channel_closed(host)
+    left = perf_counter() - start
+
+    start = perf_counter()
+    joined = 0
+    while True:
+        game_id, game = registry.find_open(num_players, False)
+        if game is None:
+            break
+        assert registry.status[game_id] is not GameStatus.ENDED, game_id
+        registry.join(game_id, RecordingChannel([]))
+        joined += 1
+    joining = perf_counter() - start
+    # only the games whose host stayed had seats to fill
+    assert joined == num_games // 2 * (num_players - 1), joined
+
+    # and only they would be rebuilt after a crash
+    journal.close()
+    assert sorted(live_records(path)) == list(range(1, num_games, 2))
+    directory.cleanup()
+
+    print('{} games of {} players'.format(num_games, num_players))
+    print('  host:   {:.1f} us/game'.format(hosted / num_games * 1e6))
+    print('  leave:  {:.1f} us/game'.format(left / len(leaving) * 1e6))
+    print('  join:   {:.1f} us/player'.format(joining / max(joined, 1) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Compares the PodSixNet dict format with the compact format (protocol.py)
+on the messages exchanged while playing a scripted game.
+
+usage: python bench_protocol.py [num_players] [dice_rolls]"""
+import sys
+import timeit
+
+from PodSixNet.rencode import dumps, loads
+
+from game import Game
+from protocol import CLIENT_TABLE, SERVER_TABLE, frame
+
+TERMINATOR = b'\0---\0'
+COLORS = [(0, 191, 255), (0, 0, 0), (211, 211, 211), (255, 105, 180), (110, 0, 110), (204, 204, 0)]
+
+
+class RecordingChannel:
+    """Stands in for a ClientChannel, keeping every message sent to it"""
+    def __init__(self, log):
+        self.log = log
+
+    def Send(self, data):
+        self.log.append(data)
+
+
+# play through player setup, settlement setup and some dice rolls without any
+# networking, and return every (client -> server, server -> client) message
+def scripted_game(num_players, dice_rolls):
+    inbound = []
+    outbound = []
+    game = Game(num_players, False)
+    channels = [RecordingChannel(outbound) for i in range(num_players)]
+
+    def act(channel, action, data):
+        data = dict(data, action=action, game_id=0)
+        inbound.append(data)
+        game.handle_network(channel, action, data)
+
+    for channel in channels:
+        game.add_player(channel)
+        inbound.append({'action': 'check_hosting', 'host': False,
+                        'options': {'num_players': num_players, 'randomize': False}})
+    for i, channel in enumerate(channels):
+        act(channel, 'user_color_selection', {'username': 'player{}'.format(i), 'color': COLORS[i]})
+
+    # two rounds of settlements and roads, always taking the first legal spot
+    for turn in range(2 * num_players):
+        channel = game.cur_player.channel
+        settlement = next(i for i in range(game.hex_board.topology.num_nodes)
+                          if game.hex_board.valid_settlement(i))
+        act(channel, 'select_settlement', {'settlement': settlement})
+        road = next(i for i in range(game.hex_board.topology.num_roads)
+                    if game.hex_board.valid_road(i, game.cur_player))
+        act(channel, 'select_road', {'road': road})
+
+    for roll in range(dice_rolls):
+        act(game.cur_player.channel, 'stop_dice', {})
+
+    return inbound, outbound
+
+
+def dict_encode(data):
+    return dumps(data) + TERMINATOR
+
+
+def dict_decode(raw):
+    return loads(raw[:-len(TERMINATOR)])
+
+
+def report(name, messages, table):
+    dict_frames = [dict_encode(data) for data in messages]
+    compact_frames = [frame(table.encode(data)) for data in messages]
+    for data, raw in zip(messages, compact_frames):
+        assert table.decode(raw[2:]) == data, data
+
+    runs = 200
+    timings = {
+        'dict encode': timeit.timeit(lambda: [dict_encode(data) for data in messages], number=runs),
+        'dict decode': timeit.timeit(lambda: [dict_decode(raw) for raw in dict_frames], number=runs),
+        'compact encode': timeit.timeit(lambda: [frame(table.encode(data)) for data in messages],
+                                        number=runs),
+        'compact decode': timeit.timeit(lambda: [table.decode(raw[2:]) for raw in compact_frames],
+                                        number=runs)}
+
+    dict_bytes = sum(len(raw) for raw in dict_frames)
+    compact_bytes = sum(len(raw) for raw in compact_frames)
+    print('{}: {} messages'.format(name, len(messages)))
+    print('  bytes per game: dict {}, compact {} ({:.0%})'.format(dict_bytes, compact_bytes,
+                                                                  compact_bytes / dict_bytes))
+    for label, seconds in timings.items():
+        print('  {:<15} {:6.2f} us/message'.format(label, seconds / runs / len(messages) * 1e6))
+
+
+def main():
+    num_players = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    dice_rolls = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    inbound, outbound = scripted_game(num_players, dice_rolls)
+    report('server -> clients', outbound, SERVER_TABLE)
+    report('clients -> server', inbound, CLIENT_TABLE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Times apply / undo pairs on the rules core (rules.Rules), as a search would
+use them: from positions along random playouts, try every legal move and take
+it back. Checks that undo puts everything back the way it was.
+
+usage: python bench_rules.py [num_games] [num_players] [turns]"""
+import random
+import sys
+
+from time import perf_counter
+
+from rules import Rules
+
+
+# everything apply can change, to compare before and after an undo
+def snapshot(rules):
+    board = rules.hex_board
+    return (rules.position_hash(), rules.state, rules.cur_player, rules.select_settlement,
+            rules.second_round, [list(player.resources) for player in rules.players],
+            list(board.node_owner), bytes(board.node_city), list(board.road_owner),
+            board.settled, board.roads_taken, board.open_nodes,
+            sorted((player.seat, mask) for player, mask in board.player_nodes.items()),
+            sorted((player.seat, mask) for player, mask in board.player_roads.items()),
+            sorted((player.seat, mask) for player, mask in board.player_road_nodes.items()),
+            sorted((player.seat, mask) for player, mask in board.player_legal_roads.items()),
+            sorted((player.seat, mask) for player, mask in board.player_legal_settlements.items()),
+            {roll_num: list(entries) for roll_num, entries in board.production.items()},
+            sorted((player.seat, rates) for player, rates in board.player_trade_rates.items()),
+            [board.longest_road(player) for player in rules.players])
+
+
+def new_game(num_players):
+    rules = Rules(num_players, True)
+    for seat in range(num_players):
+        rules.add_player()
+    rules.start()
+    return rules
+
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    turns = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+    rng = random.Random(1)
+
+    pairs = 0
+    elapsed = 0.0
+    for game in range(num_games):
+        rules = new_game(num_players)
+        for step in range(2 * num_players * 2 + turns * 2):
+            moves = rules.legal_moves()
+            if not moves:
+                break
+            before = snapshot(rules)
+            start = perf_counter()
+            for move in moves:
+                rules.apply(move)
+                rules.undo()
+            elapsed += perf_counter() - start
+            pairs += len(moves)
+            assert snapshot(rules) == before, (game, step)
+            # carry on down the playout, building more often than not so boards fill up
+            builds = moves[1:] if moves[0] == ('end_turn',) and len(moves) > 1 and rng.random() < 0.8 else moves
+            rules.apply(rng.choice(builds))
+            rules.undo_stack.clear()
+
+    print('{} games of {} players'.format(num_games, num_players))
+    print('  apply / undo:     {} pairs in {:.2f} s'.format(pairs, elapsed))
+    print('                    {:.0f} pairs/s ({:.1f} us/pair)'.format(pairs / elapsed, elapsed / pairs * 1e6))
+
+
+if __name__ == '__main__':
+    main()
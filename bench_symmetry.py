@@ -0,0 +1,63 @@
+"""Canonical board keys (symmetry.py) and the board cache (board_cache.py).
+
+Checks that every turn and flip of a board gets the same key and the same
+opening scores, then times canonicalizing boards and looking opening scores
+up through a BoardCache on disk.
+
+usage: python bench_symmetry.py [boards]"""
+import os
+import sys
+import tempfile
+
+from time import perf_counter
+
+from board_cache import BoardCache
+from board_generator import BoardGenerator
+import opening
+from symmetry import canonical_board, symmetries
+
+
+def main():
+    num_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    generator = BoardGenerator(seed=0)
+    boards = [generator.next_board() for i in range(num_boards)]
+    print('{} symmetries'.format(len(symmetries())))
+
+    # every image of a board has the board's key, and scores that agree once the nodes are moved back
+    for layout, roll_nums in boards[:100]:
+        key = canonical_board(layout, roll_nums).key
+        scores = opening.node_scores(layout, roll_nums)
+        for symmetry in symmetries():
+            image = canonical_board(symmetry.apply(layout), symmetry.apply(roll_nums))
+            assert image.key == key
+            image_scores = opening.node_scores(symmetry.apply(layout), symmetry.apply(roll_nums))
+            assert [image_scores[symmetry.node_perm[node]] for node in range(len(scores))] == list(scores)
+
+    start = perf_counter()
+    keys = {canonical_board(layout, roll_nums).key for layout, roll_nums in boards}
+    elapsed = perf_counter() - start
+    print('  canonicalize:     {:.1f} us/board ({} distinct of {})'.format(
+        elapsed / num_boards * 1e6, len(keys), num_boards))
+
+    # the same boards again, each turned some way: on disk, all of them are hits
+    images = [(symmetry.apply(layout), symmetry.apply(roll_nums))
+              for index, (layout, roll_nums) in enumerate(boards)
+              for symmetry in [symmetries()[index % len(symmetries())]]]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = BoardCache(os.path.join(directory, 'boards'))
+        opening.use_board_cache(cache)
+        for pass_name, pass_boards in (('first pass', boards), ('turned boards', images)):
+            opening.cached_node_scores.cache_clear()
+            opening.canonical_node_scores.cache_clear()
+            start = perf_counter()
+            for layout, roll_nums in pass_boards:
+                opening.node_scores(layout, roll_nums)
+            elapsed = perf_counter() - start
+            print('  {:<17} {:.1f} us/board, {} hits {} misses'.format(
+                pass_name + ':', elapsed / num_boards * 1e6, cache.hits, cache.misses))
+        opening.use_board_cache(None)
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import shelve
+
+from board_topology import STANDARD_TOPOLOGY
+from symmetry import canonical_board
+
+# Results worked out per board, kept on disk under the board's canonical key
+# (see symmetry.py), so that they are worked out once for a board and all of
+# its turns and flips, and survive restarts. Anything picklable can be kept:
+# opening evaluations, simulation results, rendered thumbnails (as bytes).
+#
+# Results are worked out on the canonical board. Ones that depend on where
+# things are (per node values, say) have to be turned back to the board they
+# were asked for with CanonicalBoard.node_values.
+
+
+class BoardCache:
+    """A disk-backed map from (kind of result, canonical board) to the result.
+    kind keeps different results for the same board apart"""
+    def __init__(self, path):
+        self.path = path
+        self.shelf = shelve.open(path)
+        self.hits = 0
+        self.misses = 0
+
+    # the kind result for the canonical board, worked out with compute(canonical) if it isn't kept yet
+    def get(self, kind, canonical, compute):
+        key = '{}:{}'.format(kind, canonical.key)
+        try:
+            result = self.shelf[key]
+            self.hits += 1
+        except KeyError:
+            result = compute(canonical)
+            self.shelf[key] = result
+            self.misses += 1
+        return result
+
+    # the same for a layout and its numbers, along with the board's canonical form
+    def get_for(self, kind, layout, roll_nums, compute, topology=STANDARD_TOPOLOGY):
+        canonical = canonical_board(layout, roll_nums, topology)
+        return self.get(kind, canonical, compute), canonical
+
+    def sync(self):
+        self.shelf.sync()
+
+    def close(self):
+        self.shelf.close()
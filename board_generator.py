@@ -0,0 +1,156 @@
+import random
+
+from collections import deque
+
+from board_topology import STANDARD_TOPOLOGY
+from hex import HexType
+from hex_board import DEFAULT_FREQUENCIES, DEFAULT_LAYOUTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Random boards that are fair by some configurable rules: where the hexes go
+# and which numbers they get are both shuffled, and a candidate is thrown
+# away if it breaks a constraint.
+#
+# Every constraint is a check on pairs of neighboring hexes, so the board's
+# hex adjacency (BoardTopology.hex_neighbors, from NODE_INDICES_TO_HEX) is
+# flattened once into two arrays of pair ends and a batch of candidates is
+# checked with a few array comparisons. A candidate is kept only if it passes
+# every check on its first try, so boards come out uniformly among the valid
+# ones. Without NumPy candidates are checked one at a time.
+
+# the numbers that come up most often
+RED_NUMBERS = (6, 8)
+
+
+class Constraints:
+    """What makes a board fair. max_same_resource_neighbors is how many neighbors
+    of the same type a hex may have (None for no limit)"""
+    def __init__(self, no_adjacent_red=True, no_adjacent_same_number=True, max_same_resource_neighbors=2):
+        self.no_adjacent_red = no_adjacent_red
+        self.no_adjacent_same_number = no_adjacent_same_number
+        self.max_same_resource_neighbors = max_same_resource_neighbors
+
+
+DEFAULT_CONSTRAINTS = Constraints()
+
+
+# each pair of neighboring hexes once, as (first, second)
+def hex_pairs(topology):
+    return [(hex_index, other) for hex_index, neighbors in enumerate(topology.hex_neighbors)
+            for other in neighbors if hex_index < other]
+
+
+# does a board (a layout and the number on each hex, None for the CACTUS tile) keep to the constraints?
+def valid_board(layout, roll_nums, constraints=DEFAULT_CONSTRAINTS, topology=STANDARD_TOPOLOGY):
+    same_resource_neighbors = [0] * topology.num_hexes
+    for first, second in hex_pairs(topology):
+        first_num, second_num = roll_nums[first], roll_nums[second]
+        if constraints.no_adjacent_red and first_num in RED_NUMBERS and second_num in RED_NUMBERS:
+            return False
+        if constraints.no_adjacent_same_number and first_num is not None and first_num == second_num:
+            return False
+        if layout[first] is layout[second]:
+            same_resource_neighbors[first] += 1
+            same_resource_neighbors[second] += 1
+    return (constraints.max_same_resource_neighbors is None or
+            max(same_resource_neighbors) <= constraints.max_same_resource_neighbors)
+
+
+class BoardGenerator:
+    """Makes boards by shuffling the topology's default layout (hex_board.DEFAULT_LAYOUTS)
+    and number tokens until the constraints are met. Boards are made batch_size candidates at a time and handed
+    out one by one with next_board()"""
+    def __init__(self, constraints=DEFAULT_CONSTRAINTS, seed=None, batch_size=16384,
+                 topology=STANDARD_TOPOLOGY):
+        self.constraints = constraints
+        self.topology = topology
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.boards = deque()
+
+        pairs = hex_pairs(topology)
+        self.layout = DEFAULT_LAYOUTS[topology.num_hexes]
+        frequencies = DEFAULT_FREQUENCIES[topology.num_hexes]
+        # the number tokens, one per hex that isn't a CACTUS tile
+        self.number_tokens = [frequency for frequency in frequencies if frequency != 0]
+        self.hex_types = list(dict.fromkeys(self.layout))
+        self.cactus_code = self.hex_types.index(HexType.CACTUS)
+        if np is not None:
+            self.np_rng = np.random.default_rng(seed)
+            # every type but the CACTUS tiles', and every number with a 0 for each CACTUS tile
+            self.type_codes = np.array([self.hex_types.index(hex_type) for hex_type in self.layout
+                                        if hex_type is not HexType.CACTUS], dtype=np.int8)
+            self.frequencies = np.array(frequencies, dtype=np.int8)
+            self.red = np.zeros(max(frequencies) + 1, dtype=bool)
+            self.red[list(RED_NUMBERS)] = True
+            self.first = np.array([first for first, second in pairs])
+            self.second = np.array([second for first, second in pairs])
+            # pair -> both of its hexes
+            self.pair_hexes = np.zeros((len(pairs), topology.num_hexes), dtype=np.int16)
+            self.pair_hexes[np.arange(len(pairs)), self.first] = 1
+            self.pair_hexes[np.arange(len(pairs)), self.second] = 1
+
+    # a (layout, roll_nums) pair, as HexBoard takes them
+    def next_board(self):
+        while not self.boards:
+            self.boards.extend(self.generate())
+        return self.boards.popleft()
+
+    # the valid boards among one batch of candidates
+    def generate(self):
+        if np is None:
+            return self.generate_python()
+        count = self.batch_size
+        rng = self.np_rng
+        num_hexes = self.topology.num_hexes
+        # numbers go down first, the blanks marking the CACTUS tiles, and are checked
+        # before any types are dealt: most candidates fail on numbers
+        numbers = self.frequencies[rng.random((count, num_hexes), np.float32).argsort(axis=1)]
+        first_numbers, second_numbers = numbers[:, self.first], numbers[:, self.second]
+        invalid = np.zeros(count, dtype=bool)
+        if self.constraints.no_adjacent_red:
+            invalid |= (self.red[first_numbers] & self.red[second_numbers]).any(axis=1)
+        if self.constraints.no_adjacent_same_number:
+            invalid |= ((first_numbers == second_numbers) & (first_numbers != 0)).any(axis=1)
+        numbers = numbers[~invalid]
+
+        # then the other types over the numbered hexes, one row at a time
+        dealt = len(numbers)
+        types = np.full((dealt, num_hexes), self.cactus_code, dtype=self.type_codes.dtype)
+        types[numbers != 0] = self.type_codes[
+            rng.random((dealt, len(self.type_codes)), np.float32).argsort(axis=1)].ravel()
+        if self.constraints.max_same_resource_neighbors is not None:
+            same = (types[:, self.first] == types[:, self.second]).astype(np.int16)
+            # how many same-type neighbors each hex has
+            same_neighbors = same @ self.pair_hexes
+            valid = same_neighbors.max(axis=1) <= self.constraints.max_same_resource_neighbors
+            types, numbers = types[valid], numbers[valid]
+
+        return [([self.hex_types[code] for code in row_types],
+                 [None if number == 0 else number for number in row_numbers])
+                for row_types, row_numbers in zip(types.tolist(), numbers.tolist())]
+
+    def generate_python(self):
+        boards = []
+        for i in range(self.batch_size):
+            layout = self.rng.sample(self.layout, len(self.layout))
+            tokens = iter(self.rng.sample(self.number_tokens, len(self.number_tokens)))
+            roll_nums = [None if hex_type is HexType.CACTUS else next(tokens) for hex_type in layout]
+            if valid_board(layout, roll_nums, self.constraints, self.topology):
+                boards.append((layout, roll_nums))
+        return boards
+
+
+# shared by every game in the process, so boards are made in bulk. one per topology
+default_generators = {}
+
+
+def next_board(topology=STANDARD_TOPOLOGY):
+    generator = default_generators.get(topology)
+    if generator is None:
+        generator = default_generators[topology] = BoardGenerator(topology=topology)
+    return generator.next_board()
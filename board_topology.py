@@ -0,0 +1,177 @@
+from functools import lru_cache
+
+# Boards of any shape, generated from the axial coordinates (q, r) of their
+# hexes: r is the row, and q goes up to the right along it. Hexes are point
+# up. Positions on screen are kept in units of half a hex's width across
+# (x) and a quarter of its height (y), so that every hex center and corner
+# lands on whole numbers: a hex's center is (2q + r, 3r), and its corners
+# are CORNER_OFFSETS from it. A corner shared by several hexes is the same
+# point, so nodes are found with a dict rather than by comparing positions.
+#
+# Hexes are numbered row by row, left to right. Nodes are numbered in the
+# order they are first met going around each hex's corners, and roads in
+# the order their edges are first met. The standard board is generated
+# like any other; its tables match the ones it was always written out with.
+
+# the corners of a hex, in the order nodes are met: right of the top, top,
+# left of the top, left of the bottom, bottom, right of the bottom
+CORNER_OFFSETS = ((1, -1), (0, -2), (-1, -1), (-1, 1), (0, 2), (1, 1))
+
+# hexes per row, top to bottom
+STANDARD_ROWS = (3, 4, 5, 4, 3)
+# the 5 - 6 player board
+EXTENSION_ROWS = (3, 4, 5, 6, 5, 4, 3)
+
+# which nodes are connected by roads on the standard board. It was written out
+# by hand before boards were generated, and two of its roads (26 and 27) are the
+# other way around from the generated order; they keep their numbers here since
+# clients and journals refer to roads by number
+ROAD_NODES_INDICES = [[0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 0],
+                      [6, 7], [7, 0], [5, 8], [8, 9], [9, 6], [10, 11],
+                      [11, 6], [9, 12], [12, 13], [13, 10], [3, 14],
+                      [14, 15], [15, 16], [16, 17], [17, 4], [17, 18],
+                      [18, 19], [8, 19], [19, 20], [20, 21], [22, 13],
+                      [12, 21], [21, 23], [23, 24], [24, 22], [15, 25],
+                      [25, 26], [26, 27], [27, 28], [28, 16], [28, 29],
+                      [29, 30], [30, 18], [30, 31], [31, 32], [32, 20],
+                      [32, 33], [33, 34], [34, 23], [35, 24], [34, 36],
+                      [36, 37], [37, 35], [27, 38], [38, 39], [39, 40],
+                      [40, 29], [40, 41], [41, 42], [42, 31], [42, 43],
+                      [43, 44], [44, 33], [44, 45], [45, 46], [46, 36],
+                      [39, 47], [47, 48], [48, 49], [49, 41], [49, 50],
+                      [50, 51], [51, 43], [51, 52], [52, 53], [53, 45]]
+
+# the bits of the given indices set in one int
+def to_mask(indices):
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+# the indices of the bits set in mask, lowest first
+def mask_indices(mask):
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+class BoardTopology:
+    """How the nodes, roads and hexes of a board connect. It never changes, so
+    a single instance is built once and shared by every game; games only keep
+    who owns what, indexed the same way.
+
+    Adjacency is kept as tuples of indices and as int bitmasks (bit i for node,
+    road or hex i), so rule checks are an index or a couple of bitwise ops.
+
+    A generated board (see topology_for_hexes) also knows where its hexes and
+    nodes are, in the units described at the top of this file"""
+    def __init__(self, node_neighbors, road_nodes, hex_nodes, hex_points=None, node_points=None):
+        self.num_nodes = len(node_neighbors)
+        self.num_roads = len(road_nodes)
+        self.num_hexes = len(hex_nodes)
+
+        node_roads = [[] for i in range(self.num_nodes)]
+        for road, pair in enumerate(road_nodes):
+            for node in pair:
+                node_roads[node].append(road)
+        node_hexes = [[] for i in range(self.num_nodes)]
+        for hex_index, nodes in enumerate(hex_nodes):
+            for node in nodes:
+                node_hexes[node].append(hex_index)
+
+        self.node_neighbors = tuple(tuple(neighbors) for neighbors in node_neighbors)
+        self.node_roads = tuple(tuple(roads) for roads in node_roads)
+        self.node_hexes = tuple(tuple(hexes) for hexes in node_hexes)
+        self.road_nodes = tuple(tuple(pair) for pair in road_nodes)
+        self.hex_nodes = tuple(tuple(nodes) for nodes in hex_nodes)
+        # hexes are neighbors when they share an edge, i.e. two nodes
+        self.hex_neighbors = tuple(
+            tuple(other for other, other_nodes in enumerate(hex_nodes)
+                  if other != hex_index and len(set(nodes) & set(other_nodes)) == 2)
+            for hex_index, nodes in enumerate(hex_nodes))
+
+        # a node and its neighbors: where a settlement rules out another one
+        self.settle_masks = tuple(to_mask(neighbors) | 1 << node
+                                  for node, neighbors in enumerate(node_neighbors))
+        self.node_road_masks = tuple(to_mask(roads) for roads in node_roads)
+        self.road_node_masks = tuple(to_mask(pair) for pair in road_nodes)
+        self.all_nodes = (1 << self.num_nodes) - 1
+        self.all_roads = (1 << self.num_roads) - 1
+
+        self.hex_points = hex_points
+        self.node_points = node_points
+
+
+# the axial coordinates of a board with this many hexes in each row, each row
+# centered on the one above it (so a row has one more or one less hex)
+def rows_hexes(rows):
+    hexes = []
+    x = 0  # where the row's first hex center is
+    for r, length in enumerate(rows):
+        if r > 0:
+            if abs(length - rows[r - 1]) != 1:
+                raise ValueError('each row must have one more or one less hex than the last: {}'.format(rows))
+            x += -1 if length > rows[r - 1] else 1
+        hexes.extend(((x - r) // 2 + i, r) for i in range(length))
+    return tuple(hexes)
+
+
+# the rows of a hexagonal board: one hex with radius rings around it
+def ring_rows(radius):
+    return tuple(range(radius + 1, 2 * radius + 1)) + tuple(range(2 * radius + 1, radius, -1))
+
+
+# the topology of the board made of these hexes (axial coordinates, in the order they are numbered)
+@lru_cache(maxsize=None)
+def topology_for_hexes(hexes):
+    node_at = {}  # corner position -> node
+    hex_nodes = []
+    road_at = {}  # frozenset of a road's nodes -> road
+    road_nodes = []
+    for q, r in hexes:
+        x, y = 2 * q + r, 3 * r
+        nodes = [node_at.setdefault((x + dx, y + dy), len(node_at)) for dx, dy in CORNER_OFFSETS]
+        hex_nodes.append(nodes)
+        for corner, node in enumerate(nodes):
+            pair = (node, nodes[(corner + 1) % len(nodes)])
+            if frozenset(pair) not in road_at:
+                road_at[frozenset(pair)] = len(road_nodes)
+                road_nodes.append(list(pair))
+
+    if hexes == STANDARD_HEXES:
+        # the same roads, numbered the way they always have been
+        assert {frozenset(pair) for pair in ROAD_NODES_INDICES} == set(road_at)
+        road_nodes = ROAD_NODES_INDICES
+
+    node_neighbors = [[] for i in range(len(node_at))]
+    for first, second in road_nodes:
+        node_neighbors[first].append(second)
+        node_neighbors[second].append(first)
+    return BoardTopology([sorted(neighbors) for neighbors in node_neighbors], road_nodes, hex_nodes,
+                         hex_points=tuple((2 * q + r, 3 * r) for q, r in hexes),
+                         node_points=tuple(node_at))
+
+
+def topology_for_rows(rows):
+    return topology_for_hexes(rows_hexes(tuple(rows)))
+
+
+STANDARD_HEXES = rows_hexes(STANDARD_ROWS)
+# the standard 19 hex board
+STANDARD_TOPOLOGY = topology_for_rows(STANDARD_ROWS)
+# the 30 hex board for 5 - 6 players
+EXTENSION_TOPOLOGY = topology_for_rows(EXTENSION_ROWS)
+# the most players the standard board is played with
+STANDARD_MAX_PLAYERS = 4
+
+
+# the board a game with this many players is played on
+def topology_for_players(num_players):
+    return STANDARD_TOPOLOGY if num_players <= STANDARD_MAX_PLAYERS else EXTENSION_TOPOLOGY
+
+# which nodes go to which hex of the standard board, a corner at a time in CORNER_OFFSETS order
+NODE_INDICES_TO_HEX = [list(nodes) for nodes in STANDARD_TOPOLOGY.hex_nodes]
@@ -0,0 +1,187 @@
+import asyncore
+import random
+
+from time import monotonic
+
+from PodSixNet.Channel import Channel
+
+from protocol import BATCH, COMPACT, CompactEndPoint
+
+# a headless client: no window, no input(), just a scripted player driven by
+# the server's messages. many of them can share one socket map so a single
+# process can run thousands (see load_test.py)
+
+BOT_COLORS = [(0, 191, 255), (0, 0, 0), (211, 211, 211),
+              (255, 105, 180), (110, 0, 110), (204, 204, 0)]
+
+# the reply that completes the round trip for each action a bot sends
+REPLIES = {'check_hosting': ['check_hosting'],
+           'user_color_selection': ['check_user_color'],
+           'select_settlement': ['new_settlement', 'invalid'],
+           'select_road': ['new_road', 'invalid'],
+           'stop_dice': ['dice_result']}
+
+
+class BotStats:
+    """Numbers collected from every bot in a run"""
+    def __init__(self):
+        self.started = monotonic()
+        self.connect_times = []  # seconds from starting to connect until init
+        self.latencies = {action: [] for action in REPLIES}
+        self.games_completed = 0
+        self.aborted = 0
+        self.errors = 0
+
+
+class BotClient:
+    """A scripted player that hosts or joins a game and plays it until the first dice roll"""
+    def __init__(self, name, address, num_players, hosting, stats, socket_map, compact=True, rng=None):
+        self.name = name
+        self.num_players = num_players
+        self.hosting = hosting
+        self.stats = stats
+        self.compact = compact
+        self.rng = rng or random.Random()
+
+        self.game_id = None
+        self.color_choice = 0
+        self.color = None
+        self.done = False
+
+        # the choices the server offered for the current selection, minus any it rejected
+        self.legal = []
+        self.selection = None  # the last settlement / road index sent
+
+        # action -> time it was sent, for the round trip that is waiting on a reply
+        self.pending = {}
+
+        self.connect_started = monotonic()
+        self.connection = CompactEndPoint(address, map=socket_map)
+        self.connection.DoConnect()
+
+    def send(self, message):
+        if self.game_id is not None:
+            message['game_id'] = self.game_id
+        self.pending[message['action']] = monotonic()
+        self.connection.Send(message)
+
+    # hand everything the connection has received to the Network_ methods
+    def handle_messages(self):
+        queue = self.connection.queue
+        self.connection.queue = []
+        for data in queue:
+            if self.done:
+                break
+            self.record_reply(data['action'])
+            method = getattr(self, 'Network_' + data['action'], None)
+            if method is not None:
+                method(data)
+
+    def record_reply(self, reply):
+        for action, replies in REPLIES.items():
+            if reply in replies and action in self.pending:
+                self.stats.latencies[action].append(monotonic() - self.pending.pop(action))
+                return
+
+    def close(self):
+        self.done = True
+        self.connection.close()
+
+    def join_game(self):
+        self.send({'action': 'check_hosting', 'host': self.hosting,
+                   'options': {'num_players': self.num_players, 'randomize': True}})
+
+    def pick_color(self):
+        self.color = BOT_COLORS[self.color_choice % len(BOT_COLORS)]
+        self.send({'action': 'user_color_selection', 'username': self.name, 'color': self.color})
+
+    def Network_init(self, data):
+        self.stats.connect_times.append(monotonic() - self.connect_started)
+        offered = data.get('protocols', [])
+        if COMPACT in offered or BATCH in offered:
+            self.connection.negotiate(self.compact and COMPACT in offered, BATCH in offered)
+        self.join_game()
+
+    def Network_check_hosting(self, data):
+        if data['accepted']:
+            self.game_id = data['game_id']
+            self.pick_color()
+        else:
+            # nobody is hosting a game we can join yet; ask again
+            self.join_game()
+
+    def Network_check_user_color(self, data):
+        if not data['accept_username']:
+            self.name += '_'
+        if not data['accept_color']:
+            self.color_choice += 1
+        if not (data['accept_username'] and data['accept_color']):
+            self.pick_color()
+
+    def Network_select_settlement(self, data):
+        self.legal = list(data['legal'])
+        self.select_settlement()
+
+    def select_settlement(self):
+        if self.legal:
+            self.selection = self.rng.choice(self.legal)
+            self.send({'action': 'select_settlement', 'settlement': self.selection})
+
+    def Network_select_road(self, data):
+        self.legal = list(data['legal'])
+        self.select_road()
+
+    def select_road(self):
+        if self.legal:
+            self.selection = self.rng.choice(self.legal)
+            self.send({'action': 'select_road', 'road': self.selection})
+
+    def Network_invalid(self, data):
+        # only possible if the board changed since the choices were sent
+        self.legal.remove(self.selection)
+        if data['message'] == 'settlement':
+            self.select_settlement()
+        else:
+            self.select_road()
+
+    def Network_roll_dice(self, data):
+        self.send({'action': 'stop_dice'})
+
+    def Network_dice_result(self, data):
+        # the game has made it through setup and its first roll
+        if self.hosting:
+            self.stats.games_completed += 1
+        self.close()
+
+    def Network_game_aborted(self, data):
+        self.stats.aborted += 1
+        self.close()
+
+    def Network_error(self, data):
+        self.stats.errors += 1
+        self.close()
+
+    def Network_disconnected(self, data):
+        self.done = True
+
+
+class BotPool:
+    """Runs many bots over one socket map with a single poll per tick"""
+    def __init__(self):
+        self.socket_map = {}
+        self.bots = []
+
+    def add(self, bot):
+        self.bots.append(bot)
+
+    def pump(self, timeout=0.01):
+        for bot in self.bots:
+            if not bot.done:
+                # flush what the bot has sent without polling the whole map once per bot
+                bot.connection.seal_outbox()
+                Channel.Pump(bot.connection)
+        asyncore.poll2(timeout, self.socket_map)
+        for bot in self.bots:
+            if bot.connection.queue:
+                bot.handle_messages()
+        self.bots = [bot for bot in self.bots if not bot.done]
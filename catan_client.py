@@ -2,12 +2,15 @@ import pygame
 
 from time import sleep
 
-from PodSixNet.Connection import connection, ConnectionListener
+from PodSixNet.Connection import ConnectionListener
 
 from player import ClientMyPlayer
 
 from game_board import GameBoard
 
+from protocol import BATCH, CompactEndPoint, COMPACT
+from resources import RESOURCE_NAMES
+
 from common import *
 
 from enum import Enum
@@ -97,14 +100,32 @@ class GameState(Enum):
     SELECT_ROAD = 3  # initial road selection
     ROLL_DICE_WAIT = 4 # players await results of dice roll
     ROLL_DICE_STOP = 5 # player needs to stop the dice roll
+    PLAYER_TURN = 6  # player picks an action from the sidebar
+    BUILD_ROAD = 7  # player picks where to build
+    BUILD_SETTLEMENT = 8
+    BUILD_CITY = 9
+    TRADE_GIVE = 10  # player picks the resource to give the bank
+    TRADE_GET = 11  # and the one to get for it
+
+
+# the sidebar actions that build something: the state for picking where, the
+# legal places the server sent in player_turn, and the message to send
+BUILD_ACTIONS = {'Buy Road': (GameState.BUILD_ROAD, 'roads', 'build_road', 'road'),
+                 'Buy Sett.': (GameState.BUILD_SETTLEMENT, 'settlements', 'build_settlement', 'settlement'),
+                 'Buy City': (GameState.BUILD_CITY, 'cities', 'build_city', 'settlement')}
 
 
 # this is the client
 class CatanClient(ConnectionListener):
     """Client for Catan game. Manages all displays"""
-    def __init__(self, host='localhost', port=4200):
+    def __init__(self, host='localhost', port=4200, compact=True):
         pygame.init()
 
+        # our own connection rather than PodSixNet's singleton, so that it can
+        # switch to the compact wire format
+        self.connection = CompactEndPoint()
+        self.compact = compact
+
         self.game_board = None
         self.screen = None
 
@@ -114,10 +135,26 @@ class CatanClient(ConnectionListener):
 
         self.state = GameState.WAITING_FOR_PLAYERS
 
+        # the settlements / roads the server will accept for the current selection
+        self.legal = None
+
+        # what the user can do this turn (see Network_player_turn), the message
+        # and its key for what they are building, and the resource picked to
+        # give in a bank trade
+        self.turn = None
+        self.building = None
+        self.give = None
+
         self.state_functions = {GameState.SELECT_SETTLEMENT: self.select_settlement,
                                 GameState.SELECT_ROAD: self.select_road,
                                 GameState.ROLL_DICE_WAIT: self.roll_dice_wait,
-                                GameState.ROLL_DICE_STOP: self.roll_dice_stop}
+                                GameState.ROLL_DICE_STOP: self.roll_dice_stop,
+                                GameState.PLAYER_TURN: self.player_turn,
+                                GameState.BUILD_ROAD: self.build,
+                                GameState.BUILD_SETTLEMENT: self.build,
+                                GameState.BUILD_CITY: self.build,
+                                GameState.TRADE_GIVE: self.trade_give,
+                                GameState.TRADE_GET: self.trade_get}
 
         self.Connect((host, port))
         self.server_response = False
@@ -174,11 +211,24 @@ class CatanClient(ConnectionListener):
     def send(self, message):
         if self.game_id is not None:
             message['game_id'] = self.game_id
-        connection.Send(message)
+        self.connection.Send(message)
+
+    def Connect(self, address):
+        self.connection.DoConnect(address)
+        self.Pump()
+
+    # hand every message received since the last pump to its Network_ method
+    def Pump(self):
+        for data in self.connection.GetQueue():
+            [getattr(self, n)(data) for n in ('Network_' + data['action'], 'Network') if hasattr(self, n)]
 
     # the server is informing the client that they have connected
     def Network_init(self, data):
         self.server_response = True
+        # switch to the compact format and batched messages if the server offers them
+        offered = data.get('protocols', [])
+        if COMPACT in offered or BATCH in offered:
+            self.connection.negotiate(self.compact and COMPACT in offered, BATCH in offered)
         print('Connected to the server...')
 
     # receive message from server about whether the desired game specifications
@@ -227,7 +277,7 @@ class CatanClient(ConnectionListener):
         layout = data['layout']
         for item in layout:
             print(item)
-        self.game_board = GameBoard(200, 200, layout, self.num_players)
+        self.game_board = GameBoard(200, 200, layout, self.num_players, numbers=data.get('numbers'))
 
     # network signals from here below are those received during actually game-play
     # and mostly just change the client's state or screen. they are paired w/ the
@@ -243,6 +293,7 @@ class CatanClient(ConnectionListener):
     # client must select a settlement
     def Network_select_settlement(self, data):
         self.state = GameState.SELECT_SETTLEMENT
+        self.legal = data.get('legal')
         print('Please select a settlement')
 
     # FROM SERVER
@@ -263,6 +314,7 @@ class CatanClient(ConnectionListener):
     # client must select a road
     def Network_select_road(self, data):
         self.state = GameState.SELECT_ROAD
+        self.legal = data.get('legal')
         print('Please select a road')
 
     # FROM SERVER
@@ -270,10 +322,30 @@ class CatanClient(ConnectionListener):
     def Network_invalid(self, data):
         print('Invalid {} selection, please try again'.format(data['message']))
 
+    # FROM SERVER
+    # the game can't go on (someone left or it sat idle too long)
+    def Network_game_aborted(self, data):
+        self.state = GameState.WAIT
+        print('The game has ended: {}'.format(data['message']))
+
     # FROM SERVER
     # the user's resources have changed; update them
     def Network_update_resources(self, data):
-        pass    
+        resources = data['resources']
+        self.my_player.resources = resources
+        self.game_board.update_resources([resources[name] for name in RESOURCE_NAMES])
+
+    # FROM SERVER
+    # a settlement has been upgraded to a city
+    def Network_new_city(self, data):
+        self.game_board.new_city(data['settlement'])
+
+    # FROM SERVER
+    # the dice have been rolled and it is the client's turn to build, trade or end it
+    def Network_player_turn(self, data):
+        self.state = GameState.PLAYER_TURN
+        self.turn = data
+        print('Your turn: pick an action, or End Turn')
 
     # FROM SERVER
     # clients begin rolling dice
@@ -301,7 +373,7 @@ class CatanClient(ConnectionListener):
     # GAME STATE
     # the user needs to select a road
     def select_settlement(self, mouse_pos, mouse_click):
-        selection = self.game_board.select_settlement(mouse_pos)
+        selection = self.game_board.select_settlement(mouse_pos, self.legal)
         if mouse_click and selection is not None:
             # user has selected a settlement, send selection to server
             self.send({'action': 'select_settlement', 'settlement': selection})
@@ -309,7 +381,7 @@ class CatanClient(ConnectionListener):
     # GAME STATE
     # the user needs to select a road
     def select_road(self, mouse_pos, mouse_click):
-        selection = self.game_board.select_road(mouse_pos)
+        selection = self.game_board.select_road(mouse_pos, self.legal)
         if mouse_click and selection is not None:
             # user has selected a road, send selection to server
             self.send({'action': 'select_road', 'road': selection})
@@ -335,6 +407,68 @@ class CatanClient(ConnectionListener):
             # user wants to stop the dice
             self.send({'action': 'stop_dice'})
 
+    # GAME STATE
+    # the user picks what to do from the sidebar's actions
+    def player_turn(self, mouse_pos, mouse_click):
+        action = self.game_board.select_action(mouse_pos)
+        if not mouse_click or action is None:
+            return
+        if action == 'End Turn':
+            self.state = GameState.WAIT
+            self.send({'action': 'end_turn'})
+        elif action in BUILD_ACTIONS:
+            state, legal, message, key = BUILD_ACTIONS[action]
+            if self.turn[legal]:
+                self.state = state
+                self.legal = self.turn[legal]
+                self.building = message, key
+                print('Please select where to build, or click off the board to cancel')
+            else:
+                print('Nowhere to build that (or not enough resources)')
+        elif action == 'Trade':
+            if self.turn['trades']:
+                self.state = GameState.TRADE_GIVE
+                print('Please select a resource to give')
+            else:
+                print('Not enough of any resource to trade')
+
+    # GAME STATE
+    # the user needs to select where to build what they picked
+    def build(self, mouse_pos, mouse_click):
+        if self.state is GameState.BUILD_ROAD:
+            selection = self.game_board.select_road(mouse_pos, self.legal)
+        else:
+            selection = self.game_board.select_settlement(mouse_pos, self.legal)
+        if mouse_click:
+            # back to the actions either way; if the server takes the build it
+            # sends the new piece and a fresh player_turn
+            self.state = GameState.PLAYER_TURN
+            if selection is not None:
+                message, key = self.building
+                self.send({'action': message, key: selection})
+
+    # GAME STATE
+    # the user needs to select the resource to give the bank
+    def trade_give(self, mouse_pos, mouse_click):
+        selection = self.game_board.select_resource(mouse_pos, self.turn['trades'])
+        if mouse_click:
+            if selection is None:
+                self.state = GameState.PLAYER_TURN
+            else:
+                self.give = selection
+                self.state = GameState.TRADE_GET
+                print('Please select a resource to get for {}'.format(RESOURCE_NAMES[selection]))
+
+    # GAME STATE
+    # then the one to get for it
+    def trade_get(self, mouse_pos, mouse_click):
+        selection = self.game_board.select_resource(mouse_pos)
+        if mouse_click:
+            self.state = GameState.PLAYER_TURN
+            if selection is not None and selection != self.give:
+                self.send({'action': 'bank_trade', 'give': RESOURCE_NAMES[self.give],
+                           'get': RESOURCE_NAMES[selection]})
+
     def draw(self, screen):
         self.game_board.draw(screen)
 
@@ -360,7 +494,7 @@ class CatanClient(ConnectionListener):
     # if self.Pump() is called twice in a row events will occur twice,
     # which is bad. use this instead
     def pump(self):
-        connection.Pump()
+        self.connection.Pump()
         self.Pump()
 
 
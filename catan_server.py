@@ -1,13 +1,56 @@
 import PodSixNet.Server
 import PodSixNet.Channel
 
-from time import sleep
+from time import sleep, monotonic, perf_counter
 
-from game import Game
+from game import Game, GameState
+from game_registry import GameRegistry
+from journal import Journal, compact, live_records, replay
+from protocol import CompactChannelMixin, BATCH, CLIENT_TABLE, COMPACT, SERVER_TABLE
+from metrics import metrics
+from server_loop import EventLoop
+from sharding import RemoteGame, ShardRouter
 
 
-class ClientChannel(PodSixNet.Channel.Channel):
+class ClientChannel(CompactChannelMixin, PodSixNet.Channel.Channel):
     """The interface through which the server receives messages from the client"""
+    outgoing_table = SERVER_TABLE
+    incoming_table = CLIENT_TABLE
+
+    # queue the message in the outbox, and let the server know there is something to flush
+    def Send(self, data):
+        super().Send(data)
+        self._server.channel_sent(self)
+
+    def collect_incoming_data(self, data):
+        metrics.count('bytes_in', len(data))
+        super().collect_incoming_data(data)
+
+    # encode the outbox, counting what it adds to the send queue
+    def seal_outbox(self):
+        queued = len(self.sendqueue)
+        super().seal_outbox()
+        metrics.count('bytes_out', sum(len(outgoing) for outgoing in self.sendqueue[queued:]))
+
+    # time every Network_ handler (batches are timed message by message)
+    def dispatch(self, data):
+        action = data['action']
+        if action == BATCH:
+            super().dispatch(data)
+            return
+        start = perf_counter()
+        super().dispatch(data)
+        # actions without a handler share one histogram, so whatever a client
+        # sends can't add keys to the report
+        if not hasattr(self, 'Network_' + action):
+            action = 'unknown'
+        metrics.record('network.' + action, perf_counter() - start)
+
+    # the socket is about to go away (client hung up or errored out)
+    def close(self):
+        self._server.channel_closed(self)
+        PodSixNet.Channel.Channel.close(self)
+
     # when the user wants to validate their hosting / game preferences
     def Network_check_hosting(self, data):
         host = data['host']
@@ -38,34 +81,173 @@ class ClientChannel(PodSixNet.Channel.Channel):
         game_id = data['game_id']
         self._server.delegate_to_game(channel, game_id, 'stop_dice', data)
 
+    # the user wants to build something on their turn
+    def Network_build_road(self, data):
+        self._server.delegate_to_game(self, data['game_id'], 'build_road', data)
+
+    def Network_build_settlement(self, data):
+        self._server.delegate_to_game(self, data['game_id'], 'build_settlement', data)
+
+    def Network_build_city(self, data):
+        self._server.delegate_to_game(self, data['game_id'], 'build_city', data)
+
+    def Network_end_turn(self, data):
+        self._server.delegate_to_game(self, data['game_id'], 'end_turn', data)
+
+    def Network_bank_trade(self, data):
+        self._server.delegate_to_game(self, data['game_id'], 'bank_trade', data)
+
+    # the user is reconnecting to a game that was rebuilt after a restart
+    def Network_rejoin(self, data):
+        self._server.rejoin(self, data['game_id'], data['username'])
+
 
 class CatanServer(PodSixNet.Server.Server):
     """Server for hosting games of Catan"""
     channelClass = ClientChannel
     max_players = 6
+    eviction_interval = 30  # seconds between sweeps for idle / finished games
+    # wire formats offered to clients on top of PodSixNet dicts (see protocol.py)
+    protocols = [COMPACT, BATCH]
 
-    def __init__(self, host='localhost', port=4200):
+    def __init__(self, host='localhost', port=4200, shards=0, journal_path=None):
         print('Server started on ' + host + ' : ' + str(port))
-        PodSixNet.Server.Server.__init__(self, localaddr=(host, port))
+        # generous backlog so bursts of connecting clients aren't dropped
+        PodSixNet.Server.Server.__init__(self, localaddr=(host, port), listeners=1024)
 
         self.player_count = 0
         self.players = {}
 
-        self.games = []
+        # every live game by id, the queues of games waiting for players,
+        # and the bookkeeping needed to evict games nobody is playing anymore
+        self.games = GameRegistry()
+
+        # only set when running event-driven (see serve_forever)
+        self.loop = None
+
+        metrics.gauge('connected_channels', lambda: len(self.channels))
+        metrics.gauge('games', self.games.stats)
+        metrics.gauge('games_by_state', self.games_by_state)
+
+        # with shards, games are played in that many worker processes and this
+        # process only accepts connections, does matchmaking and relays messages
+        self.shards = ShardRouter(self, shards) if shards else None
+
+        # journal of accepted actions, used to rebuild games after a crash
+        self.journal = None
+        if journal_path is not None:
+            self.open_journal(journal_path)
 
     def Connected(self, channel, addr):
         print('New connection with {}'.format(channel))
         self.player_count += 1
-        channel.Send({'action': 'init'})
+        if self.loop is not None:
+            self.loop.register(channel)
+        channel.Send({'action': 'init', 'protocols': self.protocols})
+
+    # a channel has queued outgoing data
+    def channel_sent(self, channel):
+        if self.loop is not None:
+            self.loop.mark_dirty(channel)
+
+    # forget about a channel whose connection has been closed
+    def channel_closed(self, channel):
+        self.games.channel_closed(channel)
+        if self.shards is not None:
+            self.shards.forget_channel(channel)
+        if self.loop is not None:
+            self.loop.unregister(channel)
+        try:
+            self.channels.remove(channel)
+        except ValueError:
+            pass
+
+    # number of live games in each GameState. walks every game, so it is only
+    # evaluated when a metrics report is written
+    def games_by_state(self):
+        counts = {state.name.lower(): 0 for state in GameState}
+        for game in self.games.games.values():
+            counts[game.state.name.lower()] += 1
+        return counts
+
+    # write the metrics report to path every interval seconds
+    def dump_metrics_every(self, path, interval):
+        self.loop.call_every(interval, lambda: metrics.dump(path))
+
+    # run the server without polling: block until a socket is readable or a
+    # timer is due, so an idle server costs nothing per connection
+    def serve_forever(self, metrics_file=None, metrics_interval=10):
+        self.loop = EventLoop()
+        self.loop.register(self)
+        for channel in self.channels:
+            self.loop.register(channel)
+            self.loop.mark_dirty(channel)
+        if self.shards is not None:
+            self.shards.register(self.loop)
+            self.loop.call_every(self.shards.check_interval, self.shards.check_workers)
+        self.loop.call_every(self.eviction_interval, self.sweep_games)
+        if self.journal is not None:
+            self.loop.call_every(self.journal.commit_interval, self.journal.commit)
+        if metrics_file is not None:
+            self.dump_metrics_every(metrics_file, metrics_interval)
+        self.loop.run_forever()
+
+    # free finished, abandoned and idle games so memory doesn't grow with
+    # every game ever hosted
+    def sweep_games(self):
+        if self.games.evict_idle():
+            print('Evicted games: {}'.format(self.games.stats()))
 
-    # check all games for a game matching the supplied specifications
-    # returns a reference to the game if it matches the specs and isn't full
+    # rebuild the games left in an existing journal, then keep journaling to it
+    def open_journal(self, path):
+        if self.shards is not None:
+            raise ValueError('journaling is not supported with shards')
+        try:
+            compact(path)
+            game_records = live_records(path)
+        except FileNotFoundError:
+            game_records = {}
+        self.journal = Journal(path)
+        recovered = 0
+        for game_id, records in game_records.items():
+            try:
+                game = replay(game_id, records, Game)
+            except Exception as error:
+                # one bad game shouldn't keep the server from starting; end it in
+                # the journal so its id isn't handed to a new game on top of its records
+                print('Could not recover game {} from {}: {!r}'.format(game_id, path, error))
+                self.journal.end(game_id)
+                self.games.next_game_id = max(self.games.next_game_id, game_id + 1)
+                continue
+            game.attach_journal(self.journal, game_id, new=False)
+            self.games.restore_game(game_id, game)
+            recovered += 1
+        if recovered:
+            print('Recovered {} games from {}'.format(recovered, path))
+
+    # polling mode: also pick up whatever the shard workers have sent back
+    def Pump(self):
+        if self.shards is not None:
+            self.shards.poll()
+        PodSixNet.Server.Server.Pump(self)
+
+    # register a new game, handing it to a worker when sharded
+    def new_game(self, num_players, randomize):
+        if self.shards is None:
+            game = Game(num_players, randomize)
+            game_id = self.games.add_game(game)
+            if self.journal is not None:
+                game.attach_journal(self.journal, game_id)
+            return game_id
+        game = RemoteGame(num_players, randomize)
+        game_id = self.games.add_game(game)
+        self.shards.create(game_id, game)
+        return game_id
+
+    # find a game matching the supplied specifications that isn't full
+    # returns (game_id, game), or (None, None) if no such game exists
     def check_games(self, num_players, randomize):
-        for game in self.games:
-            if game.max_num_players == num_players and game.randomize == randomize:
-                if not game.is_full():
-                    return game
-        return None
+        return self.games.find_open(num_players, randomize)
 
     # respond to client about hosting / game preferences
     def check_hosting(self, host, channel, options):
@@ -76,15 +258,15 @@ class CatanServer(PodSixNet.Server.Server):
 
         # always accept a new host, as we can always make a new game
         elif host:
-            self.games.append(Game(options['num_players'], options['randomize']))
-            self.games[-1].add_player(channel)
+            game_id = self.new_game(options['num_players'], options['randomize'])
+            self.games.join(game_id, channel)
             channel.Send({'action': 'check_hosting', 'accepted': True,
-                          'game_id': len(self.games) - 1})
+                          'game_id': game_id})
 
         else:
             # this player is trying to join a game. check if a game of their
             # specification exists
-            game = self.check_games(options['num_players'], options['randomize'])
+            game_id, game = self.check_games(options['num_players'], options['randomize'])
             if game is None:
                 # no games met the specification, tell user to try again
                 channel.Send({'action': 'check_hosting', 'accepted': False,
@@ -93,28 +275,68 @@ class CatanServer(PodSixNet.Server.Server):
                 # there is a game for the user to join
                 # note that the game's # of active players increases
                 # so that their place in the game is reserved, but their
-                # actual player object (w/ username, color) hasn't been added yet
-                game.add_player(channel)
+                # actual player object (w/ username, color) hasn't been added yet.
+                # once the game is full it drops out of matchmaking
+                self.games.join(game_id, channel)
                 channel.Send({'action': 'check_hosting', 'accepted': True,
-                              'game_id': self.games.index(game)})
+                              'game_id': game_id})
+
+    # put a returning player back in their seat in a game rebuilt from the journal
+    def rejoin(self, channel, game_id, username):
+        game = self.games.get(game_id)
+        accepted = game is not None and game.rejoin(channel, username)
+        if accepted:
+            self.games.rejoined(game_id, channel)
+        channel.Send({'action': 'rejoin', 'accepted': accepted})
 
     # check if the user's desired username and color have already been taken
     def check_user_color(self, channel, game_id, data):
-        game = self.games[game_id]
-        game.handle_network(channel, 'check_user_color', data)
+        self.delegate_to_game(channel, game_id, 'check_user_color', data)
 
     # to handle user input when the game has already been set up
     def delegate_to_game(self, channel, game_id, action, data):
-        try:
-            game = self.games[game_id]
-            game.handle_network(channel, action, data)
-        except IndexError:
-            # the user sent a faulty game id, so ignore this
+        game = self.games.get(game_id)
+        if game is None:
+            # the user sent a faulty game id (or the game has been evicted), so ignore this
             return
+        game.handle_network(channel, action, data)
+        self.games.touch(game_id)
 
 
 if __name__ == '__main__':
-    server = CatanServer()
-    while True:
-        server.Pump()
-        sleep(0.01)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Host games of Catan')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=4200)
+    parser.add_argument('--shards', type=int, default=0,
+                        help='number of worker processes to play games in (0: play them here)')
+    parser.add_argument('--journal', default=None,
+                        help='journal games to this file, and rebuild the games left in it on startup')
+    parser.add_argument('--metrics-file', default=None,
+                        help='periodically write handler latencies, byte counts and game counts here')
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help='seconds between metrics reports')
+    parser.add_argument('--poll', action='store_true',
+                        help='use the old fixed-rate polling loop instead of the event loop')
+    args = parser.parse_args()
+
+    if args.journal and args.shards:
+        parser.error('--journal can not be combined with --shards')
+    server = CatanServer(args.host, args.port, args.shards, args.journal)
+    if args.poll:
+        # the old fixed-rate polling loop, kept for debugging
+        last_sweep = last_dump = monotonic()
+        while True:
+            server.Pump()
+            if server.journal is not None:
+                server.journal.commit()
+            if monotonic() - last_sweep > server.eviction_interval:
+                server.sweep_games()
+                last_sweep = monotonic()
+            if args.metrics_file and monotonic() - last_dump > args.metrics_interval:
+                metrics.dump(args.metrics_file)
+                last_dump = monotonic()
+            sleep(0.01)
+    else:
+        server.serve_forever(args.metrics_file, args.metrics_interval)
@@ -0,0 +1,64 @@
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The dice of a game: every roll comes from one seeded stream, so a game's
+# rolls can be played again from its seed alone. Rolls are drawn a block at a
+# time (with NumPy when it's installed), so handing one out is a list index,
+# and whole arrays of rolls can be taken at once for simulations.
+#
+# Faces are 0 - 5, like rules.ROLL moves and the client's Dice. The stream is
+# the same however it is taken (one roll at a time, in blocks or mixed), as
+# long as the same seed is used with the same backend: with NumPy, faces are
+# drawn as int64, which draws the same values in one call or in several.
+
+BLOCK_SIZE = 1024
+
+
+class DiceStream:
+    """Both dice of every roll, in order, from seed. seed is picked at random
+    if not given, and kept so the stream can be made again"""
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        self.seed = seed
+        self.block_size = block_size
+        self.rng = random.Random(seed) if np is None else np.random.default_rng(seed)
+        self.rolled = 0  # rolls taken so far
+        self.block = []  # (left, right) rolls drawn but not taken yet
+        self.position = 0
+
+    # the next roll, as (left face, right face)
+    def next_roll(self):
+        if self.position == len(self.block):
+            self.block = self.draw(self.block_size)
+            if np is not None:
+                self.block = self.block.tolist()
+            self.position = 0
+        roll = self.block[self.position]
+        self.position += 1
+        self.rolled += 1
+        return roll
+
+    # the next count rolls at once, as a (count, 2) array of faces with NumPy
+    # (a list of [left, right] without)
+    def rolls(self, count):
+        rest = self.block[self.position:self.position + count]
+        self.position += len(rest)
+        self.rolled += count
+        if np is None:
+            return rest + self.draw(count - len(rest))
+        return np.concatenate([np.array(rest, np.int64).reshape(-1, 2), self.draw(count - len(rest))])
+
+    # count new rolls from the generator
+    def draw(self, count):
+        if np is None:
+            return [[self.rng.randrange(6), self.rng.randrange(6)] for i in range(count)]
+        return self.rng.integers(0, 6, (count, 2), np.int64)
+
+    # take count rolls without looking at them, e.g. to catch up with a replayed game
+    def skip(self, count):
+        self.rolls(count)
@@ -1,73 +1,196 @@
-from hex_board import HexBoard
-from enum import Enum
-from player import ServerPlayer
-from hex import HexType
-
-from time import sleep
-import random
-
-# represents the different states that the game can be in
-class GameState(Enum):
-    PLAYER_SETUP = 0
-    SETTLEMENT_SETUP = 1
-    NEW_TURN = 2
-    GET_CARDS = 3
-    GET_TILE = 4
-    GET_PLAYER = 5
-    PLAYER_TURN = 6
-    ROLL_DICE = 7
-    TRADE_MESSAGE = 8
-    END_GAME = 9
+from resources import HEX_RESOURCE, RESOURCE_NAMES
+from rules import (BANK_TRADE, BUILD_CITY, BUILD_ROAD, BUILD_SETTLEMENT, END_TURN, ROAD, ROLL, SETTLE,
+                   GameState, Rules)
+from opening import best_openings
+from metrics import metrics
 
+from time import sleep, perf_counter
+
+# the message asking for each kind of move, and what it is called in 'invalid' replies
+MOVE_ACTIONS = {'select_settlement': (SETTLE, 'settlement'), 'select_road': (ROAD, 'road'),
+                'build_road': (BUILD_ROAD, 'road'), 'build_settlement': (BUILD_SETTLEMENT, 'settlement'),
+                'build_city': (BUILD_CITY, 'settlement')}
+INVALID_MESSAGES = {kind: message for kind, message in MOVE_ACTIONS.values()}
+INVALID_MESSAGES[BANK_TRADE] = 'trade'
 
-# each game will depend on the specifications of the initial host
-class Game:
-    """An individual game of Catan to be played be some number of users"""
-    def __init__(self, max_num_players, randomize):
-        # the number of players that must be in the game before it starts
-        self.max_num_players = max_num_players
 
-        self.randomize = randomize
+# each game will depend on the specifications of the initial host
+class Game(Rules):
+    """An individual game of Catan to be played be some number of users. The
+    rules live in Rules; this turns players' messages into moves and tells
+    everyone what happened"""
+    def __init__(self, max_num_players, randomize, layout=None, roll_nums=None, dice_seed=None):
+        super().__init__(max_num_players, randomize, layout, roll_nums, dice_seed)
 
         # number of players currently connected to this game
         self.num_active_players = 0
-        # mechanism to access all players connected to this game
-        self.players = []
 
-        self.hex_board = HexBoard(randomize)
-
-        self.state = GameState.PLAYER_SETUP
-        self.cur_player = None  # whose turn is it?
-
-        # for visibility, define the fields which are going to be used only
-        # in the context of the various state functions
-        # used in SETTLEMENT_SETUP:
-        self.select_settlement = None
-        self.second_round = None
+        # set by attach_journal, when accepted actions should be journaled
+        self.game_id = None
+        self.journal = None
 
         # used in PLAYER_TURN
         self.finish_dice_roll = False
 
-        self.state_methods = {GameState.PLAYER_SETUP: self.add_player_info,
-                              GameState.SETTLEMENT_SETUP: self.initial_setup,
-                              GameState.PLAYER_TURN: self.player_turn,
-                              GameState.ROLL_DICE: self.roll_dice}
-
     # handles incoming messages / actions from players
     def handle_network(self, channel, action_name, data):
         player = self.get_player(channel)
-        if player is not None:
-            # the player who sent this is actually in the game
-            self.state_methods[self.state](player, action_name, data)
+        if player is None:
+            # whoever sent this isn't in the game
+            return
+        start = perf_counter()
+        if self.state is GameState.PLAYER_SETUP:
+            self.add_player_info(player, action_name, data)
+            metrics.record('game.add_player_info', perf_counter() - start)
+            return
+        if player is not self.cur_player:
+            return
+        move = self.move_for(action_name, data)
+        if move is None:
+            return
+        if self.is_legal(move):
+            self.play(move)
+        elif move[0] in self.move_kinds() and move[0] in INVALID_MESSAGES:
+            # user is apparently unable to select something correctly
+            player.send({'action': 'invalid', 'message': INVALID_MESSAGES[move[0]]})
+        metrics.record('game.' + move[0], perf_counter() - start)
+
+    # the move a client's message asks for, or None if it isn't one
+    def move_for(self, action_name, data):
+        if action_name == 'stop_dice':
+            # a roll is drawn from the game's dice only when it will be accepted,
+            # so the dice stay in step with the journal
+            if self.state is not GameState.ROLL_DICE:
+                return None
+            return self.roll_dice()
+        if action_name == 'end_turn':
+            return END_TURN,
+        if action_name == 'bank_trade':
+            try:
+                return BANK_TRADE, RESOURCE_NAMES.index(data['give']), RESOURCE_NAMES.index(data['get'])
+            except (KeyError, ValueError):
+                # user sent a faulty message, ignore
+                return None
+        if action_name in MOVE_ACTIONS:
+            kind, key = MOVE_ACTIONS[action_name]
+            try:
+                return kind, data[key]
+            except KeyError:
+                # user sent a faulty message, ignore
+                return None
+        return None
+
+    # make an accepted move, journal it and tell the players about it
+    def play(self, move):
+        player = self.cur_player
+        changes = self.apply(move)
+        # the server never takes a move back
+        self.undo_stack.clear()
+        if self.journal is not None:
+            self.journal.move(self.game_id, player.seat, move)
+
+        kind = move[0]
+        if kind in (SETTLE, BUILD_SETTLEMENT):
+            self.new_settlement(move[1], player)
+            if self.hex_board.node_port_rates[move[1]] is not None:
+                self.message_trade_rates(player)
+        elif kind in (ROAD, BUILD_ROAD):
+            self.new_road(move[1], player)
+        elif kind == BUILD_CITY:
+            self.new_city(move[1], player)
+        elif kind == ROLL:
+            self.broadcast_dice_result(move[1], move[2])
+        for changed in changes:
+            self.message_update_resources(changed)
+
+        if kind == SETTLE:
+            # change client state
+            self.send_select_road(player)
+        elif kind == ROAD:
+            if self.state is GameState.ROLL_DICE:
+                self.broadcast_roll_dice(self.cur_player.username)
+            elif player is self.players[-1]:
+                # around again for the second settlements / roads
+                self.send_select_settlement(self.cur_player)
+            else:
+                self.broadcast_wait()
+                self.send_select_settlement(self.cur_player)
+        elif kind == END_TURN:
+            self.broadcast_roll_dice(self.cur_player.username)
+        elif self.state is GameState.PLAYER_TURN:
+            # after a roll, build or trade the player carries on with what they can do now
+            self.send_player_turn(player)
+
+    # drop the game's players and board once the server is done with it,
+    # so that they can be freed even if something still refers to the game
+    def release(self):
+        self.end_journal()
+        self.players = []
+        self.cur_player = None
+        self.hex_board = None
+
+    # the game is over for good (finished or aborted), so it won't be rebuilt after a crash
+    def end_journal(self):
+        if self.journal is not None:
+            self.journal.end(self.game_id)
+            self.journal = None
+
+    # record this game's accepted actions in the journal from now on. new
+    # games start with their board; games rebuilt from the journal already have one
+    def attach_journal(self, journal, game_id, new=True):
+        self.journal = journal
+        self.game_id = game_id
+        if new:
+            journal.create(game_id, self.max_num_players, self.randomize, self.hex_board.layout())
+            journal.numbers(game_id, self.hex_board.serialize_numbers())
+            journal.dice_seed(game_id, self.dice.seed)
+
+    # a player of a game rebuilt from the journal is back on a new channel.
+    # returns False if there is no disconnected player with that username
+    def rejoin(self, channel, username):
+        for player in self.players:
+            if player.username == username and not player.connected:
+                player.channel = channel
+                player.connected = True
+                self.resend_game(player)
+                return True
+        return False
+
+    # bring a rejoining player's client up to date with the board and whose turn it is
+    def resend_game(self, player):
+        player.send({'action': 'game_board', 'layout': self.hex_board.serialize_types(),
+                     'numbers': self.hex_board.serialize_numbers()})
+        player.send({'action': 'current_players',
+                     'players': [{'username': other.username, 'color': other.color}
+                                 for other in self.players if other is not player]})
+        for index, owner in enumerate(self.hex_board.node_owner):
+            if owner is not None:
+                player.send({'action': 'new_settlement', 'settlement': index, 'color': owner.color})
+                if self.hex_board.node_city[index]:
+                    player.send({'action': 'new_city', 'settlement': index, 'color': owner.color})
+        for index, owner in enumerate(self.hex_board.road_owner):
+            if owner is not None:
+                player.send({'action': 'new_road', 'road': index, 'color': owner.color})
+        self.message_update_resources(player)
+        self.message_trade_rates(player)
+        if self.cur_player is None:
+            return
+        if player is not self.cur_player:
+            player.send({'action': 'wait', 'cur_player': self.cur_player.username})
+        elif self.state is GameState.SETTLEMENT_SETUP:
+            if self.select_settlement:
+                self.send_select_settlement(player)
+            else:
+                self.send_select_road(player)
+        elif self.state is GameState.ROLL_DICE:
+            player.send({'action': 'roll_dice'})
+        elif self.state is GameState.PLAYER_TURN:
+            self.send_player_turn(player)
 
     # add a player into this game
     def add_player(self, player_channel):
         self.num_active_players += 1
-
-        # now actually add the player
-        self.players.append(ServerPlayer(player_channel))
-
-    # following methods are called based on the game state
+        return super().add_player(player_channel)
 
     # to add player username and color info
     # called when in the PLAYER_SETUP state
@@ -75,8 +198,11 @@ class Game:
         try:
             username = data['username']
             color = data['color']
-        except IndexError:
-            pass
+        except KeyError:
+            # a malformed request: turn it down rather than name the player None
+            new_player.send({'action': 'check_user_color', 'accept_username': False,
+                             'accept_color': False})
+            return
 
         valid_username = self.validate_username(username)
         valid_color = self.validate_color(color)
@@ -85,10 +211,12 @@ class Game:
             # new player is ready to be added
             new_player.username = username
             new_player.color = color
+            if self.journal is not None:
+                self.journal.player(self.game_id, new_player.seat, username, color)
 
             # give new player the game board setup
-            new_player.send({'action': 'game_board',
-                             'layout': self.hex_board.serialize_types()})
+            new_player.send({'action': 'game_board', 'layout': self.hex_board.serialize_types(),
+                             'numbers': self.hex_board.serialize_numbers()})
 
             # when a player is added to the game, the should first inform the incoming player
             # of all players already connected. Then all already-connected players should
@@ -111,89 +239,12 @@ class Game:
         # this might be the last player to have their info accepted
         # check if it is time to go to the next state and actually start the game
         if self.game_ready():
-            self.state = GameState.SETTLEMENT_SETUP
-            # following 2 fields will be used by SETTLEMENT_SETUP's state function
-            self.select_settlement = True
-            self.second_round = False
-            self.cur_player = self.players[0]
+            self.start()
             # tell the first player that they need to select a settlement
-            self.cur_player.send({'action': 'select_settlement'})
+            self.send_select_settlement(self.cur_player)
             # tell everyone else to wait
             self.broadcast_wait()
 
-    # handles users' initial settlement and road setup
-    # called when in the SETTLEMENT_SETUP state
-    def initial_setup(self, player, action, data):
-        if player is self.cur_player:
-            if action == 'select_settlement' and self.select_settlement:
-                # user is trying to select a first / second settlement
-                try:
-                    settlement_index = data['settlement']
-                except KeyError:
-                    # user sent a faulty message, ignore
-                    return
-                if self.hex_board.valid_settlement(settlement_index):
-                    # valid settlement selection, update record and notify players
-
-                    # per Catan rules give the player one of each resource
-                    # their selected node borders
-                    selected_node = self.hex_board.nodes[settlement_index]
-                    player.modify_resources(self.resources_around_node(selected_node))
-                    print(player.resources)
-
-                    self.hex_board.settle(settlement_index, player)
-                    self.new_settlement(settlement_index, player)
-                    # change client state
-                    player.send({'action': 'select_road'})
-                    self.select_settlement = False
-                else:
-                    # user is apparently unable to select a correct settlement
-                    player.send({'action': 'invalid', 'message': 'settlement'})
-            elif action == 'select_road' and not self.select_settlement:
-                # the user is trying to select a road
-                try:
-                    road_index = data['road']
-                except KeyError:
-                    # user sent a faulty message, ignore
-                    return
-                if self.hex_board.valid_road(road_index, player):
-                    # the player has managed, against all odds, to pick a road correctly
-                    self.hex_board.set_road(road_index, player)
-                    self.new_road(road_index, player)
-
-                    # if this was the last player in the list and we have already
-                    # gone through this process once, move to the next stage of the
-                    # game (i.e. actual turns)
-                    self.cur_player = self.get_next_player()
-                    self.select_settlement = True
-                    if player is self.players[-1]:
-                        if self.second_round:
-                            # CHANGE STATE -- PLAYER_TURN
-                            self.state = GameState.ROLL_DICE
-                            self.broadcast_roll_dice(self.cur_player.username)
-
-                        else:
-                            # go around again picking settlements / roads
-                            self.second_round = True
-                            self.cur_player.send({'action': 'select_settlement'})
-                    else:
-                        self.broadcast_wait()
-                        self.cur_player.send({'action': 'select_settlement'})
-                else:
-                    player.send({'action': 'invalid', 'message': 'road'})
-
-
-    # GAME STATE
-    # waiting for the current player to stop the dice from rolling
-    def roll_dice(self, player, action, data):
-        if player is self.cur_player:
-            left = random.randint(0, 6)
-            right = random.randint(0, 6)
-            self.broadcast_dice_result(left, right) 
-
-    def player_turn(self, player, action, data):
-        pass
-
     # checks if the game is ready to start, i.e. if the game is full and
     # all players have their username and color
     def game_ready(self):
@@ -228,15 +279,6 @@ class Game:
                 return player
         return None
 
-    # get the next player in the rotation from the current player
-    # tries to get the next in line, if that fails the array has been stepped out
-    # of, so go back to the beginning
-    def get_next_player(self):
-        try:
-            return self.players[self.players.index(self.cur_player) + 1]
-        except IndexError:
-            return self.players[0]
-
     # sends the wait message to all players besides the current player
     def broadcast_wait(self):
         for player in self.players:
@@ -244,6 +286,24 @@ class Game:
                 player.send({'action': 'wait', 'cur_player': self.cur_player.username})
 
 
+    # ask the player to pick a settlement / road, with every legal choice so the
+    # client only has to offer those. settlements are listed best opening first
+    def send_select_settlement(self, player):
+        player.send({'action': 'select_settlement', 'legal': best_openings(self.hex_board)})
+
+    def send_select_road(self, player):
+        player.send({'action': 'select_road', 'legal': self.hex_board.legal_road_indices(player)})
+
+    # tell the player whose turn it is what they can build and which resources
+    # they can trade to the bank, so the client only has to offer those
+    def send_player_turn(self, player):
+        moves = self.legal_moves()
+        player.send({'action': 'player_turn',
+                     'roads': [move[1] for move in moves if move[0] == BUILD_ROAD],
+                     'settlements': [move[1] for move in moves if move[0] == BUILD_SETTLEMENT],
+                     'cities': [move[1] for move in moves if move[0] == BUILD_CITY],
+                     'trades': sorted({move[1] for move in moves if move[0] == BANK_TRADE})})
+
     # announce that the dice should begin rolling animation
     def broadcast_roll_dice(self, roller):
         for player in self.players:
@@ -258,28 +318,17 @@ class Game:
 
     # sends the player's client the player's updated resources to be displayed on their screen
     def message_update_resources(self, player):
-        player.send({'action': 'update_resources', 'resources': player.resources})
+        player.send({'action': 'update_resources', 'resources': player.resources.as_dict()})
+
+    # sends the player's client how many of each resource the bank takes from them for one other
+    def message_trade_rates(self, player):
+        player.send({'action': 'trade_rates',
+                     'rates': dict(zip(RESOURCE_NAMES, self.hex_board.trade_rates(player)))})
 
     # takes a hextype as an enum and converts it to its proper string form
     def hextype_to_string(self, enum):
-        conversions = {HexType.FOREST: 'wood', HexType.SHEEP: 'sheep', HexType.WHEAT: 'wheat',
-                       HexType.MOUNTAIN: 'ore', HexType.REDDISH_ORANGE: 'reddish-orange', HexType.CACTUS: None}
-        return conversions[enum] 
-
-    # get the resources from the hexes adjacent to the the node and put them into a format
-    # that can be processed by the Player class, i.e. {'resource-name': number of resource}
-    def resources_around_node(self, node):
-        new_resources = {}
-        for hex in node.hexes:
-            resource = self.hextype_to_string(hex.type)
-            if resource:
-                try:
-                    new_resources[resource] += 1
-                except KeyError:
-                    # resource not there yet; needs to be created
-                    new_resources[resource] = 1
-
-        return new_resources
+        resource = HEX_RESOURCE[enum]
+        return None if resource is None else RESOURCE_NAMES[resource]
 
     # update the clients on a new settlement
     def new_settlement(self, settlement, owner):
@@ -291,3 +340,8 @@ class Game:
     def new_road(self, road, owner):
         for player in self.players:
             player.send({'action': 'new_road', 'road': road, 'color': owner.color})
+
+    # update the clients on a settlement becoming a city
+    def new_city(self, settlement, owner):
+        for player in self.players:
+            player.send({'action': 'new_city', 'settlement': settlement, 'color': owner.color})
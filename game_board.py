@@ -1,6 +1,7 @@
 import pygame
 
 from common import *
+from board_topology import topology_for_players
 from die import Dice
 from hex_board import GameHexBoard
 from player import OtherPlayerView
@@ -131,6 +132,8 @@ class SideBar:
         self.cur_top += self.large_font_height
         actions.append(SelectableText(self.large_font, 'Trade', SideBar.normal_text_color, SideBar.x, self.cur_top))
         self.cur_top += self.large_font_height
+        actions.append(SelectableText(self.large_font, 'End Turn', SideBar.normal_text_color, SideBar.x, self.cur_top))
+        self.cur_top += self.large_font_height
         return actions
 
     # add a player and their associated info to the sidebar under the Players section
@@ -142,19 +145,26 @@ class SideBar:
 
     # select among players
     def select_player(self, mouse_pos):
-        self.select_common(self.players, mouse_pos)
+        return self.select_common(self.players, mouse_pos)
 
-    # select among resources
-    def select_resource(self, mouse_pos):
-        self.select_common(self.resources.resources, mouse_pos)
+    # select among resources (only the rows listed in legal, by resource order, if given)
+    def select_resource(self, mouse_pos, legal=None):
+        rows = self.resources.resources
+        candidates = rows if legal is None else [rows[i] for i in legal]
+        selection = self.select_common(candidates, mouse_pos)
+        if selection:
+            # what gets selected is the row's text
+            return [row.text for row in rows].index(selection)
 
     # select among development cards
     def select_card(self, mouse_pos):
-        self.select_common(self.cards, mouse_pos)
+        return self.select_common(self.cards, mouse_pos)
 
-    # select among player actions
+    # select among player actions. returns the action's text, e.g. 'End Turn'
     def select_action(self, mouse_pos):
-        self.select_common(self.actions, mouse_pos)
+        selection = self.select_common(self.actions, mouse_pos)
+        if selection:
+            return selection.text
 
     # utility for selection
     # if the mouse is between 2 text items, they will both try to be highlighted
@@ -175,7 +185,13 @@ class SideBar:
             # 2 (possibly more, but I hope this is not possible) possible selections
             selected[0].select()
             for item in selected[1:]:
-                item.deselect()        
+                item.deselect()
+
+        # return the selection
+        try:
+            return selected[0]
+        except IndexError:
+            return None
 
     def deselect(self, category):
         for item in category:
@@ -202,24 +218,39 @@ class SideBar:
 
 class GameBoard:
     """Represents everything to be drawn to the screen"""
-    def __init__(self, hex_board_x, hex_board_y, layout, num_players, dice_y=80):
-        self.hex_board = GameHexBoard(hex_board_x, hex_board_y, layout)
+    def __init__(self, hex_board_x, hex_board_y, layout, num_players, dice_y=80, numbers=None):
+        self.hex_board = GameHexBoard(hex_board_x, hex_board_y, layout, numbers, topology_for_players(num_players))
         self.dice = Dice(self.hex_board.center_x(), dice_y)
         self.sidebar = SideBar(num_players)
 
-    def select_settlement(self, mouse_pos):
-        return self.hex_board.select_settlement(mouse_pos)
+    def select_settlement(self, mouse_pos, legal=None):
+        return self.hex_board.select_settlement(mouse_pos, legal)
 
-    def select_road(self, mouse_pos):
-        return self.hex_board.select_road(mouse_pos)
+    def select_road(self, mouse_pos, legal=None):
+        return self.hex_board.select_road(mouse_pos, legal)
 
     def select_hex(self, mouse_pos):
         return self.hex_board.select_hex(mouse_pos)
 
+    def select_action(self, mouse_pos):
+        return self.sidebar.select_action(mouse_pos)
+
+    def select_resource(self, mouse_pos, legal=None):
+        return self.sidebar.select_resource(mouse_pos, legal)
+
+    # show the user's own resources, a count per resource in resource order
+    def update_resources(self, counts):
+        for row, count in zip(self.sidebar.resources.resources, counts):
+            row.update(count)
+
     # color the node representing a new settlement
     def new_settlement(self, settlement_index, color):
         self.hex_board.nodes[settlement_index].settle(color)
 
+    # a settlement has become a city
+    def new_city(self, settlement_index):
+        self.hex_board.nodes[settlement_index].build_city()
+
     # color the road representing a new road
     def new_road(self, road_index, color):
         self.hex_board.roads[road_index].color = color
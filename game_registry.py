@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from enum import Enum
+from time import monotonic
+
+from game import GameState
+from matchmaking import MatchmakingIndex
+
+
+class GameStatus(Enum):
+    """Where a game is in its life on the server"""
+    LOBBY = 0  # waiting for players / usernames and colors
+    RUNNING = 1  # actually being played
+    ENDED = 2  # finished or abandoned, waiting to be evicted
+
+
+# how long (in seconds) a game may sit without any activity in each status
+# before it is evicted
+DEFAULT_TIMEOUTS = {GameStatus.LOBBY: 10 * 60,
+                    GameStatus.RUNNING: 30 * 60,
+                    GameStatus.ENDED: 0}
+
+
+class GameRegistry(MatchmakingIndex):
+    """Every live game on the server, with its status, last activity and eviction"""
+    def __init__(self, timeouts=None):
+        super().__init__()
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts is not None:
+            self.timeouts.update(timeouts)
+
+        self.status = {}  # game_id -> GameStatus
+        # one dict per status, game_id -> time of last activity, kept in order of
+        # last activity so that eviction only ever looks at the stalest games
+        self.last_active = {status: OrderedDict() for status in GameStatus}
+
+        # which game each connected player is in, so a hang-up can be traced to its game
+        self.channel_games = {}
+
+        self.evicted = 0
+
+    def add_game(self, game):
+        game_id = super().add_game(game)
+        self.status[game_id] = GameStatus.LOBBY
+        self.last_active[GameStatus.LOBBY][game_id] = monotonic()
+        return game_id
+
+    # put back a game rebuilt from the journal under its old id
+    def restore_game(self, game_id, game):
+        self.games[game_id] = game
+        self.next_game_id = max(self.next_game_id, game_id + 1)
+        if not game.is_full():
+            self.queue_for(game.max_num_players, game.randomize).append(game_id)
+        self.status[game_id] = GameStatus.LOBBY
+        self.last_active[GameStatus.LOBBY][game_id] = monotonic()
+        self.touch(game_id)
+
+    # a player has come back to a rebuilt game on a new channel
+    def rejoined(self, game_id, channel):
+        self.channel_games[channel] = game_id
+        self.touch(game_id)
+
+    def join(self, game_id, channel):
+        game = super().join(game_id, channel)
+        self.channel_games[channel] = game_id
+        self.touch(game_id)
+        return game
+
+    # record activity on a game and move it to the status its state implies
+    def touch(self, game_id):
+        status = self.status.get(game_id)
+        if status is None:
+            return
+        game = self.games[game_id]
+        if status is not GameStatus.ENDED:
+            if game.state is GameState.END_GAME:
+                status = GameStatus.ENDED
+            elif game.state is not GameState.PLAYER_SETUP:
+                status = GameStatus.RUNNING
+        self.set_status(game_id, status)
+
+    # a lobby game that lost a player can never fill up; nobody else should be
+    # matched into it. its id is dropped from the queue once find_open reaches it
+    def listed(self, game_id):
+        return game_id in self.games and self.status[game_id] is not GameStatus.ENDED
+
+    def set_status(self, game_id, status):
+        del self.last_active[self.status[game_id]][game_id]
+        self.status[game_id] = status
+        self.last_active[status][game_id] = monotonic()
+
+    # a player hung up. whatever game they were in can no longer be finished,
+    # so end it and let everyone else know
+    def channel_closed(self, channel):
+        game_id = self.channel_games.pop(channel, None)
+        if game_id is not None:
+            self.abort(game_id, 'a player disconnected')
+
+    # end a game that can't go on, letting its remaining players know why
+    def abort(self, game_id, reason):
+        if self.status.get(game_id) in (None, GameStatus.ENDED):
+            return
+        self.set_status(game_id, GameStatus.ENDED)
+        game = self.games[game_id]
+        # nothing more of it needs recovering after a crash
+        game.end_journal()
+        self.notify_aborted(game, reason)
+
+    def notify_aborted(self, game, reason):
+        for player in game.players:
+            if player.channel in self.channel_games:
+                player.send({'action': 'game_aborted', 'message': reason})
+
+    # evict every game that has been idle for longer than its status allows
+    # returns the number of games evicted
+    def evict_idle(self, now=None):
+        if now is None:
+            now = monotonic()
+        count = 0
+        for status, timeout in self.timeouts.items():
+            active = self.last_active[status]
+            while active:
+                game_id, last_active = next(iter(active.items()))
+                if now - last_active < timeout:
+                    # everything after this one is more recent
+                    break
+                if status is not GameStatus.ENDED:
+                    self.notify_aborted(self.games[game_id], 'the game timed out')
+                self.evict(game_id)
+                count += 1
+        return count
+
+    # drop every reference the server holds to a game so that it, its players
+    # and its HexBoard can be freed
+    def evict(self, game_id):
+        game = self.remove_game(game_id)
+        if game is None:
+            return
+        del self.last_active[self.status.pop(game_id)][game_id]
+        for player in game.players:
+            if self.channel_games.get(player.channel) == game_id:
+                del self.channel_games[player.channel]
+        game.release()
+        self.evicted += 1
+
+    # live / evicted counts, for logging
+    def stats(self):
+        stats = {status.name.lower(): len(self.last_active[status]) for status in GameStatus}
+        stats['live'] = len(self.games)
+        stats['evicted'] = self.evicted
+        return stats
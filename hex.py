@@ -22,28 +22,12 @@ class HexType(Enum):
     UNDEFINED = BLACK
 
 
-# for server use. for client representation of a hex, see below
-class Hex:
-    """A Catan Hexagon, with associated nodes"""
-    def __init__(self, nodes):
-        self.nodes = nodes
-        self.type = HexType.UNDEFINED
-        self.roll_num = None  # will be set for all Hexes except CACTUS tile
-
-    def set_type(self, hex_type):
-        self.type = hex_type
-
-    # set the number which must be rolled to collect resources from this hex
-    def set_roll_num(self, num):
-        self.roll_num = num
-
-
 FREQUENCY_CIRCLE_RADIUS = 2
 
 SETTLEMENT_CIRCLE_RADIUS = 12  # how large a settlement appears on the board
 
 
-# for client use. for server representation of a hex, see above
+# for client use. the server keeps hex types and roll numbers in HexBoard (see hex_board.py)
 class GameHex:
     """Hexagonal tile to be displayed on board"""
 
@@ -1,107 +1,15 @@
 import pygame
 
+from functools import lru_cache
 from math import ceil, sqrt
-from node import Node, GameNode
-from road import Road, GameRoad
-from hex import Hex, HexType, GameHex
+from node import GameNode
+from road import GameRoad
+from hex import HexType, GameHex
 from random import sample
-from player import ServerPlayer
-
-# which nodes are connected by roads
-ROAD_NODES_INDICES = [[0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 0],
-                      [6, 7], [7, 0], [5, 8], [8, 9], [9, 6], [10, 11],
-                      [11, 6], [9, 12], [12, 13], [13, 10], [3, 14],
-                      [14, 15], [15, 16], [16, 17], [17, 4], [17, 18],
-                      [18, 19], [8, 19], [19, 20], [20, 21], [22, 13],
-                      [12, 21], [21, 23], [23, 24], [24, 22], [15, 25],
-                      [25, 26], [26, 27], [27, 28], [28, 16], [28, 29],
-                      [29, 30], [30, 18], [30, 31], [31, 32], [32, 20],
-                      [32, 33], [33, 34], [34, 23], [35, 24], [34, 36],
-                      [36, 37], [37, 35], [27, 38], [38, 39], [39, 40],
-                      [40, 29], [40, 41], [41, 42], [42, 31], [42, 43],
-                      [43, 44], [44, 33], [44, 45], [45, 46], [46, 36],
-                      [39, 47], [47, 48], [48, 49], [49, 41], [49, 50],
-                      [50, 51], [51, 43], [51, 52], [52, 53], [53, 45]]
-
-# describes the nodes relative to each node
-NODE_NEIGHBOR_INDICES = [[1, 5, 7],
-                         [0, 2],
-                         [1, 3],
-                         [2, 4, 14],
-                         [3, 5, 17],
-                         [0, 4, 8],
-                         [7, 9, 11],
-                         [0, 6],
-                         [5, 9, 19],
-                         [6, 8, 12],
-                         [11, 13],
-                         [6, 10],
-                         [9, 13, 21],
-                         [10, 12, 22],
-                         [3, 15],
-                         [14, 16, 25],
-                         [15, 17, 28],
-                         [4, 16, 18],
-                         [17, 19, 30],
-                         [8, 18, 20],
-                         [19, 21, 32],
-                         [12, 20, 23],
-                         [13, 24],
-                         [21, 24, 34],
-                         [22, 23, 35],
-                         [15, 26],
-                         [25, 27],
-                         [26, 28, 38],
-                         [16, 27, 29],
-                         [28, 30, 40],
-                         [18, 29, 31],
-                         [30, 32, 42],
-                         [20, 31, 33],
-                         [32, 34, 44],
-                         [23, 33, 36],
-                         [24, 37],
-                         [34, 37, 46],
-                         [35, 36],
-                         [27, 39],
-                         [38, 40, 47],
-                         [29, 39, 41],
-                         [40, 42, 49],
-                         [31, 41, 43],
-                         [42, 44, 51],
-                         [33, 43, 45],
-                         [44, 46, 53],
-                         [36, 45],
-                         [39, 48],
-                         [47, 49],
-                         [41, 48, 50],
-                         [49, 51],
-                         [43, 50, 52],
-                         [51, 53],
-                         [45, 52]]
-
-NUM_NODES = 54
-
-# node setup (this is ugly, try not to pay it any attention)
-# which nodes go to which Hex tiles (via index into main node list)
-NODE_INDICES_TO_HEX = [[0, 1, 2, 3, 4, 5],
-                        [6, 7, 0, 5, 8, 9],
-                        [10, 11, 6, 9, 12, 13],
-                        [4, 3, 14, 15, 16, 17],
-                        [8, 5, 4, 17, 18, 19],
-                        [12, 9, 8, 19, 20, 21],
-                        [22, 13, 12, 21, 23, 24],
-                        [16, 15, 25, 26, 27, 28],
-                        [18, 17, 16, 28, 29, 30],
-                        [20, 19, 18, 30, 31, 32],
-                        [23, 21, 20, 32, 33, 34],
-                        [35, 24, 23, 34, 36, 37],
-                        [29, 28, 27, 38, 39, 40],
-                        [31, 30, 29, 40, 41, 42],
-                        [33, 32, 31, 42, 43, 44],
-                        [36, 34, 33, 44, 45, 46],
-                        [41, 40, 39, 47, 48, 49],
-                        [43, 42, 41, 49, 50, 51],
-                        [45, 44, 43, 51, 52, 53]]
+from resources import HEX_RESOURCE, NUM_RESOURCES, Resource
+from longest_road import LongestRoads
+from zobrist import keys_for
+from board_topology import EXTENSION_TOPOLOGY, STANDARD_TOPOLOGY, mask_indices
 
 # this is the default beginners Catan board layout according to the manual
 DEFAULT_CATAN_LAYOUT = [HexType.FOREST, HexType.SHEEP, HexType.WHEAT,
@@ -117,117 +25,75 @@ DEFAULT_CATAN_FREQUENCIES = [11, 12, 9,
                              8, 10, 9, 3,
                              5, 2, 6]
 
+# the board for 5 - 6 players (EXTENSION_TOPOLOGY): 6 each of FOREST, SHEEP and
+# WHEAT, 5 each of REDDISH_ORANGE and MOUNTAIN and 2 CACTUS tiles
+EXTENSION_CATAN_LAYOUT = [HexType.REDDISH_ORANGE, HexType.FOREST, HexType.MOUNTAIN,
+                          HexType.WHEAT, HexType.REDDISH_ORANGE, HexType.FOREST, HexType.CACTUS,
+                          HexType.FOREST, HexType.SHEEP, HexType.REDDISH_ORANGE, HexType.SHEEP, HexType.REDDISH_ORANGE,
+                          HexType.SHEEP, HexType.FOREST, HexType.WHEAT,
+                          HexType.FOREST, HexType.MOUNTAIN, HexType.MOUNTAIN,
+                          HexType.SHEEP, HexType.MOUNTAIN, HexType.WHEAT, HexType.MOUNTAIN, HexType.SHEEP,
+                          HexType.SHEEP, HexType.FOREST, HexType.CACTUS, HexType.WHEAT,
+                          HexType.REDDISH_ORANGE, HexType.WHEAT, HexType.WHEAT]
+
+# its numbers: 2 and 12 twice, the others 3 times
+EXTENSION_CATAN_FREQUENCIES = [4, 8, 3,
+                               9, 10, 12, 0,  # 0 is for a CACTUS tile
+                               10, 6, 5, 2, 6,
+                               5, 9, 4, 10, 4, 11,
+                               11, 2, 11, 5, 6,
+                               8, 3, 0, 12,  # 0 is for a CACTUS tile
+                               9, 8, 3]
+
+# the layout and numbers a board starts from, by its number of hexes
+DEFAULT_LAYOUTS = {STANDARD_TOPOLOGY.num_hexes: DEFAULT_CATAN_LAYOUT,
+                   EXTENSION_TOPOLOGY.num_hexes: EXTENSION_CATAN_LAYOUT}
+DEFAULT_FREQUENCIES = {STANDARD_TOPOLOGY.num_hexes: DEFAULT_CATAN_FREQUENCIES,
+                       EXTENSION_TOPOLOGY.num_hexes: EXTENSION_CATAN_FREQUENCIES}
+
+# the standard board's ports, clockwise from the top left: the two coastal nodes
+# that can use each one, and the resource it takes 2:1 (None for a 3:1 port
+# that takes any resource)
+DEFAULT_CATAN_PORTS = [((1, 2), None), ((6, 7), Resource.WHEAT), ((13, 10), Resource.ORE),
+                       ((37, 35), None), ((45, 46), Resource.SHEEP), ((51, 52), None),
+                       ((47, 48), None), ((27, 38), Resource.REDDISH_ORANGE), ((15, 25), Resource.WOOD)]
+
+# how many of a resource the bank takes for one of any other, without a port
+BANK_RATES = (4,) * NUM_RESOURCES
+ANY_PORT_RATE = 3
+PORT_RATE = 2
+
+
+# the trade rates a port gives whoever settles next to it
+def port_rates(resource):
+    if resource is None:
+        return (ANY_PORT_RATE,) * NUM_RESOURCES
+    return tuple(PORT_RATE if other == resource else BANK_RATES[other] for other in range(NUM_RESOURCES))
+
 
 # Hex info (Hexagonal geometry stuff for different radii, etc)
 HEX_RADIUS = 60
 HEX_SIDE_LEN = ceil(HEX_RADIUS / 2 * sqrt(3))  # 52
 
 
-def create_hex_at(x, y, offsets):
-    return [GameNode((x + offset_pair[0], y + offset_pair[1])) for offset_pair in offsets]
-
-
-# creates the 54 nodes (vertices) making up the board's 19 hexagons
-# the catan board has a row of 3 on top, then 4, then 5, then 4, then 3
-# NOTE: only for the creation of GameNodes, to be used be client
-# Nodes are setup in the constructor of the HexBoard
-def setup_nodes(start_x, start_y):
-
-    # looking back at this code, I don't know what inspired me to specify
-    # these hex offsets as 'big', as opposed to a small hex offset
-    # leaving this for historical relevance
-    big_hex_offsets = [(52, -30), (0, -60), (-52, -30), (-52, 30), (0, 60), (52, 30)]
-
-    nodes = []
-    # row 1
-    cur_x = start_x
-    cur_y = start_y
-    for i in range(3):
-        cur_nodes = create_hex_at(cur_x + i*2*HEX_SIDE_LEN, cur_y, big_hex_offsets)
-        for cur_node in cur_nodes:
-            if any(node.center == cur_node.center for node in nodes):
-                # this node has already been added; do nothing
-                pass
-            else:
-                nodes.append(cur_node)
-    # row 2
-    cur_x -= HEX_SIDE_LEN
-    cur_y += HEX_RADIUS * 3/2
-    for i in range(4):
-        cur_nodes = create_hex_at(cur_x + i*2*HEX_SIDE_LEN, cur_y, big_hex_offsets)
-        for cur_node in cur_nodes:
-            if any(node.center == cur_node.center for node in nodes):
-                # this node has already been added; do nothing
-                pass
-            else:
-                nodes.append(cur_node)
-    # row 3
-    cur_x -= HEX_SIDE_LEN
-    cur_y += HEX_RADIUS * 3/2
-    for i in range(5):
-        cur_nodes = create_hex_at(cur_x + i*2*HEX_SIDE_LEN, cur_y, big_hex_offsets)
-        for cur_node in cur_nodes:
-            if any(node.center == cur_node.center for node in nodes):
-                # this node has already been added; do nothing
-                pass
-            else:
-                nodes.append(cur_node)
-    # row 4
-    cur_x += HEX_SIDE_LEN
-    cur_y += HEX_RADIUS * 3/2
-    for i in range(4):
-        cur_nodes = create_hex_at(cur_x + i*2*HEX_SIDE_LEN, cur_y, big_hex_offsets)
-        for cur_node in cur_nodes:
-            if any(node.center == cur_node.center for node in nodes):
-                # this node has already been added; do nothing
-                pass
-            else:
-                nodes.append(cur_node)
-    # row 5
-    cur_x += HEX_SIDE_LEN
-    cur_y += HEX_RADIUS * 3/2
-    for i in range(3):
-        cur_nodes = create_hex_at(cur_x + i*2*HEX_SIDE_LEN, cur_y, big_hex_offsets)
-        for cur_node in cur_nodes:
-            if any(node.center == cur_node.center for node in nodes):
-                # this node has already been added; do nothing
-                pass
-            else:
-                nodes.append(cur_node)
-
-    # now setup the roads
-    roads = []
-    for pair in ROAD_NODES_INDICES:
-        endpoint_pair = []
-        for item in pair:
-            endpoint_pair.append(nodes[item].center)
-        roads.append(GameRoad(endpoint_pair))
-
+# creates the GameNodes (vertices) and GameRoads of the board, the top left
+# hex centered at (start_x, start_y). where they go comes from the topology
+# (see board_topology.py); the standard board has a row of 3 hexes on top,
+# then 4, then 5, then 4, then 3
+# NOTE: only for the client. Nodes are setup in the constructor of the HexBoard
+def setup_nodes(start_x, start_y, topology=STANDARD_TOPOLOGY):
+    nodes = [GameNode(center) for center in node_centers(start_x, start_y, topology)]
+    roads = [GameRoad([nodes[first].center, nodes[second].center]) for first, second in topology.road_nodes]
     return nodes, roads
 
 
-def load_roads_into_nodes(roads):
-    for road in roads:
-        for node in road.nodes:
-            node.add_road(road)
-
-
-# constructs grid of Hex objects objects based on the already created
-# Node grid (represented as a list of Nodes)
-# returns a list of Hex objects
-def construct_hexes(nodes, nodes_per_hexes):
-    hexes = []
-    for node_indices in nodes_per_hexes:
-        nodes_in_hex = []
-        for node_index in node_indices:
-            nodes_in_hex.append(nodes[node_index])
-        # all of the Nodes making up the Hex are now assembling. make the Hex
-        new_hex = Hex(nodes_in_hex)
-        hexes.append(new_hex)
-        # let nodes know which hexes they are vertices of
-        for node in nodes_in_hex:
-            node.add_hex(new_hex)
-    return hexes
+# where each node of the topology is on screen
+@lru_cache(maxsize=None)
+def node_centers(start_x, start_y, topology):
+    # the top left hex is at x = 2q + r = 0 in the topology's units
+    first_x, first_y = topology.hex_points[0]
+    return tuple((start_x + (x - first_x) * HEX_SIDE_LEN, start_y + (y - first_y) * HEX_RADIUS / 2)
+                 for x, y in topology.node_points)
 
 
 # constructs grid of GameHex objects
@@ -242,91 +108,154 @@ def construct_game_hexes(nodes, nodes_per_hexes):
     return hexes
 
 
-def set_hex_frequencies(hexes, randomize):
-    layout = DEFAULT_CATAN_LAYOUT
-    if randomize:
-        layout = sample(layout, len(layout))
-        # if the layout is randomized, we must move the non-zero frequency
-        # on the cactus tile to the tile that has the 0 frequency
-        for hex_type, frequency in zip(layout, DEFAULT_CATAN_FREQUENCIES):
-            if hex_type is HexType.CACTUS and frequency != 0:
-                taken_by_cactus = frequency
-
-    for h, hex_type, frequency in zip(hexes, layout, DEFAULT_CATAN_FREQUENCIES):
-        h.set_type(hex_type)
-        if hex_type is not HexType.CACTUS:
-            if frequency == 0:
-                # this is the tile who needs the frequency taken by the cactus
-                h.set_roll_num(taken_by_cactus)
-            else:
-                h.set_roll_num(frequency)
+# picks the board's layout (a list of HexTypes, one per hex of the topology). a
+# layout can be supplied (e.g. from a journal) to rebuild a specific board instead
+def choose_layout(randomize, layout=None, topology=STANDARD_TOPOLOGY):
+    if layout is None:
+        layout = DEFAULT_LAYOUTS[topology.num_hexes]
+        if randomize:
+            layout = sample(layout, len(layout))
+    return list(layout)
+
+
+# the number that must be rolled for each hex of the layout to produce (None for a CACTUS tile)
+def layout_roll_nums(layout):
+    frequencies = DEFAULT_FREQUENCIES[len(layout)]
+    # if the layout is randomized, we must move the non-zero frequencies
+    # on the cactus tiles to the tiles that have the 0 frequencies
+    taken_by_cactus = iter([frequency for hex_type, frequency in zip(layout, frequencies)
+                            if hex_type is HexType.CACTUS and frequency != 0])
+
+    roll_nums = []
+    for hex_type, frequency in zip(layout, frequencies):
+        if hex_type is HexType.CACTUS:
+            roll_nums.append(None)
+        elif frequency == 0:
+            # this is a tile who needs a frequency taken by a cactus
+            roll_nums.append(next(taken_by_cactus))
+        else:
+            roll_nums.append(frequency)
+    return roll_nums
 
 
 # note that here, layout is being sent as a list of colors, so there is no
-# need to try to get color values from a HexType enum
-def set_game_hex_frequencies(hexes, layout):
-    # if the layout is randomized, we must move the non-zero frequency
-    # on the cactus tile to the tile that has the 0 frequency
-    for hex_color, frequency in zip(layout, DEFAULT_CATAN_FREQUENCIES):
-        if HexType(hex_color) is HexType.CACTUS and frequency != 0:
-            taken_by_cactus = frequency
-
-    for h, hex_color, frequency in zip(hexes, layout, DEFAULT_CATAN_FREQUENCIES):
+# need to try to get color values from a HexType enum. numbers, if the server
+# sent them, is the number on each hex (0 for a CACTUS tile)
+def set_game_hex_frequencies(hexes, layout, numbers=None):
+    if numbers is None:
+        numbers = [roll_num or 0 for roll_num in layout_roll_nums([HexType(hex_color) for hex_color in layout])]
+    for h, hex_color, number in zip(hexes, layout, numbers):
         h.set_color(hex_color)
-        if HexType(hex_color) is not HexType.CACTUS:
-            if frequency == 0:
-                h.set_frequency(taken_by_cactus)
-            else:
-                h.set_frequency(frequency)
+        if number != 0:
+            h.set_frequency(number)
 
 
 # for server use. for client representation of hex board see below
 class HexBoard:
-    """A collection of interconnected Node and Road objects"""
-    def __init__(self, randomize):
-        self.nodes = [Node() for i in range(NUM_NODES)]
-        # now we want to setup the nodes concept of their neighbors
-        for relative_neighbors, node in zip(NODE_NEIGHBOR_INDICES, self.nodes):
-            for relative_neighbor in relative_neighbors:
-                node.add_neighbor(self.nodes[relative_neighbor])
-
-        # now setup the roads
-        self.roads = []
-        for pair in ROAD_NODES_INDICES:
-            node_pair = []
-            for item in pair:
-                node_pair.append(self.nodes[item])
-            self.roads.append(Road(node_pair))
-
-        load_roads_into_nodes(self.roads)
-
-        self.hexes = construct_hexes(self.nodes, NODE_INDICES_TO_HEX)
-        set_hex_frequencies(self.hexes, randomize)
+    """Who owns each node and road of a game's board, and what each hex produces.
+    How they connect is the shared BoardTopology; everything here is indexed the same way"""
+    def __init__(self, randomize, layout=None, topology=STANDARD_TOPOLOGY, roll_nums=None, ports=None):
+        self.topology = topology
+        self.node_owner = [None] * topology.num_nodes  # the player with a settlement there
+        self.node_city = bytearray(topology.num_nodes)  # 1 if that settlement is a city
+        self.road_owner = [None] * topology.num_roads
+        # the same as bitmasks (bit i for node / road i), which is what the rules work on
+        self.settled = 0  # nodes with a settlement
+        self.roads_taken = 0
+        self.player_nodes = {}  # player -> mask of their settlements
+        self.player_roads = {}  # player -> mask of their roads
+        self.player_road_nodes = {}  # player -> mask of the nodes their roads touch
+
+        # what is legal right now, kept up to date by settle() and set_road() so
+        # that checking a move is a single bit test
+        self.open_nodes = topology.all_nodes  # not settled and not next to a settlement
+        self.player_legal_roads = {}  # player -> mask of the roads they can build
+        # player -> mask of the open nodes their roads reach (where they could
+        # build once the game is past setup)
+        self.player_legal_settlements = {}
+
+        self.hex_types = choose_layout(randomize, layout, topology)
+        # a board made for another topology would only fail later, deep in the rules
+        if len(self.hex_types) != topology.num_hexes:
+            raise ValueError('a layout of {} hexes does not fit a topology of {} hexes'.format(
+                len(self.hex_types), topology.num_hexes))
+        if roll_nums is not None and len(roll_nums) != topology.num_hexes:
+            raise ValueError('{} numbers do not fit a topology of {} hexes'.format(
+                len(roll_nums), topology.num_hexes))
+        # the numbers go with the layout unless the board came with its own (see board_generator.py)
+        self.roll_nums = layout_roll_nums(self.hex_types) if roll_nums is None else list(roll_nums)
+
+        # the robber starts on the (first) CACTUS tile; the hex it is on produces nothing
+        self.robber = self.hex_types.index(HexType.CACTUS) if HexType.CACTUS in self.hex_types else None
+
+        # roll number -> [(hex index, node index, resource, multiplier)] for every
+        # settlement / city bordering a hex with that number, so a roll only
+        # looks at what actually produces
+        self.production = {roll_num: [] for roll_num in self.roll_nums if roll_num is not None}
+
+        self.longest_roads = LongestRoads(self)
+
+        # the trade rates of the port at each node (None if there isn't one), and
+        # each player's best rates from the ports they have settled, kept up to
+        # date by settle() so that a trade looks its rate up
+        if ports is None:
+            ports = DEFAULT_CATAN_PORTS if topology is STANDARD_TOPOLOGY else []
+        self.ports = list(ports)
+        self.node_port_rates = [None] * topology.num_nodes
+        for nodes, resource in self.ports:
+            for node_index in nodes:
+                self.node_port_rates[node_index] = port_rates(resource)
+        self.player_trade_rates = {}  # player -> a rate per resource, if better than BANK_RATES
+
+        # Zobrist hash of the owners, cities and robber (see zobrist.py). players
+        # are told apart by their seat
+        self.zobrist = keys_for(topology)
+        self.hash = 0 if self.robber is None else self.zobrist.robber[self.robber]
 
     # turn the list of types of this HexBoard into a format that can be sent over the
     # network to create the user's GameHexBoard
     def serialize_types(self):
-        serial_types = []
-        for hx in self.hexes:
-            serial_types.append(hx.type.value)
-        return serial_types
+        return [hex_type.value for hex_type in self.hex_types]
+
+    # the number on every hex, 0 for the CACTUS tile, in the same order
+    def serialize_numbers(self):
+        return [roll_num or 0 for roll_num in self.roll_nums]
+
+    # the HexType of every hex, in order
+    def layout(self):
+        return list(self.hex_types)
+
+    # every node a settlement can go on during setup: not taken and not next to a settlement
+    def legal_settlements(self):
+        return self.open_nodes
+
+    # the open nodes one of the player's roads leads to
+    def legal_connected_settlements(self, player):
+        return self.player_legal_settlements.get(player, 0)
+
+    # every road the player can build: free, and touching one of their settlements
+    # or one of their roads through a node nobody has settled
+    def legal_roads(self, player):
+        return self.player_legal_roads.get(player, 0)
+
+    # the same as lists of indices, e.g. for clients to highlight
+    def legal_settlement_indices(self):
+        return mask_indices(self.open_nodes)
+
+    def legal_road_indices(self, player):
+        return mask_indices(self.legal_roads(player))
+
+    def legal_connected_settlements_indices(self, player):
+        return mask_indices(self.legal_connected_settlements(player))
 
     # checks if the settlement selection (node_index) is
     # 1) not already taken
     # 2) not adjacent to another existing settlement
     def valid_settlement(self, node_index):
-        try:
-            node = self.nodes[node_index]
-        except IndexError:
+        if not 0 <= node_index < self.topology.num_nodes:
             # user has sent a bad node_index
             return False
-        if node.owner is None:
-            valid = True
-            for neighbor in node.neighbors:
-                if neighbor.owner is not None:
-                    valid = False
-            return valid
-        return False
+        return self.open_nodes >> node_index & 1 == 1
 
     # checks if the road selection (road_index) is
     # 1) not already taken
@@ -334,41 +263,166 @@ class HexBoard:
     # 3) adjacent to a node that is adjacent to another one of the player's road,
     # but only if that node is not owned by a different player
     def valid_road(self, road_index, player):
-        try:
-            road = self.roads[road_index]
-        except IndexError:
+        if not 0 <= road_index < self.topology.num_roads:
             # user has sent bad road_index
             return False
-        if road.owner is None:
-            for node in road.nodes:
-                if node.owner is player:
-                    # the player has an adjacent settlement -> good
-                    return True
-                elif node.owner is None:
-                    # check roads adjacent to the road's nodes
-                    for other_road in node.roads:
-                        if other_road.owner is player:
-                            return True
-        return False
-
-    # make the player the new owner of the node given by node_index
+        return self.player_legal_roads.get(player, 0) >> road_index & 1 == 1
+
+    # can the player extend a road through this node? only if it is theirs, or
+    # nobody's and one of their roads touches it
+    def reaches_through(self, node_index, player):
+        owner = self.node_owner[node_index]
+        return owner is player or (owner is None and
+                                   self.player_road_nodes.get(player, 0) >> node_index & 1 == 1)
+
+    # make the player the new owner of the node given by node_index. returns
+    # what undo_settle needs to take it back
     def settle(self, node_index, player):
-        try:
-            node = self.nodes[node_index]
-            node.owner = player
-        except IndexError:
+        topology = self.topology
+        if not 0 <= node_index < topology.num_nodes:
             # user sent a bad node_index, do nothing
-            return
-
+            return None
+        saved = (self.settled, self.open_nodes, self.hash, dict(self.player_nodes),
+                 dict(self.player_legal_settlements), dict(self.player_legal_roads), dict(self.player_trade_rates))
+        self.node_owner[node_index] = player
+        self.hash ^= self.zobrist.node_owner[node_index][player.seat]
+        self.settled |= 1 << node_index
+        self.player_nodes[player] = self.player_nodes.get(player, 0) | 1 << node_index
+
+        # the new settlement produces from every numbered hex around it
+        for hex_index in topology.node_hexes[node_index]:
+            roll_num = self.roll_nums[hex_index]
+            if roll_num is not None:
+                self.production[roll_num].append(
+                    (hex_index, node_index, int(HEX_RESOURCE[self.hex_types[hex_index]]), 1))
+
+        # a port lowers the settler's rates for good
+        rates = self.node_port_rates[node_index]
+        if rates is not None:
+            self.player_trade_rates[player] = tuple(map(min, self.trade_rates(player), rates))
+
+        # the node and its neighbors are closed to everyone
+        self.open_nodes &= ~topology.settle_masks[node_index]
+        for other in self.player_legal_settlements:
+            self.player_legal_settlements[other] &= self.open_nodes
+
+        # the settler can build out from here
+        node_roads = topology.node_road_masks[node_index]
+        self.player_legal_roads[player] = (self.player_legal_roads.get(player, 0) |
+                                           node_roads & ~self.roads_taken)
+        # anyone else who could only reach these roads through this node no longer can
+        for other, legal in self.player_legal_roads.items():
+            if other is player or not legal & node_roads:
+                continue
+            for road_index in topology.node_roads[node_index]:
+                if legal >> road_index & 1:
+                    first, second = topology.road_nodes[road_index]
+                    far_end = second if first == node_index else first
+                    if not self.reaches_through(far_end, other):
+                        legal &= ~(1 << road_index)
+            self.player_legal_roads[other] = legal
+
+        return saved, self.longest_roads.settlement_built(node_index, player)
+
+    def undo_settle(self, node_index, diff):
+        (self.settled, self.open_nodes, self.hash, self.player_nodes, self.player_legal_settlements,
+         self.player_legal_roads, self.player_trade_rates), longest_roads_diff = diff
+        self.node_owner[node_index] = None
+        # its production entries are the last ones added
+        for hex_index in self.topology.node_hexes[node_index]:
+            roll_num = self.roll_nums[hex_index]
+            if roll_num is not None:
+                self.production[roll_num].pop()
+        self.longest_roads.revert(*longest_roads_diff)
+
+    # how many of each resource the player has to give the bank for one of another
+    def trade_rates(self, player):
+        return self.player_trade_rates.get(player, BANK_RATES)
+
+    # a settlement becomes a city, producing two of everything
+    def upgrade_city(self, node_index):
+        self.set_city(node_index, 1)
+
+    def undo_upgrade_city(self, node_index):
+        self.set_city(node_index, 0)
+
+    def set_city(self, node_index, city):
+        self.node_city[node_index] = city
+        self.hash ^= self.zobrist.city[node_index]
+        for hex_index in self.topology.node_hexes[node_index]:
+            roll_num = self.roll_nums[hex_index]
+            if roll_num is None:
+                continue
+            entries = self.production[roll_num]
+            for i, (entry_hex, entry_node, resource, multiplier) in enumerate(entries):
+                if entry_hex == hex_index and entry_node == node_index:
+                    entries[i] = (entry_hex, entry_node, resource, 1 + city)
+
+    def move_robber(self, hex_index):
+        if self.robber is not None:
+            self.hash ^= self.zobrist.robber[self.robber]
+        self.robber = hex_index
+        self.hash ^= self.zobrist.robber[hex_index]
+
+    # what a roll of roll_num pays out: {player: resource delta}
+    def produce(self, roll_num):
+        payout = {}
+        robber = self.robber
+        node_owner = self.node_owner
+        for hex_index, node_index, resource, multiplier in self.production.get(roll_num, ()):
+            if hex_index == robber:
+                continue
+            owner = node_owner[node_index]
+            delta = payout.get(owner)
+            if delta is None:
+                delta = payout[owner] = [0] * NUM_RESOURCES
+            delta[resource] += multiplier
+        return payout
+
+    # returns what undo_set_road needs to take it back
     def set_road(self, road_index, player):
-        self.roads[road_index].owner = player
+        topology = self.topology
+        saved = (self.roads_taken, self.hash, dict(self.player_roads), dict(self.player_road_nodes),
+                 dict(self.player_legal_settlements), dict(self.player_legal_roads))
+        self.road_owner[road_index] = player
+        self.hash ^= self.zobrist.road_owner[road_index][player.seat]
+        self.roads_taken |= 1 << road_index
+        self.player_roads[player] = self.player_roads.get(player, 0) | 1 << road_index
+        road_nodes = topology.road_node_masks[road_index]
+        self.player_road_nodes[player] = self.player_road_nodes.get(player, 0) | road_nodes
+
+        # the road is gone for everyone
+        for other in self.player_legal_roads:
+            self.player_legal_roads[other] &= ~(1 << road_index)
+        # the builder can carry on from either end that isn't someone else's
+        legal = self.player_legal_roads.get(player, 0)
+        for node in topology.road_nodes[road_index]:
+            if self.node_owner[node] in (None, player):
+                legal |= topology.node_road_masks[node]
+        self.player_legal_roads[player] = legal & ~self.roads_taken
+        self.player_legal_settlements[player] = (self.player_legal_settlements.get(player, 0) |
+                                                 road_nodes & self.open_nodes)
+
+        return saved, self.longest_roads.road_built(road_index, player)
+
+    def undo_set_road(self, road_index, diff):
+        (self.roads_taken, self.hash, self.player_roads, self.player_road_nodes,
+         self.player_legal_settlements, self.player_legal_roads), longest_roads_diff = diff
+        self.road_owner[road_index] = None
+        self.longest_roads.revert(*longest_roads_diff)
+
+    # the length of the player's longest road
+    def longest_road(self, player):
+        return self.longest_roads.length(player)
 
 
 class GameHexBoard:
-    def __init__(self, start_x, start_y, layout):
-        self.nodes, self.roads = setup_nodes(start_x, start_y)
-        self.hexes = construct_game_hexes(self.nodes, NODE_INDICES_TO_HEX)
-        set_game_hex_frequencies(self.hexes, layout)
+    def __init__(self, start_x, start_y, layout, numbers=None, topology=STANDARD_TOPOLOGY):
+        self.topology = topology
+        self.start_x = start_x
+        self.nodes, self.roads = setup_nodes(start_x, start_y, topology)
+        self.hexes = construct_game_hexes(self.nodes, topology.hex_nodes)
+        set_game_hex_frequencies(self.hexes, layout, numbers)
         self.selection = None
 
     def draw(self, screen):
@@ -408,8 +462,10 @@ class GameHexBoard:
         except IndexError:
             return None
 
-    def select_settlement(self, mouse_pos):
-        selection = self.select_common(self.nodes, mouse_pos)
+    # legal is the indices the server will accept; only those can be highlighted / selected
+    def select_settlement(self, mouse_pos, legal=None):
+        candidates = self.nodes if legal is None else [self.nodes[i] for i in legal]
+        selection = self.select_common(candidates, mouse_pos)
         if selection:
             # get index so the node can be communicated to the server
             return self.nodes.index(selection)
@@ -420,8 +476,9 @@ class GameHexBoard:
             # get index so the hex can be communicated to the server
             return self.hexes.index(selection)
 
-    def select_road(self, mouse_pos):
-        selection = self.select_common(self.roads, mouse_pos)
+    def select_road(self, mouse_pos, legal=None):
+        candidates = self.roads if legal is None else [self.roads[i] for i in legal]
+        selection = self.select_common(candidates, mouse_pos)
         if selection:
             # get index so the road can be communicated to the server
             return self.roads.index(selection)
@@ -436,5 +493,6 @@ class GameHexBoard:
 
     # returns the x coordinate of the center of the hex board
     def center_x(self):
-        # the 8th node of the hex board is at the center-top, hence why it is being used here
-        return self.nodes[7].center[0]
+        # boards are symmetric left to right, so the center is the average of the hex centers
+        hex_xs = [x for x, y in self.topology.hex_points]
+        return self.start_x + (sum(hex_xs) // len(hex_xs) - hex_xs[0]) * HEX_SIDE_LEN
@@ -0,0 +1,236 @@
+import os
+import struct
+
+from hex import HexType
+import rules
+
+# Append-only journal of every accepted game action, so in-progress games can
+# be rebuilt after the server process dies.
+#
+# Each record is a fixed header (record type, game id, payload length) and a
+# small struct payload. Records are written to the os as soon as they are
+# made, so a crash of the server process alone loses nothing; fsync is batched
+# (group commit) every commit_interval seconds or every commit_records records,
+# which bounds what a power loss can take.
+
+HEADER = struct.Struct('!BIH')
+
+CREATE = 1  # num_players, randomize, board layout (one byte per hex)
+PLAYER = 2  # seat, color, username
+SETTLE = 3  # seat, node index
+ROAD = 4  # seat, road index
+DICE = 5  # left, right
+# seat, change in each resource (in resources.Resource order). no longer written:
+# replaying the moves gives everyone the same resources again
+RESOURCES = 6
+END = 7  # the game was evicted; nothing to recover
+BUILD_ROAD = 8  # seat, road index
+BUILD_SETTLEMENT = 9  # seat, node index
+BUILD_CITY = 10  # seat, node index
+END_TURN = 11  # seat
+NUMBERS = 12  # the number on each hex (0 for the CACTUS tile), if not the layout's usual ones
+DICE_SEED = 13  # the seed of the game's dice (see dice_stream.py)
+BANK_TRADE = 14  # seat, resource given, resource got
+
+CREATE_FIELDS = struct.Struct('!B?')
+PLAYER_FIELDS = struct.Struct('!B3B')
+PIECE_FIELDS = struct.Struct('!BB')
+DICE_FIELDS = struct.Struct('!BB')
+RESOURCE_FIELDS = struct.Struct('!B5h')
+SEAT_FIELDS = struct.Struct('!B')
+DICE_SEED_FIELDS = struct.Struct('!Q')
+TRADE_FIELDS = struct.Struct('!BBB')
+
+# the record for each kind of move (see rules.py) that places a piece, and back
+PIECE_RECORDS = {rules.SETTLE: SETTLE, rules.ROAD: ROAD, rules.BUILD_ROAD: BUILD_ROAD,
+                 rules.BUILD_SETTLEMENT: BUILD_SETTLEMENT, rules.BUILD_CITY: BUILD_CITY}
+PIECE_MOVES = {record_type: kind for kind, record_type in PIECE_RECORDS.items()}
+
+HEX_TYPES = list(HexType)
+HEX_TYPE_CODES = {hex_type: code for code, hex_type in enumerate(HEX_TYPES)}
+
+
+class Journal:
+    """Writes game records to an append-only file with batched fsyncs"""
+    def __init__(self, path, commit_interval=0.05, commit_records=512):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_records = commit_records
+        # unbuffered: every record goes straight to the os
+        self.file = open(path, 'ab', buffering=0)
+        self.uncommitted = 0
+
+    def append(self, record_type, game_id, payload=b''):
+        self.file.write(HEADER.pack(record_type, game_id, len(payload)) + payload)
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_records:
+            self.commit()
+
+    # make everything written so far durable. called on a timer so that one
+    # fsync covers every record since the last one
+    def commit(self):
+        if self.uncommitted:
+            os.fsync(self.file.fileno())
+            self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.file.close()
+
+    def create(self, game_id, num_players, randomize, layout):
+        self.append(CREATE, game_id, CREATE_FIELDS.pack(num_players, randomize) +
+                    bytes(HEX_TYPE_CODES[hex_type] for hex_type in layout))
+
+    def numbers(self, game_id, numbers):
+        self.append(NUMBERS, game_id, bytes(numbers))
+
+    def dice_seed(self, game_id, seed):
+        self.append(DICE_SEED, game_id, DICE_SEED_FIELDS.pack(seed))
+
+    def player(self, game_id, seat, username, color):
+        self.append(PLAYER, game_id, PLAYER_FIELDS.pack(seat, *color) + username.encode('utf-8'))
+
+    # a move (see rules.py) the player in seat made
+    def move(self, game_id, seat, move):
+        kind = move[0]
+        if kind == rules.ROLL:
+            self.append(DICE, game_id, DICE_FIELDS.pack(move[1], move[2]))
+        elif kind == rules.END_TURN:
+            self.append(END_TURN, game_id, SEAT_FIELDS.pack(seat))
+        elif kind == rules.BANK_TRADE:
+            self.append(BANK_TRADE, game_id, TRADE_FIELDS.pack(seat, move[1], move[2]))
+        else:
+            self.append(PIECE_RECORDS[kind], game_id, PIECE_FIELDS.pack(seat, move[1]))
+
+    def end(self, game_id):
+        self.append(END, game_id)
+
+
+# read every record back as (record type, game id, decoded fields). a torn
+# record at the end of the file (the process died mid-write) is ignored
+def read_records(path):
+    with open(path, 'rb') as journal_file:
+        data = journal_file.read()
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        record_type, game_id, length = HEADER.unpack_from(data, pos)
+        pos += HEADER.size
+        if pos + length > len(data):
+            break
+        payload = data[pos:pos + length]
+        pos += length
+
+        if record_type == CREATE:
+            num_players, randomize = CREATE_FIELDS.unpack_from(payload)
+            fields = (num_players, randomize,
+                      [HEX_TYPES[code] for code in payload[CREATE_FIELDS.size:]])
+        elif record_type == PLAYER:
+            seat, red, green, blue = PLAYER_FIELDS.unpack_from(payload)
+            fields = (seat, payload[PLAYER_FIELDS.size:].decode('utf-8'), (red, green, blue))
+        elif record_type in PIECE_MOVES:
+            fields = PIECE_FIELDS.unpack(payload)
+        elif record_type == END_TURN:
+            fields = SEAT_FIELDS.unpack(payload)
+        elif record_type == NUMBERS:
+            fields = ([number or None for number in payload],)
+        elif record_type == DICE_SEED:
+            fields = DICE_SEED_FIELDS.unpack(payload)
+        elif record_type == BANK_TRADE:
+            fields = TRADE_FIELDS.unpack(payload)
+        elif record_type == DICE:
+            fields = DICE_FIELDS.unpack(payload)
+        elif record_type == RESOURCES:
+            values = RESOURCE_FIELDS.unpack(payload)
+            fields = (values[0], values[1:])
+        else:
+            fields = ()
+        yield record_type, game_id, fields
+
+
+# records of every game that hasn't ended, in journal order
+def live_records(path):
+    records = {}
+    for record in read_records(path):
+        record_type, game_id = record[0], record[1]
+        if record_type == END:
+            records.pop(game_id, None)
+        elif record_type == CREATE or game_id in records:
+            records.setdefault(game_id, []).append(record)
+    return records
+
+
+# rewrite the journal with only the games that are still live, so it doesn't
+# grow with every game ever played
+def compact(path):
+    kept = set(live_records(path))
+    temp_path = path + '.tmp'
+    with open(path, 'rb') as journal_file, open(temp_path, 'wb') as temp_file:
+        data = journal_file.read()
+        pos = 0
+        while pos + HEADER.size <= len(data):
+            record_type, game_id, length = HEADER.unpack_from(data, pos)
+            end = pos + HEADER.size + length
+            if end > len(data):
+                break
+            if game_id in kept:
+                temp_file.write(data[pos:end])
+            pos = end
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+class ReplayChannel:
+    """Channel for a player rebuilt from the journal; drops whatever the game sends
+    until the player rejoins on a real channel"""
+    def Send(self, data):
+        pass
+
+
+# rebuild every game in the journal that hadn't been evicted by replaying its
+# accepted actions through the game's own rules. returns {game_id: Game}
+def recover(path, game_class):
+    return {game_id: replay(game_id, game_records, game_class)
+            for game_id, game_records in live_records(path).items()}
+
+
+def replay(game_id, records, game_class):
+    record_type, game_id, (num_players, randomize, layout) = records[0]
+    # what the game was made with besides its layout follows it (older journals have neither)
+    made_with = {record_type: fields[0] for record_type, game_id, fields in records[1:3]
+                 if record_type in (NUMBERS, DICE_SEED)}
+    game = game_class(num_players, randomize, layout, made_with.get(NUMBERS), made_with.get(DICE_SEED))
+    game.game_id = game_id
+
+    # players are journaled as their usernames are accepted, which needn't be in
+    # seat order, so every seat is taken before anyone is named
+    seats = [fields[0] for record_type, game_id, fields in records if record_type == PLAYER]
+    channels = [ReplayChannel() for seat in range(max(seats, default=-1) + 1)]
+    for channel in channels:
+        game.add_player(channel)
+
+    for record_type, game_id, fields in records[1:]:
+        if record_type == PLAYER:
+            seat, username, color = fields
+            game.handle_network(channels[seat], 'check_user_color',
+                                {'username': username, 'color': color})
+        # the journal only has moves that were accepted, so they go straight to the rules
+        elif record_type in PIECE_MOVES:
+            seat, index = fields
+            game.apply((PIECE_MOVES[record_type], index))
+        elif record_type == DICE:
+            # keep the game's dice in step, so the rolls still to come are the ones it would have made
+            game.dice.skip(1)
+            game.apply((rules.ROLL,) + fields)
+        elif record_type == END_TURN:
+            game.apply((rules.END_TURN,))
+        elif record_type == BANK_TRADE:
+            seat, give, get = fields
+            game.apply((rules.BANK_TRADE, give, get))
+    game.undo_stack.clear()
+
+    # nobody is connected to a rebuilt game until they rejoin; until then what
+    # the game sends them goes to their ReplayChannel and is dropped
+    for player in game.players:
+        player.connected = False
+    return game
@@ -0,0 +1,66 @@
+"""Load generator for the Catan server: runs many headless bots (bot_client.py)
+that host and join games and play them through setup and the first dice roll.
+
+usage: python load_test.py [--bots 1000] [--players 4] [--rate 200] [--dict]"""
+import argparse
+import random
+
+from time import monotonic
+
+from bot_client import BotClient, BotPool, BotStats
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(stats, num_bots, elapsed):
+    connected = len(stats.connect_times)
+    print('bots: {}, connected: {}, errors: {}, aborted: {}'.format(num_bots, connected,
+                                                                     stats.errors, stats.aborted))
+    print('connect rate: {:.1f}/s'.format(connected / elapsed))
+    print('games completed: {} ({:.2f}/s)'.format(stats.games_completed,
+                                                  stats.games_completed / elapsed))
+    print('round trip latency (ms)     count     p50     p90     p99     max')
+    for action, samples in stats.latencies.items():
+        if samples:
+            print('  {:<22} {:>8} {:>7.2f} {:>7.2f} {:>7.2f} {:>7.2f}'.format(
+                action, len(samples), *[1000 * percentile(samples, p) for p in (0.5, 0.9, 0.99, 1)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a Catan server with scripted bots')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=4200)
+    parser.add_argument('--bots', type=int, default=1000, help='total number of players')
+    parser.add_argument('--players', type=int, default=4, help='players per game')
+    parser.add_argument('--rate', type=float, default=200, help='new connections per second')
+    parser.add_argument('--timeout', type=float, default=120, help='give up after this many seconds')
+    parser.add_argument('--dict', action='store_true', help="don't negotiate the compact format")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stats = BotStats()
+    pool = BotPool()
+    started = monotonic()
+    launched = 0
+    while monotonic() - started < args.timeout:
+        # ramp up at the requested connection rate. every game gets one host,
+        # the rest of its players join
+        due = min(args.bots, int((monotonic() - started) * args.rate) + 1)
+        while launched < due:
+            pool.add(BotClient('bot{}'.format(launched), (args.host, args.port), args.players,
+                               launched % args.players == 0, stats, pool.socket_map,
+                               compact=not args.dict, rng=random.Random(rng.random())))
+            launched += 1
+        pool.pump()
+        if launched == args.bots and not pool.bots:
+            break
+
+    report(stats, launched, monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from board_topology import mask_indices
+
+# Longest road, kept up to date as roads and settlements are placed.
+#
+# Each player's roads are grouped into components: roads joined through nodes
+# the player can pass through (nobody's, or their own). A new road only
+# changes the components it touches, and a settlement only splits the
+# components running through its node, so only those are searched again; the
+# longest trail of every other component is cached.
+
+
+class RoadComponent:
+    """A connected group of one player's roads and the longest trail through it"""
+    __slots__ = ('player', 'roads', 'longest')
+
+    def __init__(self, player, roads, longest):
+        self.player = player
+        self.roads = roads  # mask of road indices
+        self.longest = longest
+
+
+# the longest trail (no road used twice) through the given roads. a trail
+# can't carry on through a node settled by someone else, though it can end there
+def longest_trail(board, player, roads):
+    topology = board.topology
+    node_owner = board.node_owner
+    road_nodes = topology.road_nodes
+    node_road_masks = topology.node_road_masks
+
+    def extend(node, used):
+        owner = node_owner[node]
+        if owner is not None and owner is not player:
+            return 0
+        best = 0
+        available = node_road_masks[node] & roads & ~used
+        while available:
+            low = available & -available
+            available ^= low
+            road_index = low.bit_length() - 1
+            first, second = road_nodes[road_index]
+            length = 1 + extend(second if first == node else first, used | low)
+            if length > best:
+                best = length
+        return best
+
+    best = 0
+    for road_index in mask_indices(roads):
+        # a longest trail starts with some road, heading out from either end
+        for end in road_nodes[road_index]:
+            length = 1 + extend(end, 1 << road_index)
+            if length > best:
+                best = length
+    return best
+
+
+class LongestRoads:
+    """Every player's road components on one HexBoard, with cached longest trails"""
+    def __init__(self, board):
+        self.board = board
+        self.road_component = {}  # road index -> RoadComponent it is in
+        self.components = {}  # player -> list of their RoadComponents
+
+    # the length of the player's longest road
+    def length(self, player):
+        return max((component.longest for component in self.components.get(player, ())), default=0)
+
+    # can the player's roads connect through this node?
+    def passable(self, node_index, player):
+        owner = self.board.node_owner[node_index]
+        return owner is None or owner is player
+
+    # the player's road at road_index joins (and possibly merges) the components at its ends.
+    # like settlement_built, returns the (removed, added) components for revert
+    def road_built(self, road_index, player):
+        board = self.board
+        roads = 1 << road_index
+        removed = []
+        for node in board.topology.road_nodes[road_index]:
+            if not self.passable(node, player):
+                continue
+            for other_road in board.topology.node_roads[node]:
+                component = self.road_component.get(other_road)
+                if component is not None and component.player is player and not roads & component.roads:
+                    roads |= component.roads
+                    self.components[player].remove(component)
+                    removed.append(component)
+        return removed, [self.add_component(player, roads)]
+
+    # a settlement at node_index may cut other players' roads in two there
+    def settlement_built(self, node_index, player):
+        node_roads = self.board.topology.node_road_masks[node_index]
+        cut = []
+        for road_index in self.board.topology.node_roads[node_index]:
+            component = self.road_component.get(road_index)
+            if component is None or component.player is player or component in cut:
+                continue
+            # only a road running through the node (two of the component's roads meet there) is cut
+            if bin(component.roads & node_roads).count('1') > 1:
+                cut.append(component)
+        added = []
+        for component in cut:
+            self.components[component.player].remove(component)
+            added.extend(self.split(component))
+        return cut, added
+
+    # take back a road_built / settlement_built
+    def revert(self, removed, added):
+        for component in added:
+            self.components[component.player].remove(component)
+            for road_index in mask_indices(component.roads):
+                del self.road_component[road_index]
+        for component in removed:
+            self.components[component.player].append(component)
+            for road_index in mask_indices(component.roads):
+                self.road_component[road_index] = component
+
+    # regroup a component's roads after one of its nodes was blocked. returns the new components
+    def split(self, component):
+        board = self.board
+        topology = board.topology
+        parts = []
+        remaining = component.roads
+        while remaining:
+            low = remaining & -remaining
+            group = low
+            frontier = [low.bit_length() - 1]
+            while frontier:
+                road_index = frontier.pop()
+                for node in topology.road_nodes[road_index]:
+                    if not self.passable(node, component.player):
+                        continue
+                    joined = topology.node_road_masks[node] & remaining & ~group
+                    group |= joined
+                    frontier.extend(mask_indices(joined))
+            remaining &= ~group
+            parts.append(self.add_component(component.player, group))
+        return parts
+
+    def add_component(self, player, roads):
+        component = RoadComponent(player, roads, longest_trail(self.board, player, roads))
+        self.components.setdefault(player, []).append(component)
+        for road_index in mask_indices(roads):
+            self.road_component[road_index] = component
+        return component
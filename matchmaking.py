@@ -0,0 +1,70 @@
+from collections import deque
+
+
+class MatchmakingIndex:
+    """Finds an open game for a joining player without scanning every game"""
+    def __init__(self):
+        # game_id -> Game, for every game the server knows about
+        self.games = {}
+        # (num_players, randomize) -> ids of games that still have a free seat,
+        # oldest first so games fill up in the order they were hosted
+        self.open_games = {}
+        self.next_game_id = 0
+
+    def __len__(self):
+        return len(self.games)
+
+    # register a freshly hosted game and return its id
+    def add_game(self, game):
+        game_id = self.next_game_id
+        self.next_game_id += 1
+        self.games[game_id] = game
+        if not game.is_full():
+            self.queue_for(game.max_num_players, game.randomize).append(game_id)
+        return game_id
+
+    # returns the game for game_id, or None if there is no such game
+    def get(self, game_id):
+        return self.games.get(game_id)
+
+    def queue_for(self, num_players, randomize):
+        key = (num_players, randomize)
+        try:
+            return self.open_games[key]
+        except KeyError:
+            queue = self.open_games[key] = deque()
+            return queue
+
+    # returns (game_id, game) for the oldest game matching the specs that
+    # still has room, or (None, None) if there is none
+    def find_open(self, num_players, randomize):
+        queue = self.open_games.get((num_players, randomize))
+        while queue:
+            game_id = queue[0]
+            if self.listed(game_id):
+                return game_id, self.games[game_id]
+            # the game was removed (or closed) while it was still waiting for
+            # players; drop its stale id now instead of searching the queue then
+            queue.popleft()
+        return None, None
+
+    # may players still be matched into this game?
+    def listed(self, game_id):
+        return game_id in self.games
+
+    # forget a game entirely. if it was still open its id is left in the queue
+    # and skipped by find_open
+    def remove_game(self, game_id):
+        return self.games.pop(game_id, None)
+
+    # seat a player in the game and take it out of matchmaking once it is full
+    def join(self, game_id, channel):
+        game = self.games[game_id]
+        game.add_player(channel)
+        if game.is_full():
+            queue = self.queue_for(game.max_num_players, game.randomize)
+            if queue and queue[0] == game_id:
+                queue.popleft()
+            else:
+                queue.remove(game_id)
+        return game
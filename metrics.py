@@ -0,0 +1,91 @@
+import os
+
+from time import time
+
+# log2 buckets of microseconds: bucket i holds durations in [2^(i-1), 2^i) us,
+# so 32 buckets cover everything from under a microsecond to over half an hour
+NUM_BUCKETS = 32
+
+
+class Histogram:
+    """Counts of handler durations in power-of-two buckets. Recording is a
+    couple of integer operations, cheap enough to leave on all the time"""
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket if bucket < NUM_BUCKETS else NUM_BUCKETS - 1] += 1
+
+    # upper bound (in seconds) of the bucket holding the given fraction of samples
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return (1 << bucket) / 1e6
+        return (1 << (NUM_BUCKETS - 1)) / 1e6
+
+
+class Metrics:
+    """Call counts, latency histograms, byte counters and gauges for the server"""
+    def __init__(self):
+        self.histograms = {}  # name -> Histogram
+        self.counters = {}  # name -> int
+        # name -> function returning the current value (or a dict of values),
+        # only evaluated when a report is rendered
+        self.gauges = {}
+        self.started = time()
+
+    def record(self, name, seconds):
+        try:
+            histogram = self.histograms[name]
+        except KeyError:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    # plain text, one metric per line
+    def render(self):
+        lines = ['uptime_seconds {:.0f}'.format(time() - self.started)]
+        for name, function in sorted(self.gauges.items()):
+            value = function()
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append('{}{{{}}} {}'.format(name, key, item))
+            else:
+                lines.append('{} {}'.format(name, value))
+        for name, value in sorted(self.counters.items()):
+            lines.append('{} {}'.format(name, value))
+        lines.append('# handler latency: calls, mean / p50 / p90 / p99 in microseconds')
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append('{} calls={} mean={:.1f} p50<={:.0f} p90<={:.0f} p99<={:.0f}'.format(
+                name, histogram.count, histogram.total / histogram.count * 1e6,
+                histogram.percentile(0.5) * 1e6, histogram.percentile(0.9) * 1e6,
+                histogram.percentile(0.99) * 1e6))
+        return '\n'.join(lines) + '\n'
+
+    # write the report to path, replacing the previous one in a single step
+    # so readers never see a half-written file
+    def dump(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as dump_file:
+            dump_file.write(self.render())
+        os.replace(temp_path, path)
+
+
+# the process-wide instance that everything records into
+metrics = Metrics()
+
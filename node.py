@@ -1,29 +1,11 @@
 from shapes import *
 
 
-class Node:
-    """Node class representing an abstract game node within a web of nodes"""
-    def __init__(self):
-        self.owner = None
-        self.neighbors = []
-        self.roads = []
-        self.hexes = []
-        self.city = False
-
-    def add_neighbor(self, neighbor):
-        self.neighbors.append(neighbor)
-
-    def add_road(self, road):
-        self.roads.append(road)
-
-    def add_hex(self, new_hex):
-        self.hexes.append(new_hex)
-
-
 SETTLEMENT_CIRCLE_RADIUS = 12  # how large a settlement appears on the board
+CITY_CIRCLE_RADIUS = 18  # and a city
 
 
-# for client use. for server node representation see above
+# for client use. the server keeps node ownership in HexBoard (see hex_board.py)
 class GameNode:
     """Node class representing a node to be drawn on the screen"""
 
@@ -36,6 +18,10 @@ class GameNode:
         self.color = color
         self.circle.color = color
 
+    # the settlement here has become a city
+    def build_city(self):
+        self.circle = Circle(self.color, self.center, CITY_CIRCLE_RADIUS)
+
     def deselect(self):
         self.circle.color = self.color
 
@@ -0,0 +1,108 @@
+from functools import lru_cache
+
+from board_topology import STANDARD_TOPOLOGY
+from hex_board import layout_roll_nums
+from resources import HEX_RESOURCE, NUM_RESOURCES
+from symmetry import canonical_board
+from text import CIRCLES_PER_FREQUENCY
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Scores for where to put a settlement, for picking openings in SETTLEMENT_SETUP.
+#
+# A node's score is the pips (the circles under the numbers) of the hexes
+# around it, plus DIVERSITY_WEIGHT for each different resource they produce.
+# Scores only depend on the board (its layout and numbers), so the whole table
+# is worked out at once (with NumPy when it's installed) and memoized by board; ranking the legal
+# nodes of a board then just drops the ones the distance rule has closed.
+# Boards that are turns or flips of each other (see symmetry.py) share one
+# table, worked out on their canonical board, and with use_board_cache the
+# tables are kept on disk as well.
+
+DIVERSITY_WEIGHT = 1.0
+CACHED_LAYOUTS = 4096
+
+# a board_cache.BoardCache to keep scores in, if any
+board_cache = None
+
+
+def use_board_cache(cache):
+    global board_cache
+    board_cache = cache
+
+
+# the pips and resource of each hex of a board (nothing for the CACTUS tile)
+def hex_values(layout, roll_nums):
+    pips = [0 if roll_num is None else CIRCLES_PER_FREQUENCY[roll_num] for roll_num in roll_nums]
+    return pips, [HEX_RESOURCE[hex_type] for hex_type in layout]
+
+
+@lru_cache(maxsize=None)
+def node_hex_matrix(topology):
+    matrix = np.zeros((topology.num_nodes, topology.num_hexes))
+    for node, hexes in enumerate(topology.node_hexes):
+        matrix[node, list(hexes)] = 1
+    return matrix
+
+
+def vectorized_scores(layout, roll_nums, topology):
+    pips, resources = hex_values(layout, roll_nums)
+    produces = np.zeros((topology.num_hexes, NUM_RESOURCES))
+    for hex_index, resource in enumerate(resources):
+        if resource is not None:
+            produces[hex_index, resource] = 1
+    matrix = node_hex_matrix(topology)
+    diversity = (matrix @ produces > 0).sum(axis=1)
+    return tuple((matrix @ np.array(pips, float) + DIVERSITY_WEIGHT * diversity).tolist())
+
+
+def python_scores(layout, roll_nums, topology):
+    pips, resources = hex_values(layout, roll_nums)
+    scores = []
+    for hexes in topology.node_hexes:
+        produced = {resources[hex_index] for hex_index in hexes} - {None}
+        scores.append(float(sum(pips[hex_index] for hex_index in hexes)) + DIVERSITY_WEIGHT * len(produced))
+    return tuple(scores)
+
+
+# the score of every node for a canonical layout (a tuple of HexTypes) and its numbers, in node order
+@lru_cache(maxsize=CACHED_LAYOUTS)
+def canonical_node_scores(layout, roll_nums, topology):
+    if np is not None:
+        return vectorized_scores(layout, roll_nums, topology)
+    return python_scores(layout, roll_nums, topology)
+
+
+# the same for any layout, from the scores of its canonical board
+@lru_cache(maxsize=CACHED_LAYOUTS)
+def cached_node_scores(layout, roll_nums, topology):
+    canonical = canonical_board(layout, roll_nums, topology)
+    def compute(canonical):
+        return canonical_node_scores(tuple(canonical.layout), tuple(canonical.roll_nums), topology)
+
+    scores = compute(canonical) if board_cache is None else board_cache.get('node_scores', canonical, compute)
+    return tuple(canonical.node_values(scores))
+
+
+# roll_nums defaults to the layout's usual numbers (see hex_board.layout_roll_nums)
+def node_scores(layout, roll_nums=None, topology=STANDARD_TOPOLOGY):
+    if roll_nums is None:
+        roll_nums = layout_roll_nums(layout)
+    return cached_node_scores(tuple(layout), tuple(roll_nums), topology)
+
+
+# every node, best score first
+@lru_cache(maxsize=CACHED_LAYOUTS)
+def cached_ranked_nodes(layout, roll_nums, topology):
+    scores = cached_node_scores(layout, roll_nums, topology)
+    return tuple(sorted(range(topology.num_nodes), key=lambda node: -scores[node]))
+
+
+# the nodes a settlement can go on right now (see HexBoard.legal_settlements), best first
+def best_openings(board):
+    open_nodes = board.legal_settlements()
+    return [node for node in cached_ranked_nodes(tuple(board.hex_types), tuple(board.roll_nums), board.topology)
+            if open_nodes >> node & 1]
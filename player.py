@@ -1,24 +1,50 @@
 from text import SelectableText
+from resources import BUILD_COSTS, DevCardVector, ResourceVector
+from zobrist import MAX_COUNT
 import pygame
 
 
 class ServerPlayer:
     """Server view of a player"""
-    def __init__(self, channel):
+    def __init__(self, channel, seat=None, zobrist=None):
         self.channel = channel
+        # False for a player rebuilt from the journal until they rejoin on a real channel
+        self.connected = True
+        # position in the game's list of players, which is how the board tells players apart
+        self.seat = seat
         self.username = None
         self.color = None
-        self.resources = {'wood': 0, 'sheep': 0, 'wheat': 0, 'reddish-orange': 0,
-                          'ore': 0}
+        self.resources = ResourceVector()
         self.victory_points = 0
-        self.dev_cards = {'knight': 0, 'road_builder': 0, 'monopoly': 0}
+        self.dev_cards = DevCardVector()
+
+        # Zobrist hash of the resources held (see zobrist.py), if the game hashes positions
+        self.zobrist = zobrist
+        self.hash = 0 if zobrist is None else zobrist.resources_hash(seat, self.resources)
 
     def send(self, data):
         self.channel.Send(data)
 
+    # resource_changes is a delta in resource order (see resources.Resource)
     def modify_resources(self, resource_changes):
-        for key in resource_changes:
-            self.resources[key] += resource_changes[key]
+        if self.zobrist is not None:
+            keys = self.zobrist.resources[self.seat]
+            for resource, (count, change) in enumerate(zip(self.resources, resource_changes)):
+                if change:
+                    self.hash ^= (keys[resource][count % MAX_COUNT] ^
+                                  keys[resource][(count + change) % MAX_COUNT])
+        self.resources.add(resource_changes)
+
+    def set_resources(self, resources):
+        self.resources = resources
+        if self.zobrist is not None:
+            self.hash = self.zobrist.resources_hash(self.seat, resources)
+
+    def can_afford(self, build):
+        return self.resources.covers(BUILD_COSTS[build])
+
+    def pay_for(self, build):
+        self.modify_resources([-count for count in BUILD_COSTS[build]])
 
 
 
@@ -0,0 +1,365 @@
+import struct
+
+from PodSixNet.EndPoint import EndPoint
+from PodSixNet.rencode import dumps, loads
+
+from hex import HexType
+from resources import RESOURCE_NAMES
+
+# The compact wire format. Instead of a rencoded dict followed by the PodSixNet
+# terminator, every message is a 2 byte length followed by a 1 byte action code
+# and a fixed layout for that action's fields. Actions without a layout (or
+# messages whose fields don't fit it) are sent as code 0 + the rencoded dict,
+# so nothing ever has to be sent in the old format once a channel has switched.
+#
+# Either side can only switch after the other has said it understands the
+# format: the server lists 'compact' in the protocols of its init message, the
+# client answers with a protocol message (the last dict it ever sends), and the
+# server replies in kind (the last dict it ever sends).
+#
+# The same handshake turns on batching: every message queued on a channel
+# between two flushes goes out as a single 'batch' message (one frame, one
+# write), which the other side unpacks back into the individual messages.
+
+COMPACT = 'compact'
+BATCH = 'batch'
+
+FRAME_HEADER = struct.Struct('!H')
+FALLBACK_CODE = 0
+BATCH_CODE = 255  # payload is the batched messages, each with its own frame header
+
+# fixed order in which the five resources are packed
+RESOURCE_ORDER = RESOURCE_NAMES
+RESOURCES = struct.Struct('!5h')
+
+HEX_TYPES = list(HexType)
+HEX_TYPE_CODES = {hex_type.value: code for code, hex_type in enumerate(HEX_TYPES)}
+
+UINT8 = struct.Struct('!B')
+INT32 = struct.Struct('!i')
+BOOL = struct.Struct('!?')
+COLOR = struct.Struct('!3B')
+OPTIONS = struct.Struct('!B?')
+
+
+# each field kind is an (encode, decode) pair. encode appends the value to a
+# bytearray, decode reads it back from (buffer, position) and returns
+# (value, new position)
+def fixed(packer):
+    def encode(value, out):
+        out += packer.pack(value)
+
+    def decode(buf, pos):
+        return packer.unpack_from(buf, pos)[0], pos + packer.size
+    return encode, decode
+
+
+def encode_color(value, out):
+    out += COLOR.pack(*value)
+
+
+def decode_color(buf, pos):
+    return COLOR.unpack_from(buf, pos), pos + COLOR.size
+
+
+def encode_str(value, out):
+    raw = value.encode('utf-8')
+    out += UINT8.pack(len(raw))
+    out += raw
+
+
+def decode_str(buf, pos):
+    length = buf[pos]
+    pos += 1
+    return bytes(buf[pos:pos + length]).decode('utf-8'), pos + length
+
+
+# a board layout (list of hex colors) is one byte per hex
+def encode_layout(value, out):
+    out += UINT8.pack(len(value))
+    out += bytes(HEX_TYPE_CODES[tuple(color)] for color in value)
+
+
+def decode_layout(buf, pos):
+    length = buf[pos]
+    pos += 1
+    return [HEX_TYPES[code].value for code in buf[pos:pos + length]], pos + length
+
+
+def encode_resources(value, out):
+    out += RESOURCES.pack(*[value[resource] for resource in RESOURCE_ORDER])
+
+
+def decode_resources(buf, pos):
+    return dict(zip(RESOURCE_ORDER, RESOURCES.unpack_from(buf, pos))), pos + RESOURCES.size
+
+
+def encode_players(value, out):
+    out += UINT8.pack(len(value))
+    for player in value:
+        encode_str(player['username'], out)
+        encode_color(player['color'], out)
+
+
+def decode_players(buf, pos):
+    count = buf[pos]
+    pos += 1
+    players = []
+    for i in range(count):
+        username, pos = decode_str(buf, pos)
+        color, pos = decode_color(buf, pos)
+        players.append({'username': username, 'color': color})
+    return players, pos
+
+
+# a list of small indices (e.g. legal nodes / roads), one byte each
+def encode_indices(value, out):
+    out += UINT8.pack(len(value))
+    out += bytes(value)
+
+
+def decode_indices(buf, pos):
+    length = buf[pos]
+    pos += 1
+    return list(buf[pos:pos + length]), pos + length
+
+
+def encode_options(value, out):
+    out += OPTIONS.pack(value['num_players'], value['randomize'])
+
+
+def decode_options(buf, pos):
+    num_players, randomize = OPTIONS.unpack_from(buf, pos)
+    return {'num_players': num_players, 'randomize': randomize}, pos + OPTIONS.size
+
+
+# game_id is only attached by the client once it has one, so it may be missing
+def encode_optional_id(value, out):
+    out += INT32.pack(value)
+
+
+def decode_optional_id(buf, pos):
+    value = INT32.unpack_from(buf, pos)[0]
+    return (None if value == -1 else value), pos + INT32.size
+
+
+FIELD_KINDS = {'uint8': fixed(UINT8),
+               'int32': fixed(INT32),
+               'bool': fixed(BOOL),
+               'color': (encode_color, decode_color),
+               'str': (encode_str, decode_str),
+               'layout': (encode_layout, decode_layout),
+               'resources': (encode_resources, decode_resources),
+               'players': (encode_players, decode_players),
+               'indices': (encode_indices, decode_indices),
+               'options': (encode_options, decode_options),
+               'optional_id': (encode_optional_id, decode_optional_id)}
+
+
+# messages the server sends, in action code order (codes start at 1)
+SERVER_MESSAGES = [('init', []),
+                   ('check_hosting', [('accepted', 'bool'), ('game_id', 'int32')]),
+                   ('check_user_color', [('accept_username', 'bool'), ('accept_color', 'bool')]),
+                   ('game_board', [('layout', 'layout'), ('numbers', 'indices')]),
+                   ('current_players', [('players', 'players')]),
+                   ('new_player', [('username', 'str'), ('color', 'color')]),
+                   ('wait', [('cur_player', 'str')]),
+                   ('select_settlement', [('legal', 'indices')]),
+                   ('select_road', [('legal', 'indices')]),
+                   ('new_settlement', [('settlement', 'uint8'), ('color', 'color')]),
+                   ('new_road', [('road', 'uint8'), ('color', 'color')]),
+                   ('invalid', [('message', 'str')]),
+                   ('update_resources', [('resources', 'resources')]),
+                   ('roll_dice', []),
+                   ('wait_dice', [('roller', 'str')]),
+                   ('dice_result', [('left', 'uint8'), ('right', 'uint8')]),
+                   ('game_aborted', [('message', 'str')]),
+                   ('rejoin', [('accepted', 'bool')]),
+                   ('new_city', [('settlement', 'uint8'), ('color', 'color')]),
+                   ('trade_rates', [('rates', 'resources')]),
+                   ('player_turn', [('roads', 'indices'), ('settlements', 'indices'),
+                                    ('cities', 'indices'), ('trades', 'indices')])]
+
+# messages the client sends, in action code order
+CLIENT_MESSAGES = [('check_hosting', [('host', 'bool'), ('options', 'options'),
+                                      ('game_id', 'optional_id')]),
+                   ('user_color_selection', [('username', 'str'), ('color', 'color'),
+                                             ('game_id', 'optional_id')]),
+                   ('select_settlement', [('settlement', 'uint8'), ('game_id', 'optional_id')]),
+                   ('select_road', [('road', 'uint8'), ('game_id', 'optional_id')]),
+                   ('stop_dice', [('game_id', 'optional_id')]),
+                   ('rejoin', [('username', 'str'), ('game_id', 'optional_id')]),
+                   ('build_road', [('road', 'uint8'), ('game_id', 'optional_id')]),
+                   ('build_settlement', [('settlement', 'uint8'), ('game_id', 'optional_id')]),
+                   ('build_city', [('settlement', 'uint8'), ('game_id', 'optional_id')]),
+                   ('end_turn', [('game_id', 'optional_id')]),
+                   ('bank_trade', [('give', 'str'), ('get', 'str'), ('game_id', 'optional_id')])]
+
+
+class MessageTable:
+    """Action codes and field layouts for the messages sent in one direction"""
+    def __init__(self, messages):
+        self.codes = {}
+        self.layouts = {}  # code -> (action, fields)
+        self.keys = {}  # code -> every key the layout can carry, including 'action'
+        self.required = {}  # code -> the keys that must be present to use the layout
+        for code, (action, fields) in enumerate(messages, 1):
+            self.codes[action] = code
+            self.layouts[code] = (action, [(key, kind, FIELD_KINDS[kind]) for key, kind in fields])
+            self.keys[code] = {key for key, kind in fields} | {'action'}
+            self.required[code] = {key for key, kind in fields if kind != 'optional_id'}
+
+    # turn a message dict into the compact payload (without the frame header)
+    def encode(self, data):
+        if data.get('action') == BATCH:
+            return UINT8.pack(BATCH_CODE) + b''.join(frame(self.encode(message))
+                                                     for message in data['messages'])
+        code = self.codes.get(data.get('action'))
+        # only use the fixed layout if it accounts for every key in the message
+        if code is not None and data.keys() <= self.keys[code] and self.required[code] <= data.keys():
+            out = bytearray(UINT8.pack(code))
+            try:
+                for key, kind, (encode, decode) in self.layouts[code][1]:
+                    if kind == 'optional_id':
+                        encode(data.get(key, -1), out)
+                    else:
+                        encode(data[key], out)
+                return bytes(out)
+            except (AttributeError, KeyError, TypeError, ValueError, struct.error):
+                # a value doesn't fit its usual layout; fall through
+                pass
+        return UINT8.pack(FALLBACK_CODE) + dumps(data)
+
+    # turn a compact payload back into the message dict
+    def decode(self, payload):
+        code = payload[0]
+        if code == FALLBACK_CODE:
+            return loads(bytes(payload[1:]))
+        if code == BATCH_CODE:
+            messages = []
+            pos = 1
+            while pos < len(payload):
+                length = FRAME_HEADER.unpack_from(payload, pos)[0]
+                pos += FRAME_HEADER.size
+                messages.append(self.decode(payload[pos:pos + length]))
+                pos += length
+            return {'action': BATCH, 'messages': messages}
+        action, fields = self.layouts[code]
+        data = {'action': action}
+        pos = 1
+        for key, kind, (encode, decode) in fields:
+            value, pos = decode(payload, pos)
+            if value is not None:
+                data[key] = value
+        return data
+
+
+SERVER_TABLE = MessageTable(SERVER_MESSAGES)
+CLIENT_TABLE = MessageTable(CLIENT_MESSAGES)
+
+
+def frame(payload):
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class CompactChannelMixin:
+    """Adds the negotiated compact format and message batching to a PodSixNet
+    Channel / EndPoint. Subclasses set outgoing_table and incoming_table."""
+    outgoing_table = None
+    incoming_table = None
+
+    compact_in = False
+    compact_out = False
+    batch_out = False  # can the other side unpack batches?
+    negotiated = False
+    frame_length = None  # None while waiting for a frame header
+
+    def __init__(self, *args, **kwargs):
+        # messages sent since the last flush, still as dicts
+        self.outbox = []
+        super().__init__(*args, **kwargs)
+
+    # messages are only encoded when the channel is flushed (see Pump), so
+    # that everything sent while handling one inbound action can be batched
+    def Send(self, data):
+        self.outbox.append(data)
+
+    def Pump(self):
+        self.seal_outbox()
+        super().Pump()
+
+    # encode the outbox onto the send queue in the current format
+    def seal_outbox(self):
+        if not self.outbox:
+            return
+        messages = self.outbox
+        self.outbox = []
+        if len(messages) > 1 and self.batch_out:
+            try:
+                self.sendqueue.append(self.encode_frame({'action': BATCH, 'messages': messages}))
+                return
+            except struct.error:
+                # too big for one compact frame, send them one at a time
+                pass
+        for data in messages:
+            self.sendqueue.append(self.encode_frame(data))
+
+    def encode_frame(self, data):
+        if self.compact_out:
+            return frame(self.outgoing_table.encode(data))
+        return dumps(data) + self.endchars.encode()
+
+    def found_terminator(self):
+        if not self.compact_in:
+            data = loads(self._ibuffer)
+            self._ibuffer = b''
+            if isinstance(data, dict) and 'action' in data:
+                self.dispatch(data)
+            else:
+                print('OOB data:', data)
+            if self.compact_in:
+                # that was the last message in the old format
+                self.set_terminator(FRAME_HEADER.size)
+            return
+
+        if self.frame_length is None:
+            self.frame_length = FRAME_HEADER.unpack(self._ibuffer)[0]
+            self._ibuffer = b''
+            self.set_terminator(self.frame_length)
+            return
+
+        payload = self._ibuffer
+        self._ibuffer = b''
+        self.frame_length = None
+        self.set_terminator(FRAME_HEADER.size)
+        self.dispatch(self.incoming_table.decode(payload))
+
+    def dispatch(self, data):
+        if data['action'] == BATCH:
+            for message in data['messages']:
+                self.dispatch(message)
+            return
+        [getattr(self, n)(data) for n in ('Network_' + data['action'], 'Network') if hasattr(self, n)]
+
+    # tell the other side which format we are about to send in and whether we
+    # can unpack batches. called first by the client, then by the server in reply
+    def negotiate(self, compact, batch):
+        self.Send({'action': 'protocol', 'format': COMPACT if compact else 'dict', 'batch': batch})
+        # anything queued so far, including that message, still goes out as dicts
+        self.seal_outbox()
+        self.compact_out = compact
+        self.negotiated = True
+
+    # the other side has switched what it sends; switch what we read, and
+    # answer in kind if we haven't said anything yet
+    def Network_protocol(self, data):
+        self.compact_in = data.get('format') == COMPACT
+        self.batch_out = bool(data.get('batch'))
+        if not self.negotiated:
+            self.negotiate(self.compact_in, self.batch_out)
+
+
+class CompactEndPoint(CompactChannelMixin, EndPoint):
+    """Client end of the connection, able to switch to the compact format"""
+    outgoing_table = CLIENT_TABLE
+    incoming_table = SERVER_TABLE
@@ -0,0 +1,116 @@
+from enum import IntEnum
+
+from hex import HexType
+
+
+class Resource(IntEnum):
+    """The five resources, valued by their position in a ResourceVector"""
+    WOOD = 0
+    REDDISH_ORANGE = 1
+    SHEEP = 2
+    WHEAT = 3
+    ORE = 4
+
+
+class DevCard(IntEnum):
+    """Development cards, valued by their position in a DevCardVector"""
+    KNIGHT = 0
+    ROAD_BUILDER = 1
+    MONOPOLY = 2
+
+
+NUM_RESOURCES = len(Resource)
+
+# the names used for resources / dev cards in messages, in vector order
+RESOURCE_NAMES = ['wood', 'reddish-orange', 'sheep', 'wheat', 'ore']
+DEV_CARD_NAMES = ['knight', 'road_builder', 'monopoly']
+
+# what each type of hex produces
+HEX_RESOURCE = {HexType.FOREST: Resource.WOOD, HexType.REDDISH_ORANGE: Resource.REDDISH_ORANGE,
+                HexType.SHEEP: Resource.SHEEP, HexType.WHEAT: Resource.WHEAT,
+                HexType.MOUNTAIN: Resource.ORE, HexType.CACTUS: None}
+
+
+class CountVector:
+    """A fixed-order list of counts, indexed by an IntEnum (or position)"""
+    __slots__ = ('counts',)
+    names = []
+
+    def __init__(self, counts=None):
+        self.counts = [0] * len(self.names) if counts is None else list(counts)
+
+    @classmethod
+    def from_dict(cls, named_counts):
+        return cls(named_counts.get(name, 0) for name in cls.names)
+
+    def __getitem__(self, index):
+        return self.counts[index]
+
+    def __setitem__(self, index, value):
+        self.counts[index] = value
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __eq__(self, other):
+        return isinstance(other, CountVector) and self.counts == other.counts
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.as_dict())
+
+    # add another vector (or any sequence in the same order) to this one
+    def add(self, delta):
+        self.counts = [count + change for count, change in zip(self.counts, delta)]
+
+    def subtract(self, delta):
+        self.counts = [count - change for count, change in zip(self.counts, delta)]
+
+    # does this hold at least everything in cost?
+    def covers(self, cost):
+        for count, needed in zip(self.counts, cost):
+            if count < needed:
+                return False
+        return True
+
+    def total(self):
+        return sum(self.counts)
+
+    # {name: count}, the form used in messages
+    def as_dict(self):
+        return dict(zip(self.names, self.counts))
+
+
+class ResourceVector(CountVector):
+    __slots__ = ()
+    names = RESOURCE_NAMES
+
+
+class DevCardVector(CountVector):
+    __slots__ = ()
+    names = DEV_CARD_NAMES
+
+
+class Build(IntEnum):
+    """Things a player can spend resources on"""
+    ROAD = 0
+    SETTLEMENT = 1
+    CITY = 2
+    DEV_CARD = 3
+
+
+# what each Build costs, in resource order (wood, reddish-orange, sheep, wheat, ore)
+BUILD_COSTS = {Build.ROAD: (1, 1, 0, 0, 0),
+               Build.SETTLEMENT: (1, 1, 1, 1, 0),
+               Build.CITY: (0, 0, 0, 2, 3),
+               Build.DEV_CARD: (0, 0, 1, 1, 1)}
+
+
+# every Build the resources cover
+def affordable(resources):
+    return [build for build, cost in BUILD_COSTS.items() if resources.covers(cost)]
+
+
+# apply a batch of changes, {player: resource delta}, in one pass
+def distribute(deltas):
+    for player, delta in deltas.items():
+        player.modify_resources(delta)
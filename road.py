@@ -2,15 +2,7 @@ import pygame
 from common import *
 
 
-# for server use. for client road representation see below
-class Road:
-    """Represents the roads connecting nodes"""
-    def __init__(self, nodes):
-        self.nodes = nodes
-        self.owner = None
-
-
-# for client use. for server road representation see above
+# for client use. the server keeps road ownership in HexBoard (see hex_board.py)
 class GameRoad:
     """Represents the roads drawn around the hexes in the board"""
     select_color = WHITE
@@ -0,0 +1,302 @@
+from enum import Enum
+
+from hex_board import HexBoard
+from board_generator import next_board
+from dice_stream import DiceStream
+from player import ServerPlayer
+from resources import BUILD_COSTS, HEX_RESOURCE, NUM_RESOURCES, Build, distribute
+from zobrist import MAX_PLAYERS
+from board_topology import mask_indices, topology_for_players
+
+# The rules of the game on their own, with no networking: a position, the
+# moves that are legal in it, and apply / undo of a move. Game (game.py) puts
+# clients in front of this; searches and simulations can drive it directly.
+#
+# Moves are plain tuples, a kind and its arguments:
+#   (SETTLE, node)               setup settlement
+#   (ROAD, road)                 setup road
+#   (ROLL, left, right)          dice faces, 0 - 5 each
+#   (BUILD_ROAD, road)
+#   (BUILD_SETTLEMENT, node)
+#   (BUILD_CITY, node)
+#   (BANK_TRADE, give, get)      resources, at the player's rate for give
+#   (END_TURN,)
+#
+# apply() pushes a small diff (what the move changed, not a copy of the
+# board or players) onto undo_stack, and undo() pops one off and reverses it.
+
+SETTLE = 'settle'
+ROAD = 'road'
+ROLL = 'roll'
+BUILD_ROAD = 'build_road'
+BUILD_SETTLEMENT = 'build_settlement'
+BUILD_CITY = 'build_city'
+END_TURN = 'end_turn'
+BANK_TRADE = 'bank_trade'
+
+# every roll of the two dice, as faces
+DICE_ROLLS = [(ROLL, left, right) for left in range(6) for right in range(6)]
+
+# what each build move pays for
+MOVE_BUILDS = {BUILD_ROAD: Build.ROAD, BUILD_SETTLEMENT: Build.SETTLEMENT, BUILD_CITY: Build.CITY}
+
+
+# represents the different states that the game can be in
+class GameState(Enum):
+    PLAYER_SETUP = 0
+    SETTLEMENT_SETUP = 1
+    NEW_TURN = 2
+    GET_CARDS = 3
+    GET_TILE = 4
+    GET_PLAYER = 5
+    PLAYER_TURN = 6
+    ROLL_DICE = 7
+    TRADE_MESSAGE = 8
+    END_GAME = 9
+
+
+class Rules:
+    """A game's board, players and whose turn it is, changed only through apply / undo"""
+    def __init__(self, max_num_players, randomize, layout=None, roll_nums=None, dice_seed=None):
+        # the number of players that must be in the game before it starts
+        self.max_num_players = max_num_players
+
+        self.randomize = randomize
+
+        self.players = []
+
+        # 5 - 6 player games are played on the bigger board
+        topology = topology_for_players(max_num_players)
+        if randomize and layout is None:
+            # a shuffled board that keeps to board_generator's fairness constraints
+            layout, roll_nums = next_board(topology)
+        self.hex_board = HexBoard(randomize, layout, topology, roll_nums)
+
+        # every roll of the game comes from here; dice.seed plays them all again
+        self.dice = DiceStream(dice_seed)
+
+        self.state = GameState.PLAYER_SETUP
+        self.cur_player = None  # whose turn is it?
+        # Zobrist hash of the state and whose turn it is; kept up to date by
+        # set_state / set_cur_player. see position_hash
+        self.zobrist = self.hex_board.zobrist
+        self.hash = self.zobrist.state[self.state.value] ^ self.zobrist.cur_player[MAX_PLAYERS]
+
+        # used in SETTLEMENT_SETUP:
+        self.select_settlement = None
+        self.second_round = None
+
+        # one entry per applied move: (move, turn before it, resource changes, board diff)
+        self.undo_stack = []
+
+    def add_player(self, channel=None):
+        player = ServerPlayer(channel, len(self.players), self.zobrist)
+        self.players.append(player)
+        return player
+
+    # everyone is seated; the first player picks a settlement
+    def start(self):
+        self.set_state(GameState.SETTLEMENT_SETUP)
+        self.select_settlement = True
+        self.second_round = False
+        self.set_cur_player(self.players[0])
+
+    def set_state(self, state):
+        self.hash ^= self.zobrist.state[self.state.value] ^ self.zobrist.state[state.value]
+        self.state = state
+
+    def set_cur_player(self, player):
+        self.hash ^= self.zobrist.cur_player[self.seat_of(self.cur_player)] ^ \
+            self.zobrist.cur_player[self.seat_of(player)]
+        self.cur_player = player
+
+    def seat_of(self, player):
+        return MAX_PLAYERS if player is None else player.seat
+
+    # get the next player in the rotation from the current player
+    def get_next_player(self):
+        return self.players[(self.cur_player.seat + 1) % len(self.players)]
+
+    # a 64 bit hash of the whole position (board, state, whose turn, everyone's
+    # resources), e.g. as the key of a zobrist.TranspositionCache. equal
+    # positions hash the same however they were reached
+    def position_hash(self):
+        position_hash = self.hash ^ self.hex_board.hash
+        for player in self.players:
+            position_hash ^= player.hash
+        return position_hash
+
+    # one per settlement and two per city
+    def victory_points(self, player):
+        board = self.hex_board
+        nodes = mask_indices(board.player_nodes.get(player, 0))
+        return len(nodes) + sum(board.node_city[node] for node in nodes)
+
+    # the ROLL move for the next roll of the game's dice
+    def roll_dice(self):
+        left, right = self.dice.next_roll()
+        return ROLL, left, right
+
+    # the kinds of move the current player can make in this state
+    def move_kinds(self):
+        if self.state is GameState.SETTLEMENT_SETUP:
+            return (SETTLE,) if self.select_settlement else (ROAD,)
+        if self.state is GameState.ROLL_DICE:
+            return (ROLL,)
+        if self.state is GameState.PLAYER_TURN:
+            return (BUILD_ROAD, BUILD_SETTLEMENT, BUILD_CITY, BANK_TRADE, END_TURN)
+        return ()
+
+    # every move the current player can make
+    def legal_moves(self):
+        board = self.hex_board
+        player = self.cur_player
+        if self.state is GameState.SETTLEMENT_SETUP:
+            if self.select_settlement:
+                return [(SETTLE, node) for node in board.legal_settlement_indices()]
+            return [(ROAD, road) for road in board.legal_road_indices(player)]
+        if self.state is GameState.ROLL_DICE:
+            return list(DICE_ROLLS)
+        if self.state is not GameState.PLAYER_TURN:
+            return []
+
+        moves = [(END_TURN,)]
+        if player.can_afford(Build.ROAD):
+            moves += [(BUILD_ROAD, road) for road in board.legal_road_indices(player)]
+        if player.can_afford(Build.SETTLEMENT):
+            moves += [(BUILD_SETTLEMENT, node) for node in board.legal_connected_settlements_indices(player)]
+        if player.can_afford(Build.CITY):
+            moves += [(BUILD_CITY, node) for node in mask_indices(board.player_nodes.get(player, 0))
+                      if not board.node_city[node]]
+        rates = board.trade_rates(player)
+        moves += [(BANK_TRADE, give, get) for give in range(NUM_RESOURCES) if player.resources[give] >= rates[give]
+                  for get in range(NUM_RESOURCES) if get != give]
+        return moves
+
+    # can the current player make this move? checks one move without listing them all
+    def is_legal(self, move):
+        kind = move[0]
+        if kind not in self.move_kinds():
+            return False
+        board = self.hex_board
+        player = self.cur_player
+        if kind == SETTLE:
+            return board.valid_settlement(move[1])
+        if kind == ROAD:
+            return board.valid_road(move[1], player)
+        if kind in MOVE_BUILDS and not player.can_afford(MOVE_BUILDS[kind]):
+            return False
+        if kind == BUILD_ROAD:
+            return board.valid_road(move[1], player)
+        if kind == BUILD_SETTLEMENT:
+            node = move[1]
+            return 0 <= node < board.topology.num_nodes and \
+                board.legal_connected_settlements(player) >> node & 1 == 1
+        if kind == BUILD_CITY:
+            node = move[1]
+            return 0 <= node < board.topology.num_nodes and \
+                board.node_owner[node] is player and not board.node_city[node]
+        if kind == BANK_TRADE:
+            give, get = move[1], move[2]
+            return 0 <= give < NUM_RESOURCES and 0 <= get < NUM_RESOURCES and give != get and \
+                player.resources[give] >= board.trade_rates(player)[give]
+        return True
+
+    # make a legal move for the current player. returns the resources it
+    # changed, {player: resource delta}
+    def apply(self, move):
+        kind = move[0]
+        board = self.hex_board
+        player = self.cur_player
+        turn = (self.state, self.cur_player, self.select_settlement, self.second_round, self.hash)
+        changes = {}
+        board_diff = None
+
+        if kind == SETTLE:
+            # per Catan rules give the player one of each resource their selected node borders
+            changes[player] = self.resources_around_node(move[1])
+            board_diff = board.settle(move[1], player)
+            self.select_settlement = False
+        elif kind == ROAD:
+            board_diff = board.set_road(move[1], player)
+            # if this was the last player in the list and we have already gone
+            # through this process once, move on to the actual turns
+            self.set_cur_player(self.get_next_player())
+            self.select_settlement = True
+            if player is self.players[-1]:
+                if self.second_round:
+                    self.set_state(GameState.ROLL_DICE)
+                else:
+                    # go around again picking settlements / roads
+                    self.second_round = True
+        elif kind == ROLL:
+            # dice faces are 0 - 5
+            changes = board.produce(move[1] + move[2] + 2)
+            self.set_state(GameState.PLAYER_TURN)
+        elif kind == END_TURN:
+            self.set_cur_player(self.get_next_player())
+            self.set_state(GameState.ROLL_DICE)
+        elif kind == BANK_TRADE:
+            changes[player] = trade_delta(move[1], move[2], board.trade_rates(player)[move[1]])
+        else:
+            changes[player] = [-count for count in BUILD_COSTS[MOVE_BUILDS[kind]]]
+            if kind == BUILD_ROAD:
+                board_diff = board.set_road(move[1], player)
+            elif kind == BUILD_SETTLEMENT:
+                board_diff = board.settle(move[1], player)
+            else:
+                board.upgrade_city(move[1])
+
+        distribute(changes)
+        self.undo_stack.append((move, turn, changes, board_diff))
+        return changes
+
+    # take back the last applied move
+    def undo(self):
+        move, turn, changes, board_diff = self.undo_stack.pop()
+        kind = move[0]
+        board = self.hex_board
+        (self.state, self.cur_player, self.select_settlement, self.second_round, self.hash) = turn
+
+        for changed, delta in changes.items():
+            changed.modify_resources([-change for change in delta])
+        if kind in (SETTLE, BUILD_SETTLEMENT):
+            board.undo_settle(move[1], board_diff)
+        elif kind in (ROAD, BUILD_ROAD):
+            board.undo_set_road(move[1], board_diff)
+        elif kind == BUILD_CITY:
+            board.undo_upgrade_city(move[1])
+
+    # the bank trades that would let the current player afford cost, cheapest
+    # first, or None if their resources can't cover it even with trades
+    def trades_for(self, cost):
+        player = self.cur_player
+        rates = self.hex_board.trade_rates(player)
+        missing = [get for get in range(NUM_RESOURCES) for i in range(cost[get] - player.resources[get])]
+        # what each resource has to spare, and how many trades that makes
+        spare = [max(count - needed, 0) for count, needed in zip(player.resources, cost)]
+        trades = []
+        for give in sorted(range(NUM_RESOURCES), key=rates.__getitem__):
+            while missing and spare[give] >= rates[give]:
+                spare[give] -= rates[give]
+                trades.append((BANK_TRADE, give, missing.pop()))
+        return None if missing else trades
+
+    # get the resources from the hexes adjacent to the the node (given by index) as a
+    # delta that can be processed by the Player class (one count per Resource)
+    def resources_around_node(self, node_index):
+        new_resources = [0] * NUM_RESOURCES
+        hex_types = self.hex_board.hex_types
+        for hex_index in self.hex_board.topology.node_hexes[node_index]:
+            resource = HEX_RESOURCE[hex_types[hex_index]]
+            if resource is not None:
+                new_resources[resource] += 1
+        return new_resources
+
+
+# the resource delta of giving rate of give to the bank for one get
+def trade_delta(give, get, rate):
+    delta = [0] * NUM_RESOURCES
+    delta[give] = -rate
+    delta[get] = 1
+    return delta
@@ -0,0 +1,121 @@
+import heapq
+import selectors
+
+from time import monotonic
+
+
+class EventLoop:
+    """Selector-based loop that only wakes when a socket is ready or a timer is due"""
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        # (deadline, sequence number, callback) -- the sequence number keeps
+        # the heap from ever comparing two callbacks
+        self.timers = []
+        self.timer_count = 0
+        # dispatchers whose outgoing data or write interest may have changed
+        # since the last pass through the loop
+        self.dirty = set()
+        self.running = False
+
+    # start watching an asyncore dispatcher (server socket or channel) for input
+    def register(self, dispatcher):
+        self.selector.register(dispatcher.socket, selectors.EVENT_READ, dispatcher)
+
+    # stop watching a dispatcher. must happen before its socket is closed,
+    # otherwise the os may hand the same fd to a new connection first
+    def unregister(self, dispatcher):
+        self.dirty.discard(dispatcher)
+        try:
+            self.selector.unregister(dispatcher.socket)
+        except (KeyError, ValueError):
+            # never registered, or already gone
+            pass
+
+    # the dispatcher has queued something to send; it will be flushed and have
+    # its write interest updated once the current events have been handled
+    def mark_dirty(self, dispatcher):
+        self.dirty.add(dispatcher)
+
+    # run callback once, delay seconds from now
+    def call_later(self, delay, callback):
+        self.timer_count += 1
+        heapq.heappush(self.timers, (monotonic() + delay, self.timer_count, callback))
+
+    # run callback every interval seconds for as long as the loop runs
+    def call_every(self, interval, callback):
+        def repeat():
+            callback()
+            self.call_later(interval, repeat)
+        self.call_later(interval, repeat)
+
+    # how long select() may block: until the next timer, or forever if there is none
+    def next_timeout(self):
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - monotonic())
+
+    def run_timers(self):
+        now = monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            callback = heapq.heappop(self.timers)[2]
+            callback()
+
+    # push out whatever the dirty dispatchers have queued and only ask the
+    # selector for write readiness when a send could not complete
+    def flush(self):
+        while self.dirty:
+            dispatcher = self.dirty.pop()
+            if self.key_for(dispatcher) is None:
+                # closed while it was waiting to be flushed
+                continue
+            # only channels are ever marked dirty, and their Pump just moves
+            # the send queue onto the socket
+            dispatcher.Pump()
+            key = self.key_for(dispatcher)
+            if key is None:
+                # the send failed and closed the channel
+                continue
+            events = selectors.EVENT_READ
+            if dispatcher.writable():
+                events |= selectors.EVENT_WRITE
+            if key.events != events:
+                self.selector.modify(dispatcher.socket, events, dispatcher)
+
+    # the selector key for a dispatcher, or None if it is not (or no longer) watched
+    def key_for(self, dispatcher):
+        try:
+            return self.selector.get_key(dispatcher.socket)
+        except (KeyError, ValueError):
+            return None
+
+    # is the selector still watching the socket this key was issued for?
+    def watching(self, key):
+        current = self.selector.get_map().get(key.fd)
+        return current is not None and current.data is key.data
+
+    # a single pass: block until something happens, handle it, then flush
+    def run_once(self):
+        for key, events in self.selector.select(self.next_timeout()):
+            dispatcher = key.data
+            if not self.watching(key):
+                # closed by an earlier event in this same batch
+                continue
+            try:
+                if events & selectors.EVENT_READ:
+                    dispatcher.handle_read_event()
+                if events & selectors.EVENT_WRITE and self.watching(key):
+                    dispatcher.handle_write_event()
+                    self.mark_dirty(dispatcher)
+            except Exception:
+                dispatcher.handle_error()
+            self.flush()
+        self.run_timers()
+        self.flush()
+
+    def run_forever(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
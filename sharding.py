@@ -0,0 +1,272 @@
+import multiprocessing
+
+from game import Game, GameState
+from player import ServerPlayer
+
+
+# worker side
+
+class ProxyChannel:
+    """Stands in for a client's channel inside a worker, collecting what the game sends it"""
+    def __init__(self, channel_id, outgoing):
+        self.channel_id = channel_id
+        self.outgoing = outgoing
+
+    def Send(self, data):
+        self.outgoing.append((self.channel_id, data))
+
+
+# runs in its own process, owning every game routed to it. each command from
+# the front process is answered with the messages the game produced and the
+# state the game ended up in. a command that raises only ends its own game:
+# the worker drops it and answers 'failed', so the front process aborts it
+def run_worker(conn):
+    games = {}
+    channels = {}  # (game_id, channel_id) -> ProxyChannel
+    outgoing = []
+    while True:
+        try:
+            command = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            # the front process has gone away
+            return
+        game_id = command[1]
+        try:
+            game = run_command(command, games, channels, outgoing)
+        except Exception as error:
+            print('Game {} failed on {!r}: {!r}'.format(game_id, command[0], error))
+            del outgoing[:]
+            remove_game(game_id, games, channels)
+            conn.send(('failed', game_id, None, []))
+            continue
+        if game is not None:
+            conn.send(('messages', game_id, game.state.value, outgoing[:]))
+            del outgoing[:]
+
+
+# carry out one command from the front process. returns the game it went to
+# if the front process is waiting for its messages
+def run_command(command, games, channels, outgoing):
+    kind, game_id = command[0], command[1]
+
+    if kind == 'create':
+        num_players, randomize = command[2:]
+        games[game_id] = Game(num_players, randomize)
+        return None
+    if kind == 'remove':
+        remove_game(game_id, games, channels)
+        return None
+
+    game = games.get(game_id)
+    if game is None:
+        return None
+    channel_id = command[2]
+    if kind == 'add_player':
+        channel = ProxyChannel(channel_id, outgoing)
+        channels[(game_id, channel_id)] = channel
+        game.add_player(channel)
+    elif kind == 'action':
+        channel = channels.get((game_id, channel_id))
+        if channel is not None:
+            action, data = command[3:]
+            game.handle_network(channel, action, data)
+    return game
+
+
+def remove_game(game_id, games, channels):
+    game = games.pop(game_id, None)
+    if game is not None:
+        for player in game.players:
+            channels.pop((game_id, player.channel.channel_id), None)
+        game.release()
+
+
+# front side
+
+class RemoteGame:
+    """The front process's view of a game that lives in a shard worker.
+    Looks enough like a Game for matchmaking and the registry"""
+    def __init__(self, max_num_players, randomize):
+        self.max_num_players = max_num_players
+        self.randomize = randomize
+        self.num_active_players = 0
+        # only the channels are known here; they are used to reach the players
+        self.players = []
+        # mirrored from the worker after every command it answers
+        self.state = GameState.PLAYER_SETUP
+
+        # set by ShardRouter.create
+        self.game_id = None
+        self.shard = None
+
+    def is_full(self):
+        return self.num_active_players == self.max_num_players
+
+    # a game whose command failed or whose worker died has no shard; it has been
+    # aborted, so whatever its players still send is dropped until it is evicted
+    def add_player(self, channel):
+        if self.shard is None:
+            return
+        self.num_active_players += 1
+        self.players.append(ServerPlayer(channel))
+        self.shard.send(('add_player', self.game_id, self.shard.router.channel_id(channel)))
+
+    def handle_network(self, channel, action_name, data):
+        if self.shard is None:
+            return
+        self.shard.send(('action', self.game_id, self.shard.router.channel_id(channel),
+                         action_name, data))
+
+    # games rebuilt from a journal only exist on an unsharded server
+    def rejoin(self, channel, username):
+        return False
+
+    def end_journal(self):
+        pass
+
+    def release(self):
+        if self.shard is not None:
+            self.shard.games.pop(self.game_id, None)
+            self.shard.send(('remove', self.game_id))
+        self.players = []
+
+
+class Shard:
+    """A worker process and the pipe to it"""
+    def __init__(self, router, index):
+        self.router = router
+        self.index = index
+        self.games = {}  # game_id -> RemoteGame for every game this worker owns
+        self.conn, child_conn = router.context.Pipe()
+        self.process = router.context.Process(target=run_worker, args=(child_conn,),
+                                              name='catan-shard-{}'.format(index), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # lets the event loop watch the pipe like any other socket
+        self.socket = self.conn
+
+    def send(self, command):
+        try:
+            self.conn.send(command)
+        except (BrokenPipeError, EOFError, OSError):
+            self.router.shard_died(self)
+
+    # the worker has answered one or more commands
+    def handle_read_event(self):
+        try:
+            while self.conn.poll():
+                kind, game_id, state, outgoing = self.conn.recv()
+                if kind == 'failed':
+                    self.router.game_failed(self, game_id)
+                else:
+                    self.router.deliver(game_id, GameState(state), outgoing)
+        except (EOFError, OSError):
+            self.router.shard_died(self)
+
+    def handle_write_event(self):
+        pass
+
+    def writable(self):
+        return False
+
+    def handle_error(self):
+        self.router.shard_died(self)
+
+
+class ShardRouter:
+    """Sends each game's traffic to the worker that owns it (chosen by game_id)
+    and relays the workers' messages back to the players' channels"""
+    check_interval = 5  # seconds between checks that every worker is still running
+
+    def __init__(self, server, num_shards):
+        self.server = server
+        self.context = multiprocessing.get_context('spawn')
+        self.next_channel_id = 0
+        self.channel_ids = {}  # channel -> channel_id
+        self.channels = {}  # channel_id -> channel
+        self.shards = [Shard(self, i) for i in range(num_shards)]
+
+    def shard_for(self, game_id):
+        return self.shards[game_id % len(self.shards)]
+
+    # hand a freshly registered game to its worker
+    def create(self, game_id, game):
+        shard = self.shard_for(game_id)
+        game.game_id = game_id
+        game.shard = shard
+        shard.games[game_id] = game
+        shard.send(('create', game_id, game.max_num_players, game.randomize))
+
+    def channel_id(self, channel):
+        try:
+            return self.channel_ids[channel]
+        except KeyError:
+            channel_id = self.next_channel_id
+            self.next_channel_id += 1
+            self.channel_ids[channel] = channel_id
+            self.channels[channel_id] = channel
+            return channel_id
+
+    def forget_channel(self, channel):
+        channel_id = self.channel_ids.pop(channel, None)
+        if channel_id is not None:
+            del self.channels[channel_id]
+
+    def deliver(self, game_id, state, outgoing):
+        game = self.server.games.get(game_id)
+        if game is None:
+            # evicted while the worker was still busy with it
+            return
+        game.state = state
+        for channel_id, data in outgoing:
+            channel = self.channels.get(channel_id)
+            if channel is not None:
+                channel.Send(data)
+        self.server.games.touch(game_id)
+
+    # a command raised in the worker, which has dropped the game. end it here too
+    def game_failed(self, shard, game_id):
+        game = shard.games.pop(game_id, None)
+        if game is not None:
+            game.shard = None
+        self.server.games.abort(game_id, 'the server lost this game')
+
+    # a worker crashed. only the games it owned are lost: end them, tell
+    # their players, and start a fresh worker in its place for new games
+    def shard_died(self, shard):
+        if self.shards[shard.index] is not shard:
+            # already replaced
+            return
+        print('Shard {} died, ending {} games'.format(shard.index, len(shard.games)))
+        if self.server.loop is not None:
+            self.server.loop.unregister(shard)
+        shard.conn.close()
+        for game_id in list(shard.games):
+            game = shard.games.pop(game_id)
+            game.shard = None
+            self.server.games.abort(game_id, 'the server lost this game')
+        replacement = self.shards[shard.index] = Shard(self, shard.index)
+        if self.server.loop is not None:
+            self.server.loop.register(replacement)
+
+    # a worker that died without closing its pipe (or before anything was read
+    # from it) isn't noticed by the reads, so every worker is checked now and then
+    def check_workers(self):
+        for shard in list(self.shards):
+            if not shard.process.is_alive():
+                self.shard_died(shard)
+
+    # for the polling loop: handle whatever the workers have sent
+    def poll(self):
+        for shard in list(self.shards):
+            if shard.conn.poll():
+                shard.handle_read_event()
+        self.check_workers()
+
+    def register(self, loop):
+        for shard in self.shards:
+            loop.register(shard)
+
+    def shutdown(self):
+        for shard in self.shards:
+            shard.process.terminate()
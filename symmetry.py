@@ -0,0 +1,115 @@
+from functools import lru_cache
+
+from board_topology import STANDARD_TOPOLOGY
+from hex import HexType
+
+# The standard board looks the same turned by any multiple of 60 degrees or
+# flipped over, so up to 12 layouts are really one board. A board's canonical
+# form is the smallest of its images under those symmetries; the canonical
+# key names it, and anything worked out per board can be kept once per key.
+#
+# The symmetries are the permutations of the nodes that keep every road a
+# road (automorphisms of the node graph), found once per topology by
+# backtracking. Each one carries the hexes along with it, and is kept as a
+# pair of tables, hex -> hex and node -> node, indexed the way
+# NODE_INDICES_TO_HEX and the rest of board_topology are.
+
+# a small number for each HexType, for keys
+TYPE_CODES = {hex_type: code for code, hex_type in enumerate(HexType)}
+
+
+class Symmetry:
+    """One symmetry of a board: where it takes each hex and each node"""
+    def __init__(self, hex_perm, node_perm):
+        self.hex_perm = hex_perm
+        self.node_perm = node_perm
+        # the other way: which hex ends up at each hex
+        self.hex_sources = tuple(sorted(range(len(hex_perm)), key=hex_perm.__getitem__))
+
+    # the board it turns a board (a value per hex, e.g. its type) into
+    def apply(self, hex_values):
+        return [hex_values[source] for source in self.hex_sources]
+
+
+@lru_cache(maxsize=None)
+def symmetries(topology=STANDARD_TOPOLOGY):
+    neighbors = topology.node_neighbors
+    num_nodes = topology.num_nodes
+    # nodes in breadth first order from node 0, each after a neighbor (its parent)
+    order, parents = [0], [None]
+    seen = {0}
+    for node in order:
+        for neighbor in neighbors[node]:
+            if neighbor not in seen:
+                seen.add(neighbor)
+                order.append(neighbor)
+                parents.append(node)
+    neighbor_sets = [set(node_neighbors) for node_neighbors in neighbors]
+
+    found = []
+    image = [None] * num_nodes
+    used = [False] * num_nodes
+
+    # map order[position] to a node that keeps every road to an already mapped node
+    def extend(position):
+        if position == num_nodes:
+            found.append(tuple(image))
+            return
+        node = order[position]
+        parent = parents[position]
+        candidates = range(num_nodes) if parent is None else neighbors[image[parent]]
+        for candidate in candidates:
+            if used[candidate] or len(neighbors[candidate]) != len(neighbors[node]):
+                continue
+            if all(image[neighbor] is None or image[neighbor] in neighbor_sets[candidate]
+                   for neighbor in neighbors[node]):
+                image[node] = candidate
+                used[candidate] = True
+                extend(position + 1)
+                image[node] = None
+                used[candidate] = False
+
+    extend(0)
+
+    hex_at = {frozenset(nodes): hex_index for hex_index, nodes in enumerate(topology.hex_nodes)}
+    found_symmetries = []
+    for node_perm in found:
+        hexes = [hex_at.get(frozenset(node_perm[node] for node in nodes)) for nodes in topology.hex_nodes]
+        if None not in hexes:
+            found_symmetries.append(Symmetry(tuple(hexes), node_perm))
+    # the identity first
+    found_symmetries.sort(key=lambda symmetry: symmetry.node_perm != tuple(range(num_nodes)))
+    return tuple(found_symmetries)
+
+
+class CanonicalBoard:
+    """A board turned into its canonical form. symmetry takes the board to
+    the canonical one, so a node of the board is symmetry.node_perm[node] there"""
+    def __init__(self, key, layout, roll_nums, symmetry):
+        self.key = key
+        self.layout = layout
+        self.roll_nums = roll_nums
+        self.symmetry = symmetry
+
+    # per node values worked out on the canonical board, in the board's own node order
+    def node_values(self, canonical_values):
+        return [canonical_values[image] for image in self.symmetry.node_perm]
+
+
+# the canonical form of a layout (a HexType per hex) and its numbers (None for the CACTUS tile)
+def canonical_board(layout, roll_nums, topology=STANDARD_TOPOLOGY):
+    # a byte per hex, the type in the high bits and the number (0 for the CACTUS tile) in the low ones
+    hex_values = bytes(TYPE_CODES[hex_type] << 4 | (roll_num or 0) for hex_type, roll_num in zip(layout, roll_nums))
+    best, best_symmetry = None, None
+    for symmetry in symmetries(topology):
+        image = bytes([hex_values[source] for source in symmetry.hex_sources])
+        if best is None or image < best:
+            best, best_symmetry = image, symmetry
+    hex_types = list(HexType)
+    return CanonicalBoard(best.hex(), [hex_types[value >> 4] for value in best],
+                          [value & 15 or None for value in best], best_symmetry)
+
+
+# the key shared by every board that is a turn or flip of this one
+def canonical_key(layout, roll_nums, topology=STANDARD_TOPOLOGY):
+    return canonical_board(layout, roll_nums, topology).key
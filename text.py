@@ -15,7 +15,7 @@ class Text:
 
     # re-render the text (for when it changes)
     def render(self):
-        self.surface = font.render(self.text, True, self.color)
+        self.surface = self.font.render(self.text, True, self.color)
 
     def draw(self, screen):
         screen.blit(self.surface, self.rect)
@@ -0,0 +1,262 @@
+"""Self-play tournament between bot policies, spread over every CPU core.
+
+Each game is played through rules.Rules by a lineup of policies; lineups
+rotate so every policy plays every seat equally often. Games are farmed out
+to a process pool and results come back in game order as they finish, to
+keep running win rates, Elo ratings and per-seat statistics. Every game's
+layout, dice and policy choices come from a seed derived from the
+tournament seed and the game's number, so a tournament (or any one game of
+it) plays out the same every time, and a checkpoint written every so often
+lets an interrupted tournament carry on where it stopped.
+
+usage: python tournament.py random greedy settler --games 10000 --players 4"""
+import json
+import multiprocessing
+import os
+import random
+
+from itertools import permutations
+from time import perf_counter
+
+from board_generator import BoardGenerator
+from board_topology import topology_for_players
+from opening import node_scores
+from rules import BUILD_CITY, BUILD_ROAD, BUILD_SETTLEMENT, END_TURN, ROAD, SETTLE, GameState, Rules
+
+WINNING_POINTS = 10
+# a policy may keep building on its turn, but not forever
+MAX_MOVES_PER_TURN = 20
+INITIAL_RATING = 1500
+ELO_K = 16
+
+
+# policies: given the rules (cur_player is the policy's player), the legal
+# moves and the game's rng, pick a move. module level so worker processes can find them
+
+def node_score(rules, node):
+    board = rules.hex_board
+    return node_scores(board.hex_types, board.roll_nums, board.topology)[node]
+
+
+def random_policy(rules, moves, rng):
+    return rng.choice(moves)
+
+
+# the best spots by opening score; builds cities first, then settlements, then roads
+def greedy_policy(rules, moves, rng):
+    return preferred_move(rules, moves, rng, (BUILD_CITY, BUILD_SETTLEMENT, BUILD_ROAD))
+
+
+# the same, but spreads out with settlements before upgrading to cities
+def settler_policy(rules, moves, rng):
+    return preferred_move(rules, moves, rng, (BUILD_SETTLEMENT, BUILD_ROAD, BUILD_CITY))
+
+
+def preferred_move(rules, moves, rng, build_order):
+    kind = moves[0][0]
+    if kind == SETTLE:
+        return max(moves, key=lambda move: node_score(rules, move[1]))
+    if kind == ROAD:
+        return rng.choice(moves)
+    for build in build_order:
+        choices = [move for move in moves if move[0] == build]
+        if choices:
+            if build == BUILD_ROAD:
+                return rng.choice(choices)
+            return max(choices, key=lambda move: node_score(rules, move[1]))
+    return END_TURN,
+
+
+POLICIES = {'random': random_policy, 'greedy': greedy_policy, 'settler': settler_policy}
+
+
+# the seed of one game of a tournament. str seeds hash the same in every process
+def game_seed(seed, game_index):
+    return '{}:{}'.format(seed, game_index)
+
+
+# play one game; lineup is a policy name per seat.
+# returns (game_index, lineup, winning seat or -1, turns, points per seat)
+def play_game(game_index, seed, lineup, max_turns):
+    rng = random.Random(game_seed(seed, game_index))
+    # a small batch: a few fair boards are plenty for one game
+    generator = BoardGenerator(seed=rng.getrandbits(64), batch_size=512, topology=topology_for_players(len(lineup)))
+    layout, roll_nums = generator.next_board()
+    rules = Rules(len(lineup), True, layout, roll_nums, dice_seed=rng.getrandbits(63))
+    for name in lineup:
+        rules.add_player()
+    rules.start()
+    policies = [POLICIES[name] for name in lineup]
+
+    def play(move):
+        rules.apply(move)
+        rules.undo_stack.clear()
+
+    while rules.state is GameState.SETTLEMENT_SETUP:
+        play(policies[rules.cur_player.seat](rules, rules.legal_moves(), rng))
+
+    winner = -1
+    turn = 0
+    while turn < max_turns:
+        player = rules.cur_player
+        play(rules.roll_dice())
+        for i in range(MAX_MOVES_PER_TURN):
+            move = policies[player.seat](rules, rules.legal_moves(), rng)
+            if move[0] == END_TURN:
+                break
+            play(move)
+        if rules.victory_points(player) >= WINNING_POINTS:
+            winner = player.seat
+            break
+        play((END_TURN,))
+        turn += 1
+    return game_index, lineup, winner, turn, [rules.victory_points(player) for player in rules.players]
+
+
+def play_game_spec(spec):
+    return play_game(*spec)
+
+
+class Standings:
+    """Running results of a tournament: everything a checkpoint holds"""
+    def __init__(self, policies, num_players):
+        self.policies = policies
+        self.num_players = num_players
+        self.games_played = 0
+        self.ratings = {name: INITIAL_RATING for name in policies}
+        self.games = {name: 0 for name in policies}
+        self.wins = {name: 0 for name in policies}
+        self.unfinished = 0
+        self.total_turns = 0
+        # per seat: games won from that seat, and each policy's games / wins there
+        self.seat_wins = [0] * num_players
+        self.seat_points = [0] * num_players  # victory points at the end, summed
+        self.seat_games = [{name: 0 for name in policies} for seat in range(num_players)]
+        self.seat_policy_wins = [{name: 0 for name in policies} for seat in range(num_players)]
+
+    def record(self, lineup, winner, turns, points):
+        self.games_played += 1
+        self.total_turns += turns
+        for seat, name in enumerate(lineup):
+            self.games[name] += 1
+            self.seat_games[seat][name] += 1
+            self.seat_points[seat] += points[seat]
+        if winner < 0:
+            self.unfinished += 1
+        else:
+            self.wins[lineup[winner]] += 1
+            self.seat_wins[winner] += 1
+            self.seat_policy_wins[winner][lineup[winner]] += 1
+        self.update_ratings(lineup, winner)
+
+    # a multiplayer game counts as one pairing of every two seats: the winner
+    # beat each of the others, and everyone else drew (as does everyone in an
+    # unfinished game). repeats of a policy in a lineup don't play themselves
+    def update_ratings(self, lineup, winner):
+        changes = {name: 0.0 for name in lineup}
+        k = ELO_K / (len(lineup) - 1)
+        for first, second in permutations(range(len(lineup)), 2):
+            name, other = lineup[first], lineup[second]
+            if name == other:
+                continue
+            expected = 1 / (1 + 10 ** ((self.ratings[other] - self.ratings[name]) / 400))
+            score = 1.0 if first == winner else 0.0 if second == winner else 0.5
+            changes[name] += k * (score - expected)
+        for name, change in changes.items():
+            self.ratings[name] += change
+
+    def win_rate(self, name):
+        return self.wins[name] / self.games[name] if self.games[name] else 0.0
+
+    def save(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as checkpoint:
+            json.dump(self.__dict__, checkpoint)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as checkpoint:
+            fields = json.load(checkpoint)
+        standings = cls(fields['policies'], fields['num_players'])
+        standings.__dict__.update(fields)
+        return standings
+
+    def report(self):
+        lines = ['{} games, {} unfinished, {:.1f} turns on average'.format(
+            self.games_played, self.unfinished, self.total_turns / max(self.games_played, 1))]
+        for name in sorted(self.policies, key=lambda name: -self.ratings[name]):
+            lines.append('  {:<10} elo {:7.1f}   won {:6} / {:6} ({:.3f})'.format(
+                name, self.ratings[name], self.wins[name], self.games[name], self.win_rate(name)))
+        for seat in range(self.num_players):
+            seat_games = sum(self.seat_games[seat].values())
+            lines.append('  seat {}     won {:.3f}  points {:4.1f}   '.format(
+                seat, self.seat_wins[seat] / max(seat_games, 1), self.seat_points[seat] / max(seat_games, 1)) +
+                         '  '.join('{} {:.3f}'.format(name, self.seat_policy_wins[seat][name] /
+                                                     max(self.seat_games[seat][name], 1))
+                                   for name in self.policies))
+        return '\n'.join(lines)
+
+
+# game game_index's lineup: the policies repeated to fill the seats, rotated one
+# seat per game so each policy plays each seat equally often
+def lineup_for(policies, num_players, game_index):
+    return tuple(policies[(seat + game_index) % len(policies)] for seat in range(num_players))
+
+
+def run_tournament(policies, num_players, num_games, seed=0, max_turns=400, workers=None,
+                   checkpoint_path=None, checkpoint_every=1000, progress=None):
+    standings = None
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        standings = Standings.load(checkpoint_path)
+        if standings.policies != list(policies) or standings.num_players != num_players:
+            raise ValueError('checkpoint {} is for another tournament'.format(checkpoint_path))
+    if standings is None:
+        standings = Standings(list(policies), num_players)
+
+    specs = [(game_index, seed, lineup_for(policies, num_players, game_index), max_turns)
+             for game_index in range(standings.games_played, num_games)]
+    workers = workers or os.cpu_count()
+    # results come back in game order, so ratings are updated in the same order however the
+    # games were spread over the workers, and a checkpoint covers a prefix of the games
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        for game_index, lineup, winner, turns, points in pool.imap(
+                play_game_spec, specs, chunksize=max(1, min(64, len(specs) // (workers * 8)))):
+            standings.record(lineup, winner, turns, points)
+            if checkpoint_path is not None and standings.games_played % checkpoint_every == 0:
+                standings.save(checkpoint_path)
+            if progress is not None:
+                progress(standings)
+    if checkpoint_path is not None:
+        standings.save(checkpoint_path)
+    return standings
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play bot policies against each other')
+    parser.add_argument('policies', nargs='+', choices=sorted(POLICIES))
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--players', type=int, default=4, help='seats per game')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-turns', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=None, help='processes to play in (default: one per core)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='save standings here as games finish, and resume from it if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help='games between checkpoints')
+    parser.add_argument('--results', default=None, help='write the final standings here as json')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    standings = run_tournament(args.policies, args.players, args.games, args.seed, args.max_turns,
+                               args.workers, args.checkpoint, args.checkpoint_every)
+    elapsed = perf_counter() - start
+    print(standings.report())
+    print('{:.2f} s ({} workers)'.format(elapsed, args.workers or os.cpu_count()))
+    if args.results is not None:
+        standings.save(args.results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import random
+
+from collections import OrderedDict
+
+# Zobrist hashing: every piece of position state (a node's owner, a road's
+# owner, a city, the robber's hex, whose turn it is, the game state, each
+# player's count of each resource) gets a random 64 bit key, and a position's
+# hash is the xor of the keys of everything in it. Changing one thing is one
+# or two xors, so the hash is kept up to date as the game is played instead
+# of being computed from scratch.
+#
+# Keys come from a fixed seed so that hashes agree across processes.
+
+MAX_PLAYERS = 6
+NUM_STATES = 10  # see rules.GameState
+NUM_RESOURCES = 5
+# resource counts beyond this share keys (count % MAX_COUNT); the bank only has 19 of each
+MAX_COUNT = 64
+SEED = 0x5eed
+
+
+class ZobristKeys:
+    """The random keys for every piece of state on boards of one topology"""
+    def __init__(self, topology, seed=SEED):
+        rng = random.Random(seed)
+
+        def keys(count):
+            return [rng.getrandbits(64) for i in range(count)]
+
+        self.node_owner = [keys(MAX_PLAYERS) for i in range(topology.num_nodes)]
+        self.city = keys(topology.num_nodes)
+        self.road_owner = [keys(MAX_PLAYERS) for i in range(topology.num_roads)]
+        self.robber = keys(topology.num_hexes)
+        # one more than the number of seats: nobody's turn
+        self.cur_player = keys(MAX_PLAYERS + 1)
+        self.state = keys(NUM_STATES)
+        self.resources = [[keys(MAX_COUNT) for resource in range(NUM_RESOURCES)]
+                          for seat in range(MAX_PLAYERS)]
+
+    # the hash of one player holding the given resource counts
+    def resources_hash(self, seat, counts):
+        keys = self.resources[seat]
+        value = 0
+        for resource, count in enumerate(counts):
+            value ^= keys[resource][count % MAX_COUNT]
+        return value
+
+
+# one set of keys per topology, shared by every board built on it
+keys_by_topology = {}
+
+
+def keys_for(topology):
+    try:
+        return keys_by_topology[topology]
+    except KeyError:
+        keys = keys_by_topology[topology] = ZobristKeys(topology)
+        return keys
+
+
+class TranspositionCache:
+    """A bounded map from position hash to whatever a search stored for that
+    position (a value, a best move, ...). The least recently used entries are
+    dropped once it is full. One instance can be shared by several searchers"""
+    def __init__(self, max_entries=1 << 16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, position_hash, default=None):
+        try:
+            value = self.entries[position_hash]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(position_hash)
+        self.hits += 1
+        return value
+
+    def put(self, position_hash, value):
+        entries = self.entries
+        entries[position_hash] = value
+        entries.move_to_end(position_hash)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0